@@ -0,0 +1,41 @@
+"""Add shard directory and profile id sequences
+
+Revision ID: 4e8a1c7f2b93
+Revises: b2f4c6d81e90
+Create Date: 2026-10-19 14:05:31.804127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e8a1c7f2b93'
+down_revision: Union[str, None] = 'b2f4c6d81e90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('shard_directory',
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('profile_id', sa.Integer(), nullable=False),
+    sa.Column('region', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('kind', 'profile_id')
+    )
+    op.create_index(op.f('ix_shard_directory_user_id'), 'shard_directory', ['user_id'], unique=False)
+    op.create_table('shard_sequences',
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('next_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('shard_sequences')
+    op.drop_index(op.f('ix_shard_directory_user_id'), table_name='shard_directory')
+    op.drop_table('shard_directory')
@@ -0,0 +1,69 @@
+"""Add created/updated timestamps and analytics rollup tables
+
+Revision ID: 7c3e91a2d4b5
+Revises: 1451b71664c0
+Create Date: 2026-10-19 09:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3e91a2d4b5'
+down_revision: Union[str, None] = '1451b71664c0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TIMESTAMPED_TABLES = ['users', 'farmer_details', 'landlord_details', 'spaces', 'crops']
+
+# (metric, table, dimension expression, value expression) used to backfill the rollups
+ROLLUP_SOURCES = [
+    ('registrations', 'users', "COALESCE(role, '')", 'COUNT(*)'),
+    ('farmer_capacity', 'farmer_details', "''", 'COALESCE(SUM(land_handling_capacity), 0)'),
+    ('landlord_acres', 'landlord_details', "''", 'COALESCE(SUM(acres), 0)'),
+    ('spaces', 'spaces', "''", 'COUNT(*)'),
+    ('crops', 'crops', 'crop_name', 'COUNT(*)'),
+]
+
+
+def upgrade() -> None:
+    for table in TIMESTAMPED_TABLES:
+        op.add_column(table, sa.Column('created_at', sa.DateTime(), nullable=True))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.create_index(op.f(f'ix_{table}_created_at'), table, ['created_at'], unique=False)
+        # Existing rows have no history; date them at migration time
+        op.execute(f"UPDATE {table} SET created_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+
+    for table in ['daily_rollups', 'monthly_rollups']:
+        op.create_table(table,
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.Date(), nullable=False),
+        sa.Column('metric', sa.String(), nullable=False),
+        sa.Column('dimension', sa.String(), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('metric', 'bucket', 'dimension', name=f'uq_{table}_bucket')
+        )
+        op.create_index(op.f(f'ix_{table}_id'), table, ['id'], unique=False)
+
+    for metric, table, dimension, value in ROLLUP_SOURCES:
+        for rollup, bucket in [('daily_rollups', 'date(created_at)'), ('monthly_rollups', "strftime('%Y-%m-01', created_at)")]:
+            op.execute(
+                f"INSERT INTO {rollup} (bucket, metric, dimension, value) "
+                f"SELECT {bucket}, '{metric}', {dimension}, {value} FROM {table} "
+                f"WHERE created_at IS NOT NULL GROUP BY {bucket}, {dimension}"
+            )
+
+
+def downgrade() -> None:
+    for table in ['monthly_rollups', 'daily_rollups']:
+        op.drop_index(op.f(f'ix_{table}_id'), table_name=table)
+        op.drop_table(table)
+    for table in reversed(TIMESTAMPED_TABLES):
+        op.drop_index(op.f(f'ix_{table}_created_at'), table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
+            batch_op.drop_column('created_at')
@@ -0,0 +1,113 @@
+"""Move crop steps into shared, versioned crop templates
+
+Revision ID: 9d2b6e4f1a37
+Revises: 4e8a1c7f2b93
+Create Date: 2026-10-19 15:22:48.116530
+
+"""
+import hashlib
+import json
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d2b6e4f1a37'
+down_revision: Union[str, None] = '4e8a1c7f2b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STATE_KEYS = ('status', 'proofs', 'proof_count')
+
+
+def _load(value):
+    return json.loads(value) if isinstance(value, str) else (value or [])
+
+
+def upgrade() -> None:
+    op.create_table('crop_templates',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('crop_name', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('duration', sa.String(), nullable=False),
+    sa.Column('steps', sa.JSON(), nullable=False),
+    sa.Column('checksum', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('crop_name', 'version')
+    )
+    op.create_index(op.f('ix_crop_templates_id'), 'crop_templates', ['id'], unique=False)
+    op.create_index(op.f('ix_crop_templates_checksum'), 'crop_templates', ['checksum'], unique=False)
+    with op.batch_alter_table('crops') as batch_op:
+        batch_op.add_column(sa.Column('template_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('step_state', sa.JSON(), nullable=True))
+        batch_op.create_foreign_key('fk_crops_template_id', 'crop_templates', ['template_id'], ['id'])
+        batch_op.create_index(op.f('ix_crops_template_id'), ['template_id'], unique=False)
+    op.create_index(op.f('ix_proofs_crop_id'), 'proofs', ['crop_id'], unique=False)
+
+    # One template per distinct (crop name, duration, plan); progress and proof URLs move off the plan
+    bind = op.get_bind()
+    templates = {}
+    versions = {}
+    for crop_id, crop_name, duration, steps in bind.execute(sa.text('SELECT id, crop_name, duration, steps FROM crops ORDER BY id')).fetchall():
+        steps = [step for step in _load(steps) if isinstance(step, dict)]
+        definitions = [{key: value for key, value in step.items() if key not in STATE_KEYS} for step in steps]
+        checksum = hashlib.sha256(json.dumps(definitions, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+        if (crop_name, duration, checksum) not in templates:
+            versions[crop_name] = versions.get(crop_name, 0) + 1
+            result = bind.execute(
+                sa.text('INSERT INTO crop_templates (crop_name, version, duration, steps, checksum, created_at) '
+                        'VALUES (:crop_name, :version, :duration, :steps, :checksum, CURRENT_TIMESTAMP)'),
+                {'crop_name': crop_name, 'version': versions[crop_name], 'duration': duration,
+                 'steps': json.dumps(definitions), 'checksum': checksum},
+            )
+            templates[(crop_name, duration, checksum)] = result.lastrowid
+
+        step_state = []
+        for step_index, step in enumerate(steps):
+            urls = step.get('proofs') or []
+            for url in urls:
+                bind.execute(
+                    sa.text('INSERT INTO proofs (file_url, crop_id, step_index) SELECT :url, :crop_id, :step_index '
+                            'WHERE NOT EXISTS (SELECT 1 FROM proofs WHERE crop_id = :crop_id AND step_index = :step_index AND file_url = :url)'),
+                    {'url': url, 'crop_id': crop_id, 'step_index': step_index},
+                )
+            step_state.append({'status': step.get('status', 'pending'), 'proof_count': len(urls)})
+        bind.execute(
+            sa.text('UPDATE crops SET template_id = :template_id, step_state = :step_state WHERE id = :id'),
+            {'template_id': templates[(crop_name, duration, checksum)], 'step_state': json.dumps(step_state), 'id': crop_id},
+        )
+
+    with op.batch_alter_table('crops') as batch_op:
+        batch_op.drop_column('steps')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('crops') as batch_op:
+        batch_op.add_column(sa.Column('steps', sa.JSON(), nullable=True))
+
+    # Write each crop's plan, status and proof URLs back into its own steps
+    bind = op.get_bind()
+    template_steps = dict(bind.execute(sa.text('SELECT id, steps FROM crop_templates')).fetchall())
+    proofs = {}
+    for crop_id, step_index, file_url in bind.execute(sa.text('SELECT crop_id, step_index, file_url FROM proofs ORDER BY id')).fetchall():
+        proofs.setdefault((crop_id, step_index), []).append(file_url)
+    for crop_id, template_id, step_state in bind.execute(sa.text('SELECT id, template_id, step_state FROM crops')).fetchall():
+        step_state = _load(step_state)
+        steps = []
+        for step_index, definition in enumerate(_load(template_steps.get(template_id))):
+            state = step_state[step_index] if step_index < len(step_state) else {}
+            steps.append({**definition, 'status': state.get('status', 'pending'), 'proofs': proofs.get((crop_id, step_index), [])})
+        bind.execute(sa.text('UPDATE crops SET steps = :steps WHERE id = :id'), {'steps': json.dumps(steps), 'id': crop_id})
+
+    op.drop_index(op.f('ix_proofs_crop_id'), table_name='proofs')
+    with op.batch_alter_table('crops') as batch_op:
+        batch_op.drop_index(op.f('ix_crops_template_id'))
+        batch_op.drop_constraint('fk_crops_template_id', type_='foreignkey')
+        batch_op.drop_column('step_state')
+        batch_op.drop_column('template_id')
+    op.drop_index(op.f('ix_crop_templates_checksum'), table_name='crop_templates')
+    op.drop_index(op.f('ix_crop_templates_id'), table_name='crop_templates')
+    op.drop_table('crop_templates')
@@ -0,0 +1,62 @@
+"""Add row versions, sync clock and tombstones for delta sync
+
+Revision ID: c5a7d2e9b814
+Revises: e6c1f83a0d52
+Create Date: 2026-10-19 19:05:37.204118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a7d2e9b814'
+down_revision: Union[str, None] = 'e6c1f83a0d52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VERSIONED_TABLES = ('farmer_details', 'landlord_details', 'spaces', 'crops', 'proofs', 'crop_templates')
+
+
+def upgrade() -> None:
+    op.create_table('sync_clock',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('sync_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('row_version', sa.Integer(), nullable=False),
+    sa.Column('farmer_id', sa.Integer(), nullable=True),
+    sa.Column('landlord_id', sa.Integer(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sync_tombstones_id'), 'sync_tombstones', ['id'], unique=False)
+    op.create_index(op.f('ix_sync_tombstones_row_version'), 'sync_tombstones', ['row_version'], unique=False)
+    op.create_index(op.f('ix_sync_tombstones_farmer_id'), 'sync_tombstones', ['farmer_id'], unique=False)
+    op.create_index(op.f('ix_sync_tombstones_landlord_id'), 'sync_tombstones', ['landlord_id'], unique=False)
+
+    # Existing rows get version 0, which only a full sync returns
+    for table in VERSIONED_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('row_version', sa.Integer(), nullable=True, server_default='0'))
+            batch_op.create_index(op.f(f'ix_{table}_row_version'), ['row_version'], unique=False)
+    op.execute("INSERT INTO sync_clock (id, version) VALUES (1, 0)")
+
+
+def downgrade() -> None:
+    for table in VERSIONED_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_index(op.f(f'ix_{table}_row_version'))
+            batch_op.drop_column('row_version')
+    op.drop_index(op.f('ix_sync_tombstones_landlord_id'), table_name='sync_tombstones')
+    op.drop_index(op.f('ix_sync_tombstones_farmer_id'), table_name='sync_tombstones')
+    op.drop_index(op.f('ix_sync_tombstones_row_version'), table_name='sync_tombstones')
+    op.drop_index(op.f('ix_sync_tombstones_id'), table_name='sync_tombstones')
+    op.drop_table('sync_tombstones')
+    op.drop_table('sync_clock')
@@ -0,0 +1,46 @@
+"""Track crop completion so archival can select finished spaces in SQL
+
+Revision ID: f3b8d1a6c2e7
+Revises: c5a7d2e9b814
+Create Date: 2026-10-19 20:12:44.508311
+
+"""
+import json
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d1a6c2e7'
+down_revision: Union[str, None] = 'c5a7d2e9b814'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _load(value):
+    return json.loads(value) if isinstance(value, str) else (value or [])
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('crops') as batch_op:
+        batch_op.add_column(sa.Column('completed_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_crops_space_id_completed_at', ['space_id', 'completed_at'], unique=False)
+
+    # Crops whose steps are all completed already
+    bind = op.get_bind()
+    for crop_id, step_state, updated_at in bind.execute(sa.text('SELECT id, step_state, updated_at FROM crops')).fetchall():
+        states = [state for state in _load(step_state) if isinstance(state, dict)]
+        if states and all(state.get('status') == 'completed' for state in states):
+            bind.execute(
+                sa.text('UPDATE crops SET completed_at = :completed_at WHERE id = :id'),
+                {'completed_at': updated_at or datetime.utcnow(), 'id': crop_id},
+            )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('crops') as batch_op:
+        batch_op.drop_index('ix_crops_space_id_completed_at')
+        batch_op.drop_column('completed_at')
@@ -0,0 +1,389 @@
+"""
+Batch allocation of unassigned land to farmers with spare capacity.
+
+Every landlord without a space is a candidate. Every farmer whose
+`land_handling_capacity` is not used up by existing spaces is a candidate
+too. Both are loaded into compact parallel arrays. Whole landlord plots are
+then assigned so that a farmer's total acres never exceed their capacity:
+
+1. Best-fit decreasing: plots are taken largest first. Each plot goes to the
+   farmer with the smallest spare capacity that still fits it. The farmer is
+   looked for among those who list the plot's location, then among those who
+   prefer the same region.
+2. Local search: for a plot that is still unassigned, we look for a farmer
+   holding a smaller plot from this run that could move to another farmer.
+   If one exists, the smaller plot moves and the freed capacity takes the
+   larger plot.
+
+Farmers record no soil preference, so fit is judged on location alone.
+Everything runs over sorted per-location candidate lists, which keeps a
+run over 100k profiles within seconds.
+
+Usage (from the backend directory):
+    python allocation.py             # Report the proposal only
+    python allocation.py --commit    # Create the proposed spaces
+"""
+import argparse
+import bisect
+import logging
+import threading
+import time
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, FarmerDetails, LandlordDetails, Space
+from sharding import REGION_MAP, gather
+
+logger = logging.getLogger(__name__)
+
+ALLOCATION_SWAP_CANDIDATES = 8  # Farmers examined per unassigned plot during local search
+ALLOCATION_DESCRIPTION = "Created by the land allocation optimizer"
+ALLOCATION_CHUNK_SIZE = 500  # Ids per IN query when re-checking plots before commit
+
+# Match quality, best first
+EXACT_LOCATION = "location"
+SAME_REGION = "region"
+
+_run_lock = threading.Lock()  # One run at a time per process, so runs cannot propose the same plots
+
+
+def _normalize(location: Optional[str]) -> str:
+    return " ".join((location or "").lower().replace(",", " ").split())
+
+
+class AllocationPool:
+    """Unassigned farmers and landlords as parallel arrays, indexed from 0."""
+
+    def __init__(self):
+        self.location_codes: Dict[str, int] = {}
+        self.region_codes: Dict[str, int] = {}
+        self._regions: Dict[str, int] = {}
+
+        self.farmer_ids = array("q")
+        self.farmer_user_ids = array("q")
+        self.remaining = array("q")  # Spare capacity in acres
+        self.farmer_locations: List[Tuple[int, ...]] = []
+        self.farmer_regions: List[Tuple[int, ...]] = []
+
+        self.landlord_ids = array("q")
+        self.landlord_user_ids = array("q")
+        self.acres = array("q")
+        self.landlord_location = array("q")
+        self.landlord_region = array("q")
+
+        self.totals = {"land_acres": 0, "allocated_acres": 0, "capacity": 0, "used_capacity": 0}
+
+    def location_code(self, location: Optional[str]) -> int:
+        key = _normalize(location)
+        if not key:
+            return -1
+        return self.location_codes.setdefault(key, len(self.location_codes))
+
+    def region_code(self, location: Optional[str]) -> int:
+        key = _normalize(location)
+        if key not in self._regions:
+            region = next((region for keyword, region in REGION_MAP.items() if keyword.lower() in key), None) if key else None
+            self._regions[key] = -1 if region is None else self.region_codes.setdefault(region, len(self.region_codes))
+        return self._regions[key]
+
+    def add_farmer(self, farmer_id: int, user_id: Optional[int], spare: int, locations) -> None:
+        self.farmer_ids.append(farmer_id)
+        self.farmer_user_ids.append(user_id or 0)
+        self.remaining.append(spare)
+        codes = {self.location_code(location) for location in locations or []} - {-1}
+        regions = {self.region_code(location) for location in locations or []} - {-1}
+        self.farmer_locations.append(tuple(codes))
+        self.farmer_regions.append(tuple(regions))
+
+    def add_landlord(self, landlord_id: int, user_id: Optional[int], acres: int, location: Optional[str]) -> None:
+        self.landlord_ids.append(landlord_id)
+        self.landlord_user_ids.append(user_id or 0)
+        self.acres.append(acres)
+        self.landlord_location.append(self.location_code(location))
+        self.landlord_region.append(self.region_code(location))
+
+
+def load_pool(db: Session) -> AllocationPool:
+    """Load every landlord without a space and every farmer with spare capacity (across shards)."""
+    taken_landlords = set()
+    farmer_landlords = defaultdict(list)
+    for farmer_id, landlord_id in db.query(Space.farmer_id, Space.landlord_id).yield_per(10000):
+        taken_landlords.add(landlord_id)
+        farmer_landlords[farmer_id].append(landlord_id)
+
+    landlord_rows = [
+        row for rows in gather(db, lambda session: session.query(
+            LandlordDetails.id, LandlordDetails.user_id, LandlordDetails.acres, LandlordDetails.location
+        ).all()) for row in rows
+    ]
+    farmer_rows = [
+        row for rows in gather(db, lambda session: session.query(
+            FarmerDetails.id, FarmerDetails.user_id, FarmerDetails.land_handling_capacity, FarmerDetails.preferred_locations
+        ).all()) for row in rows
+    ]
+
+    pool = AllocationPool()
+    landlord_acres = {}
+    for landlord_id, user_id, acres, location in landlord_rows:
+        acres = acres or 0
+        landlord_acres[landlord_id] = acres
+        pool.totals["land_acres"] += acres
+        if landlord_id in taken_landlords:
+            pool.totals["allocated_acres"] += acres
+        elif acres > 0:
+            pool.add_landlord(landlord_id, user_id, acres, location)
+
+    for farmer_id, user_id, capacity, locations in farmer_rows:
+        capacity = capacity or 0
+        used = sum(landlord_acres.get(landlord_id, 0) for landlord_id in farmer_landlords.get(farmer_id, ()))
+        pool.totals["capacity"] += capacity
+        pool.totals["used_capacity"] += min(used, capacity)
+        if capacity > used:
+            pool.add_farmer(farmer_id, user_id, capacity - used, locations)
+    return pool
+
+
+class _CandidateLists:
+    """
+    Farmers per location (or region), bucketed by spare capacity.
+
+    Each key keeps the sorted distinct spare capacities present and the set
+    of farmers at each, so lookups and updates bisect over distinct acre
+    values rather than over farmers.
+    """
+
+    def __init__(self, remaining: array, keys_of: List[Tuple[int, ...]]):
+        self.keys_of = keys_of
+        self.values: Dict[int, list] = defaultdict(list)
+        self.buckets: Dict[int, Dict[int, set]] = defaultdict(dict)
+        for farmer, keys in enumerate(keys_of):
+            for key in keys:
+                self._add(key, remaining[farmer], farmer)
+
+    def _add(self, key: int, value: int, farmer: int) -> None:
+        bucket = self.buckets[key].get(value)
+        if bucket is None:
+            bucket = self.buckets[key][value] = set()
+            bisect.insort(self.values[key], value)
+        bucket.add(farmer)
+
+    def _remove(self, key: int, value: int, farmer: int) -> None:
+        buckets = self.buckets[key]
+        buckets[value].discard(farmer)
+        if not buckets[value]:
+            del buckets[value]
+            values = self.values[key]
+            del values[bisect.bisect_left(values, value)]
+
+    def move(self, farmer: int, old: int, new: int) -> None:
+        """Re-index a farmer whose spare capacity changed from `old` to `new`."""
+        for key in self.keys_of[farmer]:
+            self._remove(key, old, farmer)
+            self._add(key, new, farmer)
+
+    def best_fit(self, key: int, acres: int, exclude: int = -1) -> int:
+        """The farmer with the smallest spare capacity >= `acres`, or -1."""
+        values = self.values.get(key)
+        if not values:
+            return -1
+        buckets = self.buckets[key]
+        for index in range(bisect.bisect_left(values, acres), len(values)):
+            for farmer in buckets[values[index]]:
+                if farmer != exclude:
+                    return farmer
+        return -1
+
+    def largest(self, key: int, count: int) -> List[int]:
+        """Up to `count` farmers with the most spare capacity (fully booked ones included)."""
+        found = []
+        if count <= 0:
+            return found
+        buckets = self.buckets.get(key, {})
+        for value in reversed(self.values.get(key, [])):
+            for farmer in buckets[value]:
+                found.append(farmer)
+                if len(found) == count:
+                    return found
+        return found
+
+
+def allocate(pool: AllocationPool, swap_candidates: int = ALLOCATION_SWAP_CANDIDATES) -> Dict[int, Tuple[int, str]]:
+    """
+    Assign plots to farmers.
+
+    Returns:
+        dict: landlord index -> (farmer index, match quality).
+    """
+    by_location = _CandidateLists(pool.remaining, pool.farmer_locations)
+    by_region = _CandidateLists(pool.remaining, pool.farmer_regions)
+    assignment: Dict[int, Tuple[int, str]] = {}
+    farmer_plots: Dict[int, List[int]] = defaultdict(list)
+
+    def find(landlord: int, acres: int, exclude: int = -1) -> Tuple[int, str]:
+        farmer = -1
+        if pool.landlord_location[landlord] >= 0:
+            farmer = by_location.best_fit(pool.landlord_location[landlord], acres, exclude)
+        if farmer >= 0:
+            return farmer, EXACT_LOCATION
+        if pool.landlord_region[landlord] >= 0:
+            farmer = by_region.best_fit(pool.landlord_region[landlord], acres, exclude)
+        return farmer, SAME_REGION
+
+    def set_remaining(farmer: int, value: int) -> None:
+        old = pool.remaining[farmer]
+        pool.remaining[farmer] = value
+        by_location.move(farmer, old, value)
+        by_region.move(farmer, old, value)
+
+    def assign(landlord: int, farmer: int, match: str) -> None:
+        set_remaining(farmer, pool.remaining[farmer] - pool.acres[landlord])
+        assignment[landlord] = (farmer, match)
+        farmer_plots[farmer].append(landlord)
+
+    def release(landlord: int) -> None:
+        farmer, _ = assignment.pop(landlord)
+        set_remaining(farmer, pool.remaining[farmer] + pool.acres[landlord])
+        farmer_plots[farmer].remove(landlord)
+
+    # 1. Best-fit decreasing
+    order = sorted(range(len(pool.landlord_ids)), key=lambda landlord: -pool.acres[landlord])
+    for landlord in order:
+        farmer, match = find(landlord, pool.acres[landlord])
+        if farmer >= 0:
+            assign(landlord, farmer, match)
+
+    # 2. Local search: make room for unassigned plots by moving a smaller plot elsewhere
+    for landlord in order:
+        if landlord in assignment:
+            continue
+        acres = pool.acres[landlord]
+        candidates = []
+        if pool.landlord_location[landlord] >= 0:
+            candidates += [(farmer, EXACT_LOCATION) for farmer in by_location.largest(pool.landlord_location[landlord], swap_candidates)]
+        if pool.landlord_region[landlord] >= 0:
+            candidates += [(farmer, SAME_REGION) for farmer in by_region.largest(pool.landlord_region[landlord], swap_candidates)]
+        for farmer, match in candidates:
+            moved = False
+            for other in sorted(farmer_plots[farmer], key=lambda plot: pool.acres[plot]):
+                if pool.remaining[farmer] + pool.acres[other] < acres:
+                    continue
+                new_farmer, new_match = find(other, pool.acres[other], exclude=farmer)
+                if new_farmer < 0:
+                    continue
+                release(other)
+                assign(other, new_farmer, new_match)
+                assign(landlord, farmer, match)
+                moved = True
+                break
+            if moved:
+                break
+    return assignment
+
+
+def _utilization(part: int, whole: int) -> float:
+    return round(part / whole, 4) if whole else 0.0
+
+
+def run_allocation(db: Session, commit: bool = False, admin_id: Optional[int] = None) -> dict:
+    """
+    Propose (and optionally create) spaces for unassigned land.
+
+    Args:
+        db (Session): Database session (app.db).
+        commit (bool): Create the proposed spaces.
+        admin_id (int, optional): Recorded as the admin of created spaces (required with commit).
+
+    Returns:
+        dict: Proposed pairs, match counts and utilization before and after.
+    """
+    started = time.perf_counter()
+    with _run_lock:
+        pool = load_pool(db)
+        loaded = time.perf_counter()
+        assignment = allocate(pool)
+        solved = time.perf_counter()
+
+        pairs = [
+            {
+                "farmer_id": pool.farmer_ids[farmer],
+                "landlord_id": pool.landlord_ids[landlord],
+                "acres": pool.acres[landlord],
+                "match": match,
+                "farmer_user_id": pool.farmer_user_ids[farmer],
+                "landlord_user_id": pool.landlord_user_ids[landlord],
+            }
+            for landlord, (farmer, match) in sorted(assignment.items())
+        ]
+
+        if commit and pairs:
+            # Plots given a space since the pool was loaded are left alone
+            landlord_ids = [pair["landlord_id"] for pair in pairs]
+            taken = set()
+            for start in range(0, len(landlord_ids), ALLOCATION_CHUNK_SIZE):
+                chunk = landlord_ids[start:start + ALLOCATION_CHUNK_SIZE]
+                taken.update(landlord_id for (landlord_id,) in db.query(Space.landlord_id).filter(Space.landlord_id.in_(chunk)))
+            pairs = [pair for pair in pairs if pair["landlord_id"] not in taken]
+            spaces = [
+                Space(farmer_id=pair["farmer_id"], landlord_id=pair["landlord_id"], admin_id=admin_id,
+                      description=ALLOCATION_DESCRIPTION, progress={})
+                for pair in pairs
+            ]
+            db.add_all(spaces)
+            db.flush()
+            for pair, space in zip(pairs, spaces):
+                pair["space_id"] = space.id
+            db.commit()
+
+    allocated = sum(pair["acres"] for pair in pairs)
+    totals = pool.totals
+    report = {
+        "committed": bool(commit),
+        "landlords_considered": len(pool.landlord_ids),
+        "farmers_considered": len(pool.farmer_ids),
+        "proposed_spaces": len(pairs),
+        "acres_allocated": allocated,
+        "matches": {
+            EXACT_LOCATION: sum(1 for pair in pairs if pair["match"] == EXACT_LOCATION),
+            SAME_REGION: sum(1 for pair in pairs if pair["match"] == SAME_REGION),
+        },
+        "land_utilization": {
+            "before": _utilization(totals["allocated_acres"], totals["land_acres"]),
+            "after": _utilization(totals["allocated_acres"] + allocated, totals["land_acres"]),
+        },
+        "capacity_utilization": {
+            "before": _utilization(totals["used_capacity"], totals["capacity"]),
+            "after": _utilization(totals["used_capacity"] + allocated, totals["capacity"]),
+        },
+        "timings_ms": {
+            "load": round((loaded - started) * 1000, 1),
+            "solve": round((solved - loaded) * 1000, 1),
+            "total": round((time.perf_counter() - started) * 1000, 1),
+        },
+        "pairs": pairs,
+    }
+    logger.info(
+        "Allocation (commit=%s): %s spaces, %s acres, land utilization %s -> %s",
+        commit, len(pairs), allocated, report["land_utilization"]["before"], report["land_utilization"]["after"],
+    )
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Allocate unassigned land to farmers with spare capacity.")
+    parser.add_argument("--commit", action="store_true", help="Create the proposed spaces.")
+    parser.add_argument("--admin-id", type=int, help="Admin user recorded on created spaces (required with --commit).")
+    args = parser.parse_args()
+    if args.commit and args.admin_id is None:
+        parser.error("--admin-id is required with --commit")
+
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        result = run_allocation(session, commit=args.commit, admin_id=args.admin_id)
+    finally:
+        session.close()
+    result.pop("pairs")
+    print(result)
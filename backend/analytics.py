@@ -0,0 +1,176 @@
+"""
+Incrementally maintained daily and monthly rollups for admin analytics.
+
+Every flush that inserts users, profiles, spaces or crops adds its deltas to
+the matching day and month buckets in the same transaction, so `/analytics`
+answers a range query by reading one row per bucket instead of scanning the
+source tables. Rollups count rows as they are created; later deletes (for
+example archival) do not rewrite history.
+
+Each database keeps the rollups of the rows it stores: when profiles are
+sharded, a shard counts the profiles written to it, and `/analytics` adds the
+shards' buckets to app.db's with `merge_buckets`. Sessions opt out with
+`session.info[SKIP_ROLLUPS] = True` when rows only move between databases.
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, func, inspect, literal
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, User, FarmerDetails, LandlordDetails, Space, Crop, DailyRollup, MonthlyRollup
+
+# Metric name -> description, as exposed by /analytics
+METRICS = {
+    "registrations": "New users, by role",
+    "farmer_capacity": "Land handling capacity (acres) added by new farmers",
+    "landlord_acres": "Acres added by new landlords",
+    "spaces": "New collaboration spaces",
+    "crops": "New crops, by crop name",
+}
+
+# Metrics counted from profile rows, which live in the shards when profiles are sharded
+PROFILE_METRICS = ("farmer_capacity", "landlord_acres")
+
+GRANULARITIES = {"day": DailyRollup, "month": MonthlyRollup}
+SKIP_ROLLUPS = "analytics_skip_rollups"
+
+
+def month_bucket(day: date) -> date:
+    return day.replace(day=1)
+
+
+def row_deltas(obj) -> Optional[Tuple[str, str, int]]:
+    """Return `(metric, dimension, delta)` for a newly created row, or None if it is not tracked."""
+    if isinstance(obj, User):
+        return "registrations", obj.role or "", 1
+    if isinstance(obj, FarmerDetails):
+        return "farmer_capacity", "", obj.land_handling_capacity or 0
+    if isinstance(obj, LandlordDetails):
+        return "landlord_acres", "", obj.acres or 0
+    if isinstance(obj, Space):
+        return "spaces", "", 1
+    if isinstance(obj, Crop):
+        return "crops", obj.crop_name or "", 1
+    return None
+
+
+def _upsert(connection, model, bucket: date, metric: str, dimension: str, delta: int) -> None:
+    insert = postgresql_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(model.__table__).values(bucket=bucket, metric=metric, dimension=dimension, value=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["metric", "bucket", "dimension"],
+        set_={"value": model.__table__.c.value + stmt.excluded.value},
+    )
+    connection.execute(stmt)
+
+
+def apply_deltas(connection, deltas: Dict[Tuple[date, str, str], int]) -> None:
+    """Add aggregated `(day, metric, dimension) -> delta` values to both rollup tables."""
+    monthly: Dict[Tuple[date, str, str], int] = defaultdict(int)
+    for (day, metric, dimension), delta in deltas.items():
+        _upsert(connection, DailyRollup, day, metric, dimension, delta)
+        monthly[(month_bucket(day), metric, dimension)] += delta
+    for (month, metric, dimension), delta in monthly.items():
+        _upsert(connection, MonthlyRollup, month, metric, dimension, delta)
+
+
+def record_created(connection, objs) -> None:
+    """Add newly created rows to the rollups through `connection`."""
+    deltas: Dict[Tuple[date, str, str], int] = defaultdict(int)
+    for obj in objs:
+        tracked = row_deltas(obj)
+        if tracked is None:
+            continue
+        metric, dimension, delta = tracked
+        created = getattr(obj, "created_at", None) or datetime.utcnow()
+        deltas[(created.date(), metric, dimension)] += delta
+    if deltas:
+        apply_deltas(connection, deltas)
+
+
+def _update_rollups(session: Session, flush_context) -> None:
+    # session.new still lists the rows inserted by this flush
+    if not session.info.get(SKIP_ROLLUPS):
+        record_created(session.connection(), session.new)
+
+
+def watch(session_factory) -> None:
+    """Maintain the rollups of the database behind `session_factory` on every flush."""
+    event.listen(session_factory, "after_flush", _update_rollups)
+
+
+def rebuild(db: Session) -> None:
+    """Recompute every rollup from the source tables in `db` (for repairs and backfills)."""
+    db.query(DailyRollup).delete()
+    db.query(MonthlyRollup).delete()
+    sources = [
+        ("registrations", User, User.role, func.count(User.id)),
+        ("farmer_capacity", FarmerDetails, None, func.sum(FarmerDetails.land_handling_capacity)),
+        ("landlord_acres", LandlordDetails, None, func.sum(LandlordDetails.acres)),
+        ("spaces", Space, None, func.count(Space.id)),
+        ("crops", Crop, Crop.crop_name, func.count(Crop.id)),
+    ]
+    tables = set(inspect(db.connection()).get_table_names())
+    deltas: Dict[Tuple[date, str, str], int] = defaultdict(int)
+    for metric, model, dimension_column, aggregate in sources:
+        if model.__tablename__ not in tables:
+            continue  # A profile shard only holds profiles
+        day = func.date(model.created_at)
+        columns = [day, dimension_column if dimension_column is not None else literal(""), aggregate]
+        query = db.query(*columns).filter(model.created_at.isnot(None)).group_by(day)
+        if dimension_column is not None:
+            query = query.group_by(dimension_column)
+        for day_value, dimension, value in query:
+            bucket = day_value if isinstance(day_value, date) else date.fromisoformat(str(day_value))
+            deltas[(bucket, metric, dimension or "")] += value or 0
+    apply_deltas(db.connection(), deltas)
+    db.commit()
+
+
+def query_rollups(db: Session, metric: str, granularity: str, start: date, end: date, dimension: Optional[str] = None) -> list:
+    """Read the buckets of one metric between `start` and `end` (inclusive)."""
+    model = GRANULARITIES[granularity]
+    if granularity == "month":
+        start = month_bucket(start)
+    query = db.query(model.bucket, model.dimension, model.value).filter(
+        model.metric == metric, model.bucket >= start, model.bucket <= end
+    )
+    if dimension is not None:
+        query = query.filter(model.dimension == dimension)
+    return [
+        {"bucket": bucket.isoformat(), "dimension": dim, "value": value}
+        for bucket, dim, value in query.order_by(model.bucket, model.dimension)
+    ]
+
+
+def merge_buckets(results: Iterable[List[dict]]) -> List[dict]:
+    """Sum `query_rollups` results from several databases bucket by bucket."""
+    totals: Dict[Tuple[str, str], int] = defaultdict(int)
+    for buckets in results:
+        for row in buckets:
+            totals[(row["bucket"], row["dimension"])] += row["value"]
+    return [
+        {"bucket": bucket, "dimension": dimension, "value": value}
+        for (bucket, dimension), value in sorted(totals.items())
+    ]
+
+
+watch(SessionLocal)
+
+
+if __name__ == "__main__":
+    from sharding import shard_router
+
+    session = SessionLocal()
+    try:
+        rebuild(session)
+    finally:
+        session.close()
+    if shard_router.enabled:
+        shard_router.init_shards()
+        shard_router.scatter(rebuild)
+    print("Analytics rollups rebuilt.")
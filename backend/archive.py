@@ -0,0 +1,223 @@
+"""
+Archival of finished collaboration spaces into a separate cold-storage database.
+
+A space is finished when it has crops and every step of every crop is marked
+"completed" (tracked by `Crop.completed_at`, so candidates are found with an
+indexed query instead of loading every space). Finished spaces are copied, with their crops and proofs, into
+`archive.db` and then removed from the hot tables, batch by batch, so the
+working set and indexes of `app.db` only hold active collaborations. Read
+endpoints consult the archive when called with `include_archived=true`.
+Archived crops keep their template steps written out in full, so the archive
+does not depend on the template catalog.
+
+Copies are merged by primary key before the hot rows are deleted, so an
+interrupted run can simply be repeated.
+
+Usage (from the backend directory):
+    python archive.py --dry-run
+    python archive.py --batch-size 200
+"""
+import argparse
+import logging
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import create_engine, exists, Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, selectinload
+
+from db import SessionLocal, Space, Crop
+from templates import template_catalog, merge_steps, all_steps_completed
+import versioning  # Deleting archived spaces must leave sync tombstones
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DATABASE_URL = "sqlite:///./archive.db"  # Cold storage, separate from app.db
+ARCHIVE_BATCH_SIZE = 100  # Spaces examined per batch
+
+archive_engine = create_engine(ARCHIVE_DATABASE_URL, connect_args={"check_same_thread": False})
+ArchiveSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=archive_engine)
+
+ArchiveBase = declarative_base()
+
+
+class ArchivedSpace(ArchiveBase):
+    __tablename__ = "archived_spaces"
+
+    id = Column(Integer, primary_key=True)  # Same id as the original space
+    farmer_id = Column(Integer, nullable=False, index=True)
+    landlord_id = Column(Integer, nullable=False, index=True)
+    admin_id = Column(Integer, nullable=False)
+    description = Column(Text, nullable=True)
+    progress = Column(JSON, default={})
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ArchivedCrop(ArchiveBase):
+    __tablename__ = "archived_crops"
+
+    id = Column(Integer, primary_key=True)  # Same id as the original crop
+    crop_name = Column(String, nullable=False)
+    duration = Column(String, nullable=False)
+    steps = Column(JSON, nullable=True)
+    space_id = Column(Integer, index=True)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+
+class ArchivedProof(ArchiveBase):
+    __tablename__ = "archived_proofs"
+
+    id = Column(Integer, primary_key=True)  # Same id as the original proof
+    file_url = Column(String, nullable=False)
+    crop_id = Column(Integer, nullable=False, index=True)
+    step_index = Column(Integer, nullable=False)
+
+
+def init_archive_db():
+    """Create the archive tables if they do not exist"""
+    ArchiveBase.metadata.create_all(bind=archive_engine)
+
+
+def is_space_finished(space: Space) -> bool:
+    """A space is finished once it has crops and all of their steps are completed."""
+    return bool(space.crops) and all(all_steps_completed(crop.step_state) for crop in space.crops)
+
+
+def finished_space_ids(db, after_id: int, limit: int) -> List[int]:
+    """Ids of finished spaces after `after_id`: spaces with crops, none of them unfinished."""
+    has_crops = exists().where(Crop.space_id == Space.id)
+    has_unfinished_crop = exists().where(Crop.space_id == Space.id, Crop.completed_at.is_(None))
+    rows = (
+        db.query(Space.id)
+        .filter(Space.id > after_id, has_crops, ~has_unfinished_crop)
+        .order_by(Space.id)
+        .limit(limit)
+        .all()
+    )
+    return [space_id for space_id, in rows]
+
+
+def _archived_steps(db, crop: Crop) -> list:
+    template = template_catalog.get(db, crop.template_id) if crop.template_id else None
+    proofs = {}
+    for proof in sorted(crop.proofs, key=lambda proof: proof.id):
+        proofs.setdefault(proof.step_index, []).append(proof.file_url)
+    return merge_steps(template["steps"] if template else [], crop.step_state, proofs)
+
+
+def _copy_space(db, archive_db, space: Space) -> None:
+    archive_db.merge(ArchivedSpace(
+        id=space.id, farmer_id=space.farmer_id, landlord_id=space.landlord_id, admin_id=space.admin_id,
+        description=space.description, progress=space.progress,
+        created_at=space.created_at, updated_at=space.updated_at,
+    ))
+    for crop in space.crops:
+        archive_db.merge(ArchivedCrop(
+            id=crop.id, crop_name=crop.crop_name, duration=crop.duration, steps=_archived_steps(db, crop),
+            space_id=crop.space_id, created_at=crop.created_at, updated_at=crop.updated_at,
+        ))
+        for proof in crop.proofs:
+            archive_db.merge(ArchivedProof(
+                id=proof.id, file_url=proof.file_url, crop_id=proof.crop_id, step_index=proof.step_index,
+            ))
+
+
+def archive_finished_spaces(batch_size: int = ARCHIVE_BATCH_SIZE, dry_run: bool = False) -> dict:
+    """
+    Move finished spaces with their crops and proofs into the archive database.
+
+    Returns:
+        dict: Counters describing the run, including the ids of archived crops.
+    """
+    init_archive_db()
+    stats = {"examined": 0, "archived_spaces": 0, "archived_crops": 0, "archived_crop_ids": []}
+    last_id = 0
+    db = SessionLocal()
+    archive_db = ArchiveSessionLocal()
+    try:
+        while True:
+            # Only candidates are loaded, so a run costs what it archives rather than the whole working set
+            candidate_ids = finished_space_ids(db, last_id, batch_size)
+            if not candidate_ids:
+                break
+            last_id = candidate_ids[-1]
+            batch = (
+                db.query(Space)
+                .options(selectinload(Space.crops).selectinload(Crop.proofs))
+                .filter(Space.id.in_(candidate_ids))
+                .order_by(Space.id)
+                .all()
+            )
+            stats["examined"] += len(batch)
+
+            finished: List[Space] = [space for space in batch if is_space_finished(space)]
+            stats["archived_spaces"] += len(finished)
+            for space in finished:
+                stats["archived_crops"] += len(space.crops)
+                stats["archived_crop_ids"].extend(crop.id for crop in space.crops)
+
+            if finished and not dry_run:
+                # Copy first and commit the archive, then delete from the hot tables
+                for space in finished:
+                    _copy_space(db, archive_db, space)
+                archive_db.commit()
+                for space in finished:
+                    db.delete(space)  # Crops and proofs follow through the relationship cascades
+                db.commit()
+            db.expunge_all()
+    finally:
+        db.close()
+        archive_db.close()
+
+    logger.info("Archival finished (dry_run=%s): %s spaces, %s crops", dry_run, stats["archived_spaces"], stats["archived_crops"])
+    return stats
+
+
+def get_archived_crop(crop_id: int):
+    archive_db = ArchiveSessionLocal()
+    try:
+        return archive_db.query(ArchivedCrop).filter(ArchivedCrop.id == crop_id).first()
+    finally:
+        archive_db.close()
+
+
+def get_archived_collaborations(column: str, value: int) -> list:
+    """Return archived spaces (with their crops) whose `column` equals `value`, formatted like live ones."""
+    archive_db = ArchiveSessionLocal()
+    try:
+        spaces = archive_db.query(ArchivedSpace).filter(getattr(ArchivedSpace, column) == value).all()
+        crops = {}
+        if spaces:
+            for crop in archive_db.query(ArchivedCrop).filter(ArchivedCrop.space_id.in_([s.id for s in spaces])):
+                crops.setdefault(crop.space_id, []).append(crop)
+        return [
+            {
+                "space_id": space.id,
+                "farmer_id": space.farmer_id,
+                "landlord_id": space.landlord_id,
+                "description": space.description,
+                "crops": [
+                    {"id": crop.id, "name": crop.crop_name, "duration": crop.duration}
+                    for crop in crops.get(space.id, [])
+                ],
+                "archived": True,
+            }
+            for space in spaces
+        ]
+    finally:
+        archive_db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move finished spaces into the archive database.")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = archive_finished_spaces(args.batch_size, dry_run=args.dry_run)
+    result.pop("archived_crop_ids")
+    print(result)
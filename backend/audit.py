@@ -0,0 +1,219 @@
+"""
+Buffered audit log of write requests.
+
+`AuditMiddleware` records every non-GET request as a small dict and puts it
+on a bounded in-memory queue. It does not parse tokens or touch the
+database, so the request only pays for building the dict. A background
+writer thread drains the queue. It decodes bearer tokens to user ids and
+inserts whole batches as multi-row INSERTs, one transaction per batch, so
+auditing adds one SQLite write per batch rather than one per request.
+
+When the buffer is full, new entries are dropped and counted instead of
+blocking requests. The buffer is flushed on shutdown. Handlers can add
+context with `annotate(...)`, for example the id of a user who just
+registered.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from db import engine, AuditLog
+from logging_config import current_request_id
+from security import peek_token
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BUFFER_SIZE = int(os.getenv("AUDIT_BUFFER_SIZE", "10000"))  # Entries held in memory before new ones are dropped
+AUDIT_BATCH_SIZE = 500  # Entries written per transaction
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1"))  # Longest an entry waits for its batch
+AUDIT_ROWS_PER_INSERT = 100  # Rows per INSERT statement (9 columns each stays under SQLite's 999 bound parameters)
+AUDIT_STOP_POLL_SECONDS = 0.1  # Longest the idle writer waits before checking for a stop
+AUDITED_METHODS = {b"POST", b"PUT", b"PATCH", b"DELETE"}
+
+_details: ContextVar[Optional[dict]] = ContextVar("audit_details", default=None)
+
+
+def annotate(**fields) -> None:
+    """Attach extra fields to the audit entry of the current request (no-op outside one)."""
+    details = _details.get()
+    if details is not None:
+        details.update(fields)
+
+
+class AuditLogger:
+    def __init__(self, buffer_size: int = AUDIT_BUFFER_SIZE):
+        self._queue: queue.Queue = queue.Queue(maxsize=buffer_size)
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()  # Checked by the writer between reads, so stopping never waits for buffer space
+        self.dropped = 0  # Buffer was full (counted on the event loop thread)
+        self.written = 0
+        self.failed = 0  # Lost to database errors (counted on the writer thread)
+
+    def record(self, entry: dict) -> None:
+        """Queue one entry; never blocks."""
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        """Write everything still buffered and stop the writer (also when the buffer is full)."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {"buffered": self._queue.qsize(), "dropped": self.dropped, "written": self.written, "failed": self.failed}
+
+    def _run(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch: List[dict] = []
+            deadline = None
+            while len(batch) < AUDIT_BATCH_SIZE:
+                stopping = self._stopping.is_set()
+                if stopping:
+                    timeout = 0.0  # Drain what is left without waiting
+                elif deadline is None:
+                    timeout = AUDIT_STOP_POLL_SECONDS
+                else:
+                    timeout = max(0.0, min(deadline - time.monotonic(), AUDIT_STOP_POLL_SECONDS))
+                try:
+                    entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    if not stopping and (deadline is None or time.monotonic() < deadline):
+                        continue  # Poll again so a stop is noticed while waiting
+                    break
+                batch.append(entry)
+                if deadline is None:
+                    deadline = time.monotonic() + AUDIT_FLUSH_SECONDS
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[dict]) -> None:
+        claims_by_token = {}
+        rows = []
+        for entry in batch:
+            token = entry.pop("token", None)
+            if token and token not in claims_by_token:
+                claims_by_token[token] = peek_token(token) or {}
+            claims = claims_by_token.get(token) or {}
+            details = entry.pop("details")
+            rows.append({
+                **entry,
+                "user_id": details.pop("user_id", None) or claims.get("id"),
+                "role": details.pop("role", None) or claims.get("role"),
+                "details": details or None,
+            })
+        try:
+            with engine.begin() as connection:
+                for start in range(0, len(rows), AUDIT_ROWS_PER_INSERT):
+                    connection.execute(AuditLog.__table__.insert().values(rows[start:start + AUDIT_ROWS_PER_INSERT]))
+            self.written += len(rows)
+        except Exception:
+            self.failed += len(rows)
+            logger.exception("Failed to write %s audit entries", len(rows))
+
+
+# Shared audit logger for the whole process
+audit_log = AuditLogger()
+
+
+class AuditMiddleware:
+    """ASGI middleware that queues an audit entry for every write request."""
+
+    def __init__(self, app, audit_logger: AuditLogger = audit_log):
+        self.app = app
+        self.audit = audit_logger
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"].encode() not in AUDITED_METHODS:
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        entry = {
+            "occurred_at": datetime.utcnow(),
+            "method": scope["method"],
+            "path": scope["path"],
+            "status_code": None,
+            "client_ip": scope["client"][0] if scope.get("client") else None,
+            "token": None,
+            "details": {},
+        }
+        request_id = current_request_id()
+        if request_id:
+            entry["details"]["request_id"] = request_id
+        for name, value in scope["headers"]:
+            if name == b"authorization" and value.startswith(b"Bearer "):
+                entry["token"] = value[7:].decode("latin-1")
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                entry["status_code"] = message["status"]
+            await send(message)
+
+        token = _details.set(entry["details"])
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _details.reset(token)
+            entry["duration_ms"] = int((time.perf_counter() - started) * 1000)
+            self.audit.record(entry)
+
+
+def query_audit_log(
+    db: Session,
+    user_id: Optional[int] = None,
+    path_prefix: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    before: Optional[int] = None,
+    limit: int = 100,
+) -> dict:
+    """
+    Newest-first page of audit entries. Pass the returned `next_before` as
+    `before` to fetch the following page (keyset pagination on the id).
+    """
+    query = db.query(AuditLog)
+    if user_id is not None:
+        query = query.filter(AuditLog.user_id == user_id)
+    if path_prefix:
+        query = query.filter(AuditLog.path.startswith(path_prefix, autoescape=True))
+    if since is not None:
+        query = query.filter(AuditLog.occurred_at >= since)
+    if until is not None:
+        query = query.filter(AuditLog.occurred_at < until)
+    if before is not None:
+        query = query.filter(AuditLog.id < before)
+    rows = query.order_by(AuditLog.id.desc()).limit(limit).all()
+    return {
+        "entries": [
+            {
+                "id": row.id,
+                "occurred_at": row.occurred_at,
+                "user_id": row.user_id,
+                "role": row.role,
+                "method": row.method,
+                "path": row.path,
+                "status_code": row.status_code,
+                "client_ip": row.client_ip,
+                "duration_ms": row.duration_ms,
+                "details": row.details,
+            }
+            for row in rows
+        ],
+        "next_before": rows[-1].id if len(rows) == limit else None,
+    }
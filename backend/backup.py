@@ -0,0 +1,329 @@
+"""
+Online backups of the SQLite databases.
+
+`create_backup` snapshots app.db, archive.db and every profile shard while the
+server keeps running. It uses SQLite's online backup API and copies
+BACKUP_PAGES_PER_STEP pages per step. The source is read-locked only during a
+step, and the copy pauses between steps so writers can commit. If writers
+restart a database's copy more than BACKUP_MAX_RESTARTS times, that database is
+copied again in a single step so the backup still finishes. Each
+database snapshot is consistent on its own.
+
+Next to the snapshots, the backup writes a manifest. It lists checksums and
+timings for each database, plus the media keys the snapshots reference, with
+their sizes. Media objects are never overwritten (keys are unique), so the
+manifest is enough to check that a restored snapshot still has all its files.
+The longest step is reported as `longest_stall_ms`: writers can wait on the
+backup for at most that long.
+
+Restoring copies each snapshot back over its live database in a single
+backup step. Stop the server first, because in-process caches would
+otherwise keep serving the old data.
+
+Usage (from the backend directory):
+    python backup.py
+    python backup.py --list
+    python backup.py --restore 20261019T120000Z
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from db import engine
+from archive import archive_engine, init_archive_db
+from sharding import shard_router
+from media_gc import collect_referenced
+from storage import storage, STORAGE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = Path(os.getenv("BACKUP_DIR", Path(__file__).parent / "backups"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))  # Pages copied while the source is read-locked
+BACKUP_STEP_PAUSE_MS = float(os.getenv("BACKUP_STEP_PAUSE_MS", "5"))  # Pause between steps so writers can commit
+BACKUP_MAX_RESTARTS = 3  # Restarts caused by concurrent writes before the rest is copied in one step
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))  # Completed backups kept; older ones are deleted
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "0"))  # 0 disables the scheduled task
+MANIFEST_NAME = "manifest.json"
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+_run_lock = threading.Lock()  # One backup or restore at a time per process
+
+
+class BackupError(Exception):
+    """Raised when a backup cannot be taken or restored."""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _databases() -> Dict[str, Path]:
+    """Live database files by their file name in a backup."""
+    paths = [Path(engine.url.database), Path(archive_engine.url.database)]
+    paths += [Path(shard_engine.url.database) for shard_engine in shard_router.engines().values()]
+    return {path.name: path for path in paths}
+
+
+def _checksum(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHECKSUM_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _copy_online(source: Path, target: Path, pages: int, pause: float) -> dict:
+    """
+    Copy `source` into `target` with the online backup API, `pages` pages per
+    step (-1 for a single step), and time each step.
+    """
+    stats = {"steps": 0, "restarts": 0, "longest_step_ms": 0.0, "single_step": pages < 0}
+    last = {"remaining": None, "at": None}
+
+    def progress(status, remaining, total):
+        now = time.perf_counter()
+        stats["steps"] += 1
+        stats["longest_step_ms"] = max(stats["longest_step_ms"], (now - last["at"]) * 1000)
+        # A write by another connection makes SQLite start the copy over
+        if last["remaining"] is not None and remaining > last["remaining"]:
+            stats["restarts"] += 1
+            if stats["restarts"] > BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        last["remaining"] = remaining
+        if remaining and pause:
+            time.sleep(pause)
+        last["at"] = time.perf_counter()
+
+    source_connection = sqlite3.connect(f"file:{source}?mode=ro", uri=True, timeout=30)
+    target_connection = sqlite3.connect(target)
+    try:
+        last["at"] = time.perf_counter()
+        source_connection.backup(target_connection, pages=pages, progress=progress)
+    finally:
+        target_connection.close()
+        source_connection.close()
+    stats["longest_step_ms"] = round(stats["longest_step_ms"], 3)
+    return stats
+
+
+def _snapshot(source: Path, target: Path) -> dict:
+    started = time.perf_counter()
+    try:
+        stats = _copy_online(source, target, BACKUP_PAGES_PER_STEP, BACKUP_STEP_PAUSE_MS / 1000)
+    except _TooManyRestarts:
+        logger.warning("Backup of %s kept restarting under writes; copying it in one step", source)
+        target.unlink(missing_ok=True)
+        restarts = BACKUP_MAX_RESTARTS + 1
+        stats = _copy_online(source, target, -1, 0)
+        stats["restarts"] = restarts
+    stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    stats["bytes"] = target.stat().st_size
+    stats["sha256"] = _checksum(target)
+    return stats
+
+
+def _media_manifest(directory: Path, database_files: Dict[str, Path]) -> dict:
+    """Media keys referenced by the snapshots (not the live databases), with their sizes."""
+    engines = {name: create_engine(f"sqlite:///{directory / name}") for name in database_files}
+    sessions = {name: Session(bind=snapshot_engine) for name, snapshot_engine in engines.items()}
+    try:
+        main = sessions[Path(engine.url.database).name]
+        archived = sessions[Path(archive_engine.url.database).name]
+        shards = [sessions[Path(shard_engine.url.database).name] for shard_engine in shard_router.engines().values()]
+        referenced = collect_referenced(main, archived, profile_dbs=shards if shard_router.enabled else None)
+    finally:
+        for session in sessions.values():
+            session.close()
+        for snapshot_engine in engines.values():
+            snapshot_engine.dispose()
+
+    objects = {}
+    for obj in storage.iter_objects():
+        if obj.key in referenced:
+            objects[obj.key] = obj.stat()[0]
+    return {
+        "backend": STORAGE_BACKEND,
+        "objects": [{"key": key, "bytes": objects[key]} for key in sorted(objects)],
+        "missing": sorted(referenced - objects.keys()),
+    }
+
+
+def _prune(keep: int) -> None:
+    for directory in [entry["id"] for entry in list_backups()][keep:]:
+        shutil.rmtree(BACKUP_DIR / directory, ignore_errors=True)
+
+
+def create_backup(keep: int = BACKUP_KEEP) -> dict:
+    """
+    Snapshot every database and write the manifest of referenced media.
+
+    Args:
+        keep (int): Completed backups to keep, including this one.
+
+    Returns:
+        dict: The backup's summary (id, duration, longest stall, sizes).
+    """
+    if not _run_lock.acquire(blocking=False):
+        raise BackupError("A backup or restore is already running")
+    try:
+        started = time.perf_counter()
+        init_archive_db()
+        backup_id = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        if (BACKUP_DIR / backup_id).exists():
+            backup_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+        partial = BACKUP_DIR / f"{backup_id}.partial"
+        partial.mkdir(parents=True)
+
+        try:
+            databases = {}
+            sources = _databases()
+            for name, source in sources.items():
+                if not source.exists():
+                    continue
+                databases[name] = {"source": str(source.resolve()), **_snapshot(source, partial / name)}
+            media = _media_manifest(partial, {name: sources[name] for name in databases})
+            manifest = {
+                "id": backup_id,
+                "created_at": datetime.utcnow().isoformat(),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "longest_stall_ms": max((stats["longest_step_ms"] for stats in databases.values()), default=0.0),
+                "databases": databases,
+                "media": media,
+            }
+            (partial / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+            partial.rename(BACKUP_DIR / backup_id)
+        except BaseException:
+            shutil.rmtree(partial, ignore_errors=True)
+            raise
+
+        _prune(keep)
+        summary = _summary(manifest)
+        logger.info("Backup %s finished: %s", backup_id, summary)
+        return summary
+    finally:
+        _run_lock.release()
+
+
+def _summary(manifest: dict) -> dict:
+    return {
+        "id": manifest["id"],
+        "created_at": manifest["created_at"],
+        "duration_ms": manifest["duration_ms"],
+        "longest_stall_ms": manifest["longest_stall_ms"],
+        "bytes": sum(stats["bytes"] for stats in manifest["databases"].values()),
+        "databases": sorted(manifest["databases"]),
+        "media_files": len(manifest["media"]["objects"]),
+        "media_missing": len(manifest["media"]["missing"]),
+    }
+
+
+def _load_manifest(backup_id: str) -> dict:
+    directory = BACKUP_DIR / backup_id
+    if directory.parent != BACKUP_DIR or not (directory / MANIFEST_NAME).is_file():
+        raise BackupError(f"Unknown backup: {backup_id}")
+    return json.loads((directory / MANIFEST_NAME).read_text())
+
+
+def list_backups() -> List[dict]:
+    """Completed backups, newest first."""
+    if not BACKUP_DIR.is_dir():
+        return []
+    backups = []
+    for directory in BACKUP_DIR.iterdir():
+        if directory.is_dir() and (directory / MANIFEST_NAME).is_file():
+            backups.append(_summary(json.loads((directory / MANIFEST_NAME).read_text())))
+    return sorted(backups, key=lambda entry: entry["id"], reverse=True)
+
+
+def restore_backup(backup_id: str, databases: Optional[List[str]] = None) -> dict:
+    """
+    Copy a backup's snapshots back over the live databases (run with the server stopped).
+
+    Every snapshot is checked against its manifest checksum and with
+    `PRAGMA quick_check` before anything is overwritten.
+
+    Args:
+        backup_id (str): Backup to restore.
+        databases (list): Database file names to restore (default: all in the backup).
+
+    Returns:
+        dict: Restored databases, duration and referenced media missing from storage.
+    """
+    if not _run_lock.acquire(blocking=False):
+        raise BackupError("A backup or restore is already running")
+    try:
+        started = time.perf_counter()
+        manifest = _load_manifest(backup_id)
+        directory = BACKUP_DIR / backup_id
+        names = databases or list(manifest["databases"])
+        live = _databases()
+        for name in names:
+            if name not in manifest["databases"] or name not in live:
+                raise BackupError(f"Backup {backup_id} has no restorable database {name}")
+            snapshot = directory / name
+            if _checksum(snapshot) != manifest["databases"][name]["sha256"]:
+                raise BackupError(f"Snapshot {name} does not match its checksum")
+            connection = sqlite3.connect(f"file:{snapshot}?mode=ro", uri=True)
+            try:
+                result = connection.execute("PRAGMA quick_check").fetchone()[0]
+            finally:
+                connection.close()
+            if result != "ok":
+                raise BackupError(f"Snapshot {name} failed its integrity check: {result}")
+
+        for name in names:
+            _copy_online(directory / name, live[name], -1, 0)
+
+        wanted = {entry["key"] for entry in manifest["media"]["objects"]}
+        present = {obj.key for obj in storage.iter_objects() if obj.key in wanted}
+        report = {
+            "id": backup_id,
+            "restored": names,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "media_missing": sorted(wanted - present),
+        }
+        logger.info("Restored backup %s: %s databases, %s media files missing", backup_id, len(names), len(report["media_missing"]))
+        return report
+    finally:
+        _run_lock.release()
+
+
+async def run_periodically(interval_hours: float = BACKUP_INTERVAL_HOURS):
+    """Background task: take a backup every `interval_hours`."""
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            await asyncio.to_thread(create_backup)
+        except Exception:
+            logger.exception("Scheduled backup failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back up the databases online, or restore a backup.")
+    parser.add_argument("--list", action="store_true", help="List completed backups.")
+    parser.add_argument("--restore", metavar="BACKUP_ID", help="Restore a backup (stop the server first).")
+    parser.add_argument("--database", action="append", help="With --restore: only this database file (repeatable).")
+    parser.add_argument("--keep", type=int, default=BACKUP_KEEP, help="Completed backups to keep.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.list:
+        for entry in list_backups():
+            print(entry)
+    elif args.restore:
+        print(restore_backup(args.restore, args.database))
+    else:
+        print(create_backup(args.keep))
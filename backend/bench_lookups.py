@@ -0,0 +1,86 @@
+"""
+Micro-benchmark: per-call cost of the hot lookups, ORM Query form vs. the
+pre-built statements in repository.py.
+
+Runs against a throwaway in-memory database, so it measures statement
+construction, cache-key generation and execution overhead rather than disk I/O.
+
+Usage (from the backend directory):
+    python bench_lookups.py --rows 10000 --calls 20000
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import repository
+from db import Base, User, FarmerDetails, Crop
+
+
+def _seed(db, rows: int) -> None:
+    db.add_all(User(id=i, email=f"user{i}@example.com", password="x", role="farmer") for i in range(1, rows + 1))
+    db.add_all(FarmerDetails(id=i, user_id=i, land_handling_capacity=5, preferred_locations=[]) for i in range(1, rows + 1))
+    db.add_all(Crop(id=i, crop_name="wheat", duration="4 months", step_state=[]) for i in range(1, rows + 1))
+    db.commit()
+
+
+def _time(db, lookup, keys) -> float:
+    """Microseconds per call; the session is cleared each call, as in a fresh request."""
+    started = time.perf_counter()
+    for key in keys:
+        lookup(db, key)
+        db.expunge_all()
+    return (time.perf_counter() - started) / len(keys) * 1e6
+
+
+CASES = {
+    "user by email": (
+        lambda db, i: db.query(User).filter(User.email == f"user{i}@example.com").first(),
+        lambda db, i: repository.get_user_by_email(db, f"user{i}@example.com"),
+    ),
+    "user by id": (
+        lambda db, i: db.query(User).filter(User.id == i).first(),
+        lambda db, i: repository.get_user(db, i),
+    ),
+    "farmer by user_id": (
+        lambda db, i: db.query(FarmerDetails).filter(FarmerDetails.user_id == i).first(),
+        lambda db, i: repository.get_profile_by_user_id(db, "farmer", i),
+    ),
+    "crop by id": (
+        lambda db, i: db.query(Crop).filter(Crop.id == i).first(),
+        lambda db, i: repository.get_crop(db, i),
+    ),
+}
+
+
+def run(rows: int, calls: int) -> dict:
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine, tables=[User.__table__, FarmerDetails.__table__, Crop.__table__])
+    db = sessionmaker(bind=engine)()
+    try:
+        _seed(db, rows)
+        keys = [random.randint(1, rows) for _ in range(calls)]
+        results = {}
+        for name, (query_form, repository_form) in CASES.items():
+            # Warm both statement caches before timing
+            _time(db, query_form, keys[:100])
+            _time(db, repository_form, keys[:100])
+            before, after = _time(db, query_form, keys), _time(db, repository_form, keys)
+            results[name] = {"query_us": round(before, 1), "repository_us": round(after, 1), "saved": f"{(1 - after / before) * 100:.0f}%"}
+        return results
+    finally:
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ORM Query lookups with the pre-built statements in repository.py.")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, result in run(args.rows, args.calls).items():
+        print(f"{name:20} {result}")
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+# Bounds for the per-entity read cache
+ENTITY_CACHE_MAX_ENTRIES = 4096  # Oldest entries are evicted past this size
+ENTITY_CACHE_TTL_SECONDS = 300  # Entries older than this are reloaded from the DB
+
+
+class EntityCache:
+    """
+    Bounded LRU cache with a TTL for serialized entity rows.
+
+    Each entry holds the JSON-ready payload together with its strong ETag so
+    a conditional GET can be answered without touching the database or
+    re-serializing the row. The cache is per process: every write path that
+    changes a cached row must call `invalidate` for it.
+    """
+
+    def __init__(self, max_entries: int = ENTITY_CACHE_MAX_ENTRIES, ttl: float = ENTITY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, str]]:
+        """Return `(payload, etag)` for a fresh entry, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload, etag = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload, etag
+
+    def set(self, key: Hashable, payload: Any) -> str:
+        """Store a payload and return its ETag."""
+        etag = make_etag(payload)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, payload, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return etag
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def make_etag(payload: Any) -> str:
+    """Build a strong ETag from the canonical JSON form of a payload."""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return '"%s"' % hashlib.sha256(body.encode("utf-8")).hexdigest()[:32]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against a strong ETag."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def row_to_dict(row) -> dict:
+    """Serialize the column attributes of an ORM row."""
+    return {column.key: getattr(row, column.key) for column in row.__mapper__.column_attrs}
+
+
+# Shared cache for /farmers/{id}, /landlords/{id} and /crop/{id}/steps
+entity_cache = EntityCache()
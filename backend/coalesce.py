@@ -0,0 +1,76 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+When many identical expensive requests arrive together (admins opening the
+dashboard at once, a page that fans out duplicate calls), only the first one
+runs the query. The others await the same computation and receive its
+result. A key identifies "identical": the route, its normalized parameters
+and the caller's authorization scope. Callers in different scopes never
+share results.
+
+A finished result can also be reused for a short micro-cache window
+(COALESCE_WINDOW_SECONDS, 0 by default, which disables reuse). With a window
+of 1 second, a burst produces at most one query per second no matter how
+many requests arrive. Reused results can be up to one window stale. Errors
+are shared with the requests that were waiting, but are never cached.
+
+The state lives on the event loop thread, so no lock is needed. Computations
+should return JSON-ready data (e.g. through `jsonable_encoder`) because the
+same object is handed to every waiting request.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+COALESCE_WINDOW_SECONDS = float(os.getenv("COALESCE_WINDOW_SECONDS", "0"))  # Reuse finished results this long (0: in-flight sharing only)
+COALESCE_MAX_ENTRIES = 1024  # Finished entries kept for the window; expired ones are swept past this
+
+
+def coalesce_key(route: str, params: Optional[dict] = None, scope: Hashable = None) -> tuple:
+    """Key for `single_flight.run`: parameters are order-independent and list values become tuples."""
+    normalized = tuple(sorted(
+        (name, tuple(value) if isinstance(value, list) else value)
+        for name, value in (params or {}).items()
+        if value is not None
+    ))
+    return route, normalized, scope
+
+
+class SingleFlight:
+    def __init__(self, window: float = COALESCE_WINDOW_SECONDS):
+        self.window = window
+        self._entries: Dict[Hashable, Tuple["asyncio.Future", float]] = {}
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]], window: Optional[float] = None) -> Any:
+        """
+        Return the result of `compute()`, sharing one in-flight (or, within the
+        window, recently finished) computation among callers with the same key.
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            task, expires_at = entry
+            if not task.done() or expires_at > time.monotonic():
+                # Shielded so a disconnecting caller does not cancel the others' result
+                return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(compute())
+        self._entries[key] = (task, float("inf"))
+        task.add_done_callback(lambda done: self._finished(key, done, self.window if window is None else window))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: "asyncio.Future", window: float) -> None:
+        if self._entries.get(key, (None,))[0] is not task:
+            return
+        if window <= 0 or task.cancelled() or task.exception() is not None:
+            del self._entries[key]
+            return
+        self._entries[key] = (task, time.monotonic() + window)
+        if len(self._entries) > COALESCE_MAX_ENTRIES:
+            now = time.monotonic()
+            for stale in [k for k, (t, expires_at) in self._entries.items() if t.done() and expires_at <= now]:
+                del self._entries[stale]
+
+
+# Shared coalescer for the whole process
+single_flight = SingleFlight()
@@ -1,5 +1,5 @@
 # SQLAlchemy Core and ORM
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, JSON, Text
+from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, JSON, Text, DateTime, Date, UniqueConstraint, Index
 from sqlalchemy.orm import sessionmaker, relationship, Session
 
 # Declarative Base
@@ -11,6 +11,7 @@ from sqlalchemy.ext.mutable import Mutable  # For potential mutability of JSON f
 
 # Utility Libraries
 import json  # For serialization and deserialization of JSON data
+from datetime import datetime
 
 # PostgreSQL-Specific Imports (if PostgreSQL is used)
 from sqlalchemy.dialects.postgresql import JSON  # If using PostgreSQL for native JSON support
@@ -21,7 +22,7 @@ from sqlalchemy.types import Text  # Add this import
 # Database setup
 DATABASE_URL = "sqlite:///./app.db"  # SQLite database
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, echo=True)
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -31,6 +32,7 @@ Base = declarative_base()
 # Custom type decorator for JSON list storage in SQLite
 class JSONEncodedList(TypeDecorator):
     impl = String
+    cache_ok = True  # Stateless, so statements using it can be served from the compiled cache
 
     def process_bind_param(self, value, dialect):
         if value is not None:
@@ -51,6 +53,8 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     password = Column(String)
     role = Column(String)  # Roles: 'admin', 'farmer', 'landlord'
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     farmer_details = relationship("FarmerDetails", back_populates="user", uselist=False)
     landlord_details = relationship("LandlordDetails", back_populates="user", uselist=False)
@@ -65,6 +69,9 @@ class FarmerDetails(Base):
     phone_number = Column(String, nullable=True)  # farmer's contact number
     land_handling_capacity = Column(Integer)
     preferred_locations = Column(JSONEncodedList, default=[])
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    row_version = Column(Integer, index=True)  # Sync clock value of the last change (see versioning.py)
 
     user = relationship("User", back_populates="farmer_details")
 
@@ -79,6 +86,9 @@ class LandlordDetails(Base):
     acres = Column(Integer)
     location = Column(String)
     images_list = Column(JSONEncodedList)  # Store as JSON encoded string
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    row_version = Column(Integer, index=True)  # Sync clock value of the last change (see versioning.py)
 
     user = relationship("User", back_populates="landlord_details")
 
@@ -91,6 +101,9 @@ class Space(Base):
     landlord_id = Column(Integer, ForeignKey("landlord_details.id"), nullable=False)
     admin_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     description = Column(Text, nullable=True)  # Optional description of the collaboration
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    row_version = Column(Integer, index=True)  # Sync clock value of the last change (see versioning.py)
 
     # Relationships
     farmer = relationship("FarmerDetails")
@@ -104,16 +117,39 @@ class Space(Base):
 
 
 
+# Shared, versioned cultivation plans (see templates.py); a version is never modified once created
+class CropTemplate(Base):
+    __tablename__ = "crop_templates"
+    __table_args__ = (UniqueConstraint("crop_name", "version"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    crop_name = Column(String, nullable=False)
+    version = Column(Integer, nullable=False)
+    duration = Column(String, nullable=False)
+    steps = Column(JSON, nullable=False)  # Step definitions: [{"name": ..., "description": ...}, ...]
+    checksum = Column(String, nullable=False, index=True)  # sha256 of the step definitions
+    created_at = Column(DateTime, default=datetime.utcnow)
+    row_version = Column(Integer, index=True)  # Sync clock value of the last change (see versioning.py)
+
+
 class Crop(Base):
     __tablename__ = "crops"
+    # Archival looks for spaces without unfinished crops (see archive.finished_space_ids)
+    __table_args__ = (Index("ix_crops_space_id_completed_at", "space_id", "completed_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     crop_name = Column(String, nullable=False)
     duration = Column(String, nullable=False)
-    steps = Column(JSON, nullable=True)  # Use JSON for structured steps data
+    template_id = Column(Integer, ForeignKey("crop_templates.id"), index=True)
+    step_state = Column(JSON, nullable=True)  # Per step: {"status": ..., "proof_count": ...}
+    completed_at = Column(DateTime, nullable=True)  # Set while every step is completed (see templates.all_steps_completed)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    row_version = Column(Integer, index=True)  # Sync clock value of the last change (see versioning.py)
 
     space_id = Column(Integer, ForeignKey("spaces.id"))
     space = relationship("Space", back_populates="crops")
+    template = relationship("CropTemplate")
 
     # Define relationship with Proof
     proofs = relationship("Proof", back_populates="crop", cascade="all, delete")
@@ -124,12 +160,103 @@ class Proof(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     file_url = Column(String, nullable=False)  # URL of the uploaded file
-    crop_id = Column(Integer, ForeignKey("crops.id"), nullable=False)  # Reference to Crop
+    crop_id = Column(Integer, ForeignKey("crops.id"), nullable=False, index=True)  # Reference to Crop
     step_index = Column(Integer, nullable=False)  # Index of the step in the JSON list
+    row_version = Column(Integer, index=True)  # Sync clock value of the last change (see versioning.py)
 
     crop = relationship("Crop", back_populates="proofs")  # Relationship with Crop
 
 
+# Region of each profile moved out of app.db by `sharding.py migrate` (new profiles carry their region in the id)
+class ShardDirectory(Base):
+    __tablename__ = "shard_directory"
+
+    kind = Column(String, primary_key=True)  # 'farmer' or 'landlord'
+    profile_id = Column(Integer, primary_key=True)  # FarmerDetails.id / LandlordDetails.id
+    region = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+
+
+# Next local profile id per kind, kept in each shard (see ShardRouter.allocate_id)
+class ShardSequence(Base):
+    __tablename__ = "shard_sequences"
+
+    kind = Column(String, primary_key=True)
+    next_id = Column(Integer, nullable=False, default=1)
+
+
+# Sync clock: one row whose version is bumped once per flush that changes synced rows (see versioning.py)
+class SyncClock(Base):
+    __tablename__ = "sync_clock"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+# Deleted synced rows, so delta sync clients can drop them; owner ids scope who receives each one
+class SyncTombstone(Base):
+    __tablename__ = "sync_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    row_version = Column(Integer, nullable=False, index=True)
+    farmer_id = Column(Integer, nullable=True, index=True)  # FarmerDetails.id the row belonged to
+    landlord_id = Column(Integer, nullable=True, index=True)  # LandlordDetails.id the row belonged to
+    deleted_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Revoked refresh token ids, mirrored in memory by security.RevocationList
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)  # Rows can be purged once the token expires
+    revoked_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+# Audit trail of write requests, appended in batches by audit.AuditLogger
+class AuditLog(Base):
+    __tablename__ = "audit_logs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    occurred_at = Column(DateTime, nullable=False, index=True)
+    user_id = Column(Integer, nullable=True, index=True)  # From the bearer token or the handler (e.g. a new registration)
+    role = Column(String, nullable=True)
+    method = Column(String, nullable=False)
+    path = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    client_ip = Column(String, nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    details = Column(JSON, nullable=True)  # Handler-supplied context, e.g. {"crop_id": 3}
+
+
+# Analytics rollups: one row per bucket, metric and dimension (e.g. crop name),
+# maintained incrementally as rows are created (see analytics.py)
+class DailyRollup(Base):
+    __tablename__ = "daily_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket = Column(Date, nullable=False)  # Day
+    metric = Column(String, nullable=False)
+    dimension = Column(String, nullable=False, default="")
+    value = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint("metric", "bucket", "dimension", name="uq_daily_rollups_bucket"),)
+
+
+class MonthlyRollup(Base):
+    __tablename__ = "monthly_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket = Column(Date, nullable=False)  # First day of the month
+    metric = Column(String, nullable=False)
+    dimension = Column(String, nullable=False, default="")
+    value = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (UniqueConstraint("metric", "bucket", "dimension", name="uq_monthly_rollups_bucket"),)
+
+
 
 
 
@@ -0,0 +1,129 @@
+"""
+In-process pub/sub hub feeding the server-sent event streams.
+
+Write paths call `event_hub.publish(...)` (from any thread) after their commit;
+each SSE connection holds an asyncio queue on one or more channels
+(`space:<id>`, `user:<id>`). A short per-channel history lets clients resume
+with Last-Event-ID after a reconnect. Idle connections cost one parked task.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+
+EVENT_HISTORY_SIZE = 256  # Events kept per channel for Last-Event-ID resume
+SUBSCRIBER_QUEUE_SIZE = 1000  # Slow consumers past this backlog are disconnected
+HEARTBEAT_SECONDS = 15  # Comment lines keep proxies from closing idle streams
+
+
+class Event:
+    __slots__ = ("id", "name", "data")
+
+    def __init__(self, event_id: int, name: str, data: dict):
+        self.id = event_id
+        self.name = name
+        self.data = data
+
+    def encode(self) -> str:
+        return f"id: {self.id}\nevent: {self.name}\ndata: {json.dumps(self.data, default=str)}\n\n"
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event: Event) -> None:
+        # Runs on the event loop thread
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventHub:
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE):
+        self.history_size = history_size
+        # Ids start from the clock so they keep increasing across restarts
+        self._first_id = int(time.time() * 1000)
+        self._ids = itertools.count(self._first_id)
+        self._lock = threading.Lock()
+        self._history: Dict[str, deque] = {}
+        self._evicted: Dict[str, int] = {}  # Newest event id dropped from each channel's history
+        self._subscribers: Dict[str, Set[_Subscriber]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Attach the hub to the server's event loop (called on startup)."""
+        self._loop = loop
+
+    def publish(self, channels: Iterable[str], name: str, data: dict) -> int:
+        """Publish one event to several channels; safe to call from worker threads."""
+        with self._lock:
+            event = Event(next(self._ids), name, data)
+            targets = set()
+            for channel in set(channels):
+                history = self._history.setdefault(channel, deque(maxlen=self.history_size))
+                if len(history) == history.maxlen:
+                    self._evicted[channel] = history[0].id
+                history.append(event)
+                targets.update(self._subscribers.get(channel, ()))
+        if self._loop is not None:
+            for subscriber in targets:
+                self._loop.call_soon_threadsafe(subscriber.deliver, event)
+        return event.id
+
+    async def stream(self, channels: Iterable[str], last_event_id: Optional[int] = None) -> AsyncIterator[str]:
+        """
+        Yield SSE-encoded events for `channels`, first replaying anything after
+        `last_event_id` that is still in the history.
+        """
+        channels = set(channels)
+        subscriber = _Subscriber()
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscriber)
+            backlog = []
+            if last_event_id is not None:
+                for channel in channels:
+                    # Events the client missed were dropped from history (or were published
+                    # before this process started): tell it to refetch
+                    if last_event_id < self._first_id - 1 or self._evicted.get(channel, 0) > last_event_id:
+                        backlog.append(Event(last_event_id, "reset", {"channel": channel}))
+                    backlog.extend(event for event in self._history.get(channel, ()) if event.id > last_event_id)
+        try:
+            sent = last_event_id or 0
+            for event in sorted(backlog, key=lambda e: (e.id, e.name != "reset")):
+                if event.name == "reset" or event.id > sent:
+                    yield event.encode()
+                    sent = max(sent, event.id)
+            yield "retry: 3000\n\n"
+            while not subscriber.overflowed:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event.id > sent:
+                    yield event.encode()
+                    sent = event.id
+        finally:
+            with self._lock:
+                for channel in channels:
+                    subscribers = self._subscribers.get(channel)
+                    if subscribers is not None:
+                        subscribers.discard(subscriber)
+                        if not subscribers:
+                            del self._subscribers[channel]
+
+
+def space_channels(space_id: int, member_user_ids: Iterable[int]) -> list:
+    """Channels interested in changes to a space: the space itself and its farmer's and landlord's users."""
+    return [f"space:{space_id}"] + [f"user:{user_id}" for user_id in member_user_ids]
+
+
+# Shared hub for the whole process
+event_hub = EventHub()
@@ -0,0 +1,153 @@
+"""
+Streaming bulk export of farmers, landlords, spaces, crops and proofs.
+
+Rows are read with `yield_per`, which keeps a server-side cursor open and
+materializes one batch at a time, and are encoded as CSV or NDJSON chunk by
+chunk, so memory stays flat no matter how many rows are exported. Every view
+is ordered by a key column; passing the last key received as `after` resumes
+an interrupted export.
+
+Usage (from the backend directory):
+    python export.py farmers --format csv > farmers.csv
+    python export.py space_crops --format ndjson --after 1200 > space_crops.ndjson
+"""
+import argparse
+import csv
+import heapq
+import io
+import json
+import sys
+import zlib
+from typing import Iterator, Optional
+
+from db import SessionLocal, FarmerDetails, LandlordDetails, Space, Crop, Proof
+from sharding import shard_router
+
+EXPORT_BATCH_SIZE = 1000  # Rows fetched per cursor round trip and encoded per chunk
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _model_view(model):
+    columns = [attr.key for attr in model.__mapper__.column_attrs]
+    return {
+        "columns": columns,
+        "select": [getattr(model, name) for name in columns],
+        "key": model.id,
+        "order_by": [model.id],
+        "join": None,
+        "sharded": model in (FarmerDetails, LandlordDetails),
+    }
+
+
+# View name -> columns, selected expressions, resume key and ordering
+EXPORT_VIEWS = {
+    "farmers": _model_view(FarmerDetails),
+    "landlords": _model_view(LandlordDetails),
+    "spaces": _model_view(Space),
+    "crops": _model_view(Crop),
+    "proofs": _model_view(Proof),
+    # One row per proof (or per crop without proofs, or per space without crops). Resumes by space id,
+    # so pass the last space whose rows were all received
+    "space_crops": {
+        "columns": [
+            "space_id", "farmer_id", "landlord_id", "description",
+            "crop_id", "crop_name", "duration",
+            "proof_id", "step_index", "file_url",
+        ],
+        "select": [
+            Space.id, Space.farmer_id, Space.landlord_id, Space.description,
+            Crop.id, Crop.crop_name, Crop.duration,
+            Proof.id, Proof.step_index, Proof.file_url,
+        ],
+        "key": Space.id,
+        "order_by": [Space.id, Crop.id, Proof.id],
+        "join": lambda query: query.outerjoin(Crop, Crop.space_id == Space.id).outerjoin(Proof, Proof.crop_id == Crop.id),
+        "sharded": False,
+    },
+}
+
+
+def iter_rows(view_name: str, after: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[tuple]:
+    """Yield the rows of a view in key order, starting after the `after` key."""
+    view = EXPORT_VIEWS[view_name]
+    if view["sharded"] and shard_router.enabled:
+        # Every shard streams in id order; merging keeps the export globally ordered and resumable
+        streams = [_iter_session_rows(view, shard_router.session(region), after, batch_size) for region in shard_router.regions]
+        yield from heapq.merge(*streams, key=lambda row: row[0])
+    else:
+        yield from _iter_session_rows(view, SessionLocal(), after, batch_size)
+
+
+def _iter_session_rows(view: dict, db, after: Optional[int], batch_size: int) -> Iterator[tuple]:
+    try:
+        query = db.query(*view["select"])
+        if view["join"] is not None:
+            query = view["join"](query)
+        if after is not None:
+            query = query.filter(view["key"] > after)
+        yield from query.order_by(*view["order_by"]).yield_per(batch_size)
+    finally:
+        db.close()
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def encode_csv(columns, rows, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode("utf-8")
+
+
+def encode_ndjson(columns, rows, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), default=str))
+        if len(lines) >= batch_size:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Compress a byte stream incrementally into a single gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 selects the gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(view_name: str, export_format: str, after: Optional[int] = None, gzip: bool = False) -> Iterator[bytes]:
+    """Return the encoded byte stream for one view."""
+    columns = EXPORT_VIEWS[view_name]["columns"]
+    rows = iter_rows(view_name, after)
+    chunks = encode_csv(columns, rows) if export_format == "csv" else encode_ndjson(columns, rows)
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a bulk export to stdout.")
+    parser.add_argument("view", choices=sorted(EXPORT_VIEWS))
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--after", type=int, default=None, help="Resume after this key.")
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    for chunk in export_stream(args.view, args.format, args.after, args.gzip):
+        sys.stdout.buffer.write(chunk)
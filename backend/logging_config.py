@@ -0,0 +1,191 @@
+"""
+Structured logging that stays off the request path.
+
+Records are written as one JSON object per line. Every record carries the id
+of the request that produced it. Request threads only stamp the record with
+the request id, apply sampling and enqueue it. A `QueueListener` thread does
+the JSON formatting and the writes to stdout.
+
+Configuration (environment):
+    LOG_LEVEL            Root level (default INFO).
+    LOG_SAMPLE_RATES     Per-logger sampling of records below WARNING, e.g.
+                         "access=0.1,sqlalchemy.engine=0.05". A rate applies
+                         to that logger and its children.
+    LOG_SQL              "1" to start with SQL statement logging on; it can be
+                         toggled at runtime with POST /admin/logging/sql.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+LOG_SQL = os.getenv("LOG_SQL", "0") == "1"
+SQL_LOGGER = "sqlalchemy.engine"
+REQUEST_ID_HEADER = b"x-request-id"
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id", "sample_rate"}
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in spec.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if getattr(record, "sample_rate", 1.0) < 1.0:
+            entry["sample_rate"] = record.sample_rate
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _ContextFilter(logging.Filter):
+    """Stamps the request id and drops sampled-out records; runs in the calling thread, before enqueueing."""
+
+    def __init__(self, sample_rates: Dict[str, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+        self._rate_cache: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._rate_cache.get(name)
+        if rate is None:
+            rate, prefix = 1.0, name
+            while prefix:
+                if prefix in self.sample_rates:
+                    rate = self.sample_rates[prefix]
+                    break
+                prefix = prefix.rpartition(".")[0]
+            self._rate_cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            rate = self._rate(record.name)
+            if rate < 1.0:
+                if random.random() >= rate:
+                    return False
+                record.sample_rate = rate
+        record.request_id = _request_id.get()
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge the arguments into the message; JSON formatting happens on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging() -> None:
+    """Route all logging through a queue to a JSON stdout handler (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(log_queue)
+    handler.addFilter(_ContextFilter(parse_sample_rates(LOG_SAMPLE_RATES)))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    set_sql_logging(LOG_SQL)
+
+
+def shutdown_logging() -> None:
+    """Write out queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def set_sql_logging(enabled: bool) -> None:
+    """Turn SQL statement logging on or off; applies to connections opened afterwards."""
+    logging.getLogger(SQL_LOGGER).setLevel(logging.INFO if enabled else logging.WARNING)
+
+
+def sql_logging_enabled() -> bool:
+    return logging.getLogger(SQL_LOGGER).isEnabledFor(logging.INFO)
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware that assigns each request an id (or keeps a sane incoming
+    X-Request-ID), returns it in the response and writes one access record.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.access_log = logging.getLogger("access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER and 0 < len(value) <= 64 and value.isascii():
+                request_id = value.decode("ascii")
+        request_id = request_id or uuid.uuid4().hex
+        started = time.perf_counter()
+        status_code = None
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(REQUEST_ID_HEADER, request_id.encode("ascii"))]
+            await send(message)
+
+        token = _request_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            self.access_log.info(
+                "%s %s %s", scope["method"], scope["path"], status_code,
+                extra={"status_code": status_code, "duration_ms": round((time.perf_counter() - started) * 1000, 2)},
+            )
+            _request_id.reset(token)
@@ -1,38 +1,128 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Header, Query, Form, Request
+from pydantic import BaseModel, ValidationError
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from db import SessionLocal, init_db, User, FarmerDetails, LandlordDetails, Space, Crop
+from sqlalchemy.orm.attributes import flag_modified
+from db import SessionLocal, init_db, User, FarmerDetails, LandlordDetails, Space, Crop, CropTemplate, Proof
 from validators import * #validate_user_registration, validate_farmer_details, validate_landlord_details, is_admin, validate_user_login, FarmerDetailsRequest
-from security import create_access_token, create_refresh_token, verify_token, validate_token_from_header
+from security import create_access_token, create_refresh_token, verify_token, validate_token_from_header, validate_token_for_stream
+from security import revocation_list, rotate_refresh_token, REVOCATION_SYNC_SECONDS
 from typing import List
 from sqlalchemy.sql import func
 from pathlib import Path
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-import uuid
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from cache import entity_cache, etag_matches, row_to_dict
+from coalesce import single_flight, coalesce_key
+from templates import template_catalog, initial_step_state, merge_steps, all_steps_completed
+from typing import Optional
+import media_gc
+from storage import storage, StorageError, MEDIA_DIR
+from events import event_hub, space_channels
+import analytics
+import export
+import archive
+import audit
+import allocation
+import repository
+import sync
+import backup
+from logging_config import setup_logging, shutdown_logging, set_sql_logging, sql_logging_enabled, RequestIdMiddleware
+from profiling import ProfilingMiddleware, profile_store, instrument_routes, watch_session, is_profiling, profiled
+from sharding import shard_router, ensure_profiles_migrated, gather, profile_session_for, profile_exists_for_user, profile_user_ids, save_sharded_profile, delete_sharded_profile
+from datetime import date, datetime, timedelta
+import asyncio
+import logging
+
+# Structured JSON logs, formatted and written by a background thread
+setup_logging()
+logger = logging.getLogger(__name__)
+
 # Mount the 'media' directory to serve static files (image)
 # FastAPI app
 app = FastAPI()
 
-# Path where the media files will be stored
-MEDIA_DIR = Path(__file__).parent / "media"
-
-# Ensure the media directory exists
+# Local media files (sharded tree plus legacy flat uploads) are served from MEDIA_DIR
 MEDIA_DIR.mkdir(parents=True, exist_ok=True)
 app.mount("/media", StaticFiles(directory=MEDIA_DIR), name="media")
 
 # Dependency to get the DB session
 def get_db():
-    db = SessionLocal()
+    db = watch_session(SessionLocal())
     try:
         yield db
     finally:
         db.close()
 
+# Serve an entity from the read cache, loading it with `loader` on a miss
+def load_cached_entity(key, loader):
+    cached = entity_cache.get(key)
+    if cached is not None:
+        return cached
+    payload = loader()
+    if payload is None:
+        return None
+    payload = jsonable_encoder(payload)
+    return payload, entity_cache.set(key, payload)
+
+# Build a response carrying the ETag, answering If-None-Match with 304
+def entity_response(payload, etag: str, if_none_match: Optional[str]):
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=payload, headers=headers)
+
+# Run `fn(db)` with a short-lived session (for startup, shutdown and background tasks)
+def with_session(fn):
+    db = watch_session(SessionLocal())
+    try:
+        return fn(db)
+    finally:
+        db.close()
+
+async def sync_revocations_periodically():
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        try:
+            await run_in_threadpool(with_session, revocation_list.sync)
+        except Exception:
+            logger.exception("Failed to sync revoked tokens")
+
 # Initialize the database
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    archive.init_archive_db()
+    if shard_router.enabled:
+        shard_router.init_shards()
+        ensure_profiles_migrated()
+    event_hub.bind(asyncio.get_running_loop())
+    instrument_routes(app)
+    audit.audit_log.start()
+    await run_in_threadpool(with_session, revocation_list.load)
+    asyncio.create_task(sync_revocations_periodically())
+    # Scheduled orphaned-media collection (disabled unless MEDIA_GC_INTERVAL_HOURS is set)
+    if media_gc.MEDIA_GC_INTERVAL_HOURS > 0:
+        asyncio.create_task(media_gc.run_periodically())
+    # Scheduled online backups (disabled unless BACKUP_INTERVAL_HOURS is set)
+    if backup.BACKUP_INTERVAL_HOURS > 0:
+        asyncio.create_task(backup.run_periodically())
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Persist revocations made since the last sync
+    try:
+        with_session(revocation_list.sync)
+    except Exception:
+        logger.exception("Failed to sync revoked tokens")
+    # Write audit entries still buffered
+    audit.audit_log.stop()
+    # Write log records still queued
+    shutdown_logging()
 
 # Add CORS middleware
 app.add_middleware(
@@ -43,6 +133,15 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+# Admin-only per-request profiling (X-Profile: 1 or ?profile=1)
+app.add_middleware(ProfilingMiddleware)
+
+# Audit trail of write requests (buffered, written in batches by a background thread)
+app.add_middleware(audit.AuditMiddleware)
+
+# Request ids for log records plus one access record per request (outermost, so it times everything)
+app.add_middleware(RequestIdMiddleware)
+
 # Route for user registration
 @app.post("/register")
 def register_user(user_details : RegisterRequest, db: Session = Depends(get_db)):
@@ -56,12 +155,147 @@ def register_user(user_details : RegisterRequest, db: Session = Depends(get_db))
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    audit.annotate(user_id=new_user.id, role=new_user.role)
     return {"id": new_user.id, "email": new_user.email, "role": new_user.role}
 
+def registration_response(user: User, profile=None) -> dict:
+    response = {"id": user.id, "email": user.email, "role": user.role}
+    if isinstance(profile, FarmerDetails):
+        response["farmer"] = {
+            "id": profile.id,
+            "phone_number": profile.phone_number,
+            "land_handling_capacity": profile.land_handling_capacity,
+            "preferred_locations": profile.preferred_locations,
+        }
+    if isinstance(profile, LandlordDetails):
+        response["landlord"] = {
+            "id": profile.id,
+            "phone_number": profile.phone_number,
+            "soil_type": profile.soil_type,
+            "acres": profile.acres,
+            "location": profile.location,
+            "images": profile.images_list,
+        }
+    return response
+
+# Only the unique index on users.email means "already registered"; other constraint failures are bugs
+def is_duplicate_email(error: IntegrityError) -> bool:
+    message = str(error.orig)
+    return "users.email" in message or "ix_users_email" in message
+
+# Route for one-shot registration: user, role details and land images in a single multipart request
+@app.post("/register/complete")
+def register_complete(
+    request: Request,
+    email: str = Form(...),
+    password: str = Form(...),
+    role: str = Form(...),
+    phone_number: Optional[str] = Form(None),
+    land_handling_capacity: Optional[int] = Form(None),
+    preferred_locations: Optional[str] = Form(None),  # Comma-separated
+    soil_type: Optional[str] = Form(None),
+    acres: Optional[int] = Form(None),
+    location: Optional[str] = Form(None),
+    files: List[UploadFile] = File(default=[]),
+    db: Session = Depends(get_db),
+):
+    """
+    Register a user together with their farmer or landlord details in one transaction.
+    When profiles are sharded the profile commits to its shard inside the open
+    app.db transaction, and is removed again if app.db then fails to commit.
+
+    Email uniqueness is enforced by the unique index on users.email (no separate
+    lookup), and everything is committed once. Uploaded images are removed again
+    if the registration fails, so no orphan users or files are left behind.
+
+    Returns:
+        dict: The new user and their role details.
+    """
+    if role not in ["admin", "farmer", "landlord"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid role")
+    if files and role != "landlord":
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only landlords can upload images")
+
+    # Validate role details before touching storage or the database
+    try:
+        if role == "farmer":
+            details = FarmerDetailsRequest(
+                phone_number=phone_number or None,
+                land_handling_capacity=land_handling_capacity,
+                preferred_locations=[loc.strip() for loc in (preferred_locations or "").split(",") if loc.strip()],
+            )
+            validate_farmer_details(details.land_handling_capacity)
+        elif role == "landlord":
+            details = LandlordDetailsRequest(
+                phone_number=phone_number or None, soil_type=soil_type, acres=acres, location=location,
+            )
+            validate_landlord_details(details.soil_type, details.acres, details.location, [])
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}"
+    stored_keys = []
+    sharded_profile = None
+
+    def undo():
+        db.rollback()
+        if sharded_profile is not None:
+            delete_sharded_profile(role, sharded_profile.id)
+        for key in stored_keys:
+            storage.delete(key)
+
+    try:
+        user = User(email=email, password=password, role=role)
+        profile = None
+        if role == "farmer":
+            profile = FarmerDetails(
+                phone_number=details.phone_number,
+                land_handling_capacity=details.land_handling_capacity,
+                preferred_locations=details.preferred_locations,
+            )
+        elif role == "landlord":
+            for file in files:
+                stored_keys.append(storage.save(file.filename, file.file))
+            profile = LandlordDetails(
+                phone_number=details.phone_number,
+                soil_type=details.soil_type,
+                acres=details.acres,
+                location=details.location,
+                images_list=[f"{base_url}{storage.url(key)}" for key in stored_keys],
+            )
+        db.add(user)
+        try:
+            db.flush()  # Assigns ids; a duplicate email fails here on the unique index
+        except IntegrityError as e:
+            if not is_duplicate_email(e):
+                raise
+            undo()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
+        if profile is not None:
+            profile.user_id = user.id
+            if shard_router.enabled:
+                save_sharded_profile(role, profile)
+                sharded_profile = profile
+            else:
+                db.add(profile)
+                db.flush()
+        response = registration_response(user, profile)
+        db.commit()
+        audit.annotate(user_id=user.id, role=user.role, profile_id=profile.id if profile is not None else None)
+    except HTTPException:
+        raise
+    except Exception:
+        undo()
+        raise
+
+    return response
+
 @app.post("/login")
 def login_user(user_details: LoginRequest, db: Session = Depends(get_db)):
     # Validate if the user exists
-    user = db.query(User).filter(User.email == user_details.email).first()
+    user = repository.get_user_by_email(db, user_details.email)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
@@ -89,44 +323,52 @@ def login_user(user_details: LoginRequest, db: Session = Depends(get_db)):
 
 # Route to refresh access token using the refresh token
 @app.post("/refresh-token")
-def refresh_token(refresh_token: str, db: Session = Depends(get_db)):
+def refresh_token(refresh_token: str):
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+    The presented refresh token is revoked (rotation); no database query is made.
+    """
+    return rotate_refresh_token(refresh_token)
+
+
+# Route to revoke a refresh token (logout)
+@app.post("/logout")
+def logout(refresh_token: str):
     payload = verify_token(refresh_token)
-    
-    if not payload:
+    if payload.get("type") != "refresh" or "jti" not in payload:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
-    
-    user_email = payload.get("sub")
-    user = db.query(User).filter(User.email == user_email).first()
-    
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-    
-    # Create a new access token
-    new_access_token = create_access_token(data={"sub": user.email})
-    
-    return {
-        "access_token": new_access_token,
-        "token_type": "bearer"
-    }
+    revocation_list.revoke(payload["jti"], datetime.utcfromtimestamp(payload["exp"]))
+    return {"message": "Logged out successfully"}
+
 
+# Run `compute(db)` once for identical concurrent requests, on a session no single request owns.
+# A profiled request computes on its own, so its profile holds its queries and stack samples.
+async def coalesced(key, compute):
+    if is_profiling():
+        return await run_in_threadpool(profiled(with_session), compute)
+    return await single_flight.run(key, lambda: run_in_threadpool(with_session, compute))
 
 # Dashboard API for stats (Total Farmers, Total Landlords, Total Spaces, etc.)
 @app.get("/dashboard")
-def dashboard_stats(user: dict = Depends(validate_token_from_header), db: Session = Depends(get_db)):
-    # Farmers and landlords counts
-    total_farmers = db.query(FarmerDetails).count()
-    total_landlords = db.query(LandlordDetails).count()
+async def dashboard_stats(user: dict = Depends(validate_token_from_header)):
+    return await coalesced(coalesce_key("dashboard", scope=user["role"]), compute_dashboard_stats)
+
+def compute_dashboard_stats(db: Session) -> dict:
+    # Farmers and landlords counts and acres, summed over every shard when profiles are sharded
+    def profile_totals(session):
+        farmers = session.query(func.count(FarmerDetails.id), func.coalesce(func.sum(FarmerDetails.land_handling_capacity), 0)).one()
+        landlords = session.query(func.count(LandlordDetails.id), func.coalesce(func.sum(LandlordDetails.acres), 0)).one()
+        return tuple(farmers) + tuple(landlords)
+
+    totals = gather(db, profile_totals)
+    total_farmers = sum(t[0] for t in totals)
+    total_land_handling_capacity_sum = sum(t[1] for t in totals)
+    total_landlords = sum(t[2] for t in totals)
+    total_landlord_acres_sum = sum(t[3] for t in totals)
 
     # Collaboration spaces count
     total_spaces = db.query(Space).count()
 
-    # Total acres calculation for farmers and landlords
-    total_land_handling_capacity = db.query(FarmerDetails.land_handling_capacity).all()
-    total_landlord_acres = db.query(LandlordDetails.acres).all()
-
-    total_land_handling_capacity_sum = sum([capacity[0] for capacity in total_land_handling_capacity])
-    total_landlord_acres_sum = sum([acre[0] for acre in total_landlord_acres])
-
     # Breakdown of crops in collaborations
     crop_stats = (
         db.query(Crop.crop_name, func.count(Crop.id))
@@ -145,61 +387,273 @@ def dashboard_stats(user: dict = Depends(validate_token_from_header), db: Sessio
     }
 
 
+# Analytics API: time series from the daily/monthly rollups (admins only)
+@app.get("/analytics")
+def get_analytics(
+    metric: str,
+    granularity: str = "day",
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    dimension: Optional[str] = None,
+    user: dict = Depends(validate_token_from_header),
+    db: Session = Depends(get_db),
+):
+    """
+    Return one value per bucket for a metric between `start` and `end` (inclusive).
+    Defaults to the last 30 days (or 12 months for monthly granularity).
+    Available metrics: registrations, farmer_capacity, landlord_acres, spaces, crops.
+    """
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can view analytics")
+    if metric not in analytics.METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric. Available: {', '.join(analytics.METRICS)}")
+    if granularity not in analytics.GRANULARITIES:
+        raise HTTPException(status_code=400, detail="Granularity must be 'day' or 'month'")
+
+    end = end or date.today()
+    start = start or (end - timedelta(days=29 if granularity == "day" else 365))
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    def read(session):
+        return analytics.query_rollups(session, metric, granularity, start, end, dimension)
+
+    results = [read(db)]
+    if shard_router.enabled and metric in analytics.PROFILE_METRICS:
+        # Profiles written since sharding was enabled are counted in their shards
+        results += shard_router.scatter(read)
+
+    return {
+        "metric": metric,
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "buckets": analytics.merge_buckets(results),
+    }
+
+
+# Bulk export API (admins only): streams a whole table or joined view
+@app.get("/export/{view}")
+def export_view(
+    view: str,
+    format: str = "csv",
+    after: Optional[int] = None,
+    gzip: bool = False,
+    user: dict = Depends(validate_token_from_header),
+):
+    """
+    Stream every row of a view as CSV or NDJSON with flat memory use.
+    Views: farmers, landlords, spaces, crops, proofs, space_crops (space -> crop -> proof).
+    `after` resumes after the given key; `gzip=true` compresses the stream.
+    """
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can export data")
+    if view not in export.EXPORT_VIEWS:
+        raise HTTPException(status_code=404, detail=f"Unknown export. Available: {', '.join(export.EXPORT_VIEWS)}")
+    if format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be 'csv' or 'ndjson'")
+
+    # A .gz file is the payload itself, not a transfer encoding clients would undo before saving
+    filename = f"{view}.{format}.gz" if gzip else f"{view}.{format}"
+    return StreamingResponse(
+        export.export_stream(view, format, after, gzip),
+        media_type="application/gzip" if gzip else export.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# Maximum number of ids accepted by the batch profile endpoints (keeps the IN list under SQLite's bound-parameter limit)
+BATCH_MAX_IDS = 500
+
+def batch_fetch_profiles(db: Session, model, ids: List[int], fields: Optional[str]):
+    """
+    Resolve many profile rows with a single IN query (one per shard when sharded).
+
+    Args:
+        db (Session): Database session.
+        model: FarmerDetails or LandlordDetails.
+        ids (List[int]): Requested row ids.
+        fields (str, optional): Comma-separated column names to return.
+
+    Returns:
+        tuple: (rows in request order, requested field names, ids that were not found).
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise HTTPException(status_code=400, detail="At least one id is required.")
+    if len(ids) > BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_IDS} ids can be requested at once.")
+
+    columns = {attr.key: attr for attr in model.__mapper__.column_attrs}
+    if fields:
+        requested = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in requested if name not in columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    else:
+        requested = list(columns)
+
+    # id and user_id are always selected: they drive lookup and authorization
+    selected = list(dict.fromkeys(["id", "user_id", *requested]))
+
+    def fetch(session, wanted):
+        return (
+            session.query(*[getattr(model, name) for name in selected])
+            .filter(model.id.in_(wanted))
+            .all()
+        )
+
+    if shard_router.enabled:
+        # One directory lookup, then one IN query per shard holding any of the ids
+        kind = "farmer" if model is FarmerDetails else "landlord"
+        by_region = {}
+        for row_id, region in shard_router.locate(db, kind, ids).items():
+            by_region.setdefault(region, []).append(row_id)
+        rows = []
+        for region, wanted in by_region.items():
+            shard = shard_router.session(region)
+            try:
+                rows.extend(fetch(shard, wanted))
+            finally:
+                shard.close()
+    else:
+        rows = fetch(db, ids)
+    found = {row.id: row for row in rows}
+    missing = [row_id for row_id in ids if row_id not in found]
+    return [found[row_id] for row_id in ids if row_id in found], requested, missing
+
+
+# API to get many farmers at once (same access rules as /farmers/{farmer_id})
+@app.get("/farmers/batch")
+def get_farmers_batch(
+    ids: List[int] = Query(...),
+    fields: Optional[str] = None,
+    user: dict = Depends(validate_token_from_header),
+    db: Session = Depends(get_db),
+):
+    """
+    Fetch details of several farmers with one query.
+    Only admins or the farmer themselves can access each row.
+    `fields` limits both the selected columns and the returned keys.
+    """
+    rows, requested, missing = batch_fetch_profiles(db, FarmerDetails, ids, fields)
+
+    # Authorization check
+    if user["role"] != "admin" and any(row.user_id != user["id"] for row in rows):
+        raise HTTPException(status_code=403, detail="You do not have access to this resource.")
+
+    return {
+        "farmers": [{name: getattr(row, name) for name in requested} for row in rows],
+        "missing": missing,
+    }
+
+
+# API to get many landlords at once (same access rules as /landlords/{landlord_id})
+@app.get("/landlords/batch")
+def get_landlords_batch(
+    ids: List[int] = Query(...),
+    fields: Optional[str] = None,
+    user: dict = Depends(validate_token_from_header),
+    db: Session = Depends(get_db),
+):
+    """
+    Fetch details of several landlords with one query.
+    Only admins or the landlord themselves can access each row.
+    `fields` limits both the selected columns and the returned keys.
+    """
+    rows, requested, missing = batch_fetch_profiles(db, LandlordDetails, ids, fields)
+
+    # Check if the requesting user is the landlord or admin
+    if user['role'] != 'admin' and not (
+        user['role'] == 'landlord' and all(row.user_id == user['id'] for row in rows)
+    ):
+        raise HTTPException(status_code=403, detail="You do not have permission to access this resource.")
+
+    return {
+        "landlords": [{name: getattr(row, name) for name in requested} for row in rows],
+        "missing": missing,
+    }
+
+
 # API to get single farmer details by ID (accessible only by the farmer themselves)
 @app.get("/farmers/{farmer_id}")
-def get_farmer_details(farmer_id: int, user: dict = Depends(validate_token_from_header), db: Session = Depends(get_db)):
+def get_farmer_details(
+    farmer_id: int,
+    user: dict = Depends(validate_token_from_header),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
     """
     Fetch details of a specific farmer by ID.
     Only admins or the farmer themselves can access this endpoint.
+    Responses carry an ETag; a matching If-None-Match gets a 304.
     """
-    # Fetch the farmer details
-    farmer = db.query(FarmerDetails).filter(FarmerDetails.id == farmer_id).first()
-    if not farmer:
+    # Fetch the farmer details (served from the entity cache when fresh)
+    def load_farmer():
+        with profile_session_for(db, "farmer", farmer_id) as session:
+            farmer = session.query(FarmerDetails).filter(FarmerDetails.id == farmer_id).first() if session else None
+            return row_to_dict(farmer) if farmer else None
+
+    cached = load_cached_entity(("farmer", farmer_id), load_farmer)
+    if not cached:
         raise HTTPException(status_code=404, detail="Farmer not found.")
+    farmer, etag = cached
 
     # Authorization check
-    if user["role"] != "admin" and farmer.user_id != user["id"]:
+    if user["role"] != "admin" and farmer["user_id"] != user["id"]:
         raise HTTPException(status_code=403, detail="You do not have access to this resource.")
 
-    return farmer
+    return entity_response(farmer, etag, if_none_match)
 
 
 
 
 # API to get single landlord details by ID (accessible only by the landlord themselves)
 @app.get("/landlords/{landlord_id}")
-def get_single_landlord(landlord_id: int, user: dict = Depends(validate_token_from_header), db: Session = Depends(get_db)):
-    landlord = db.query(LandlordDetails).filter(LandlordDetails.id == landlord_id).first()
+def get_single_landlord(
+    landlord_id: int,
+    user: dict = Depends(validate_token_from_header),
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    def load_landlord():
+        with profile_session_for(db, "landlord", landlord_id) as session:
+            landlord = session.query(LandlordDetails).filter(LandlordDetails.id == landlord_id).first() if session else None
+            return row_to_dict(landlord) if landlord else None
 
-    if not landlord:
+    cached = load_cached_entity(("landlord", landlord_id), load_landlord)
+    if not cached:
         raise HTTPException(status_code=404, detail="Landlord not found")
+    landlord, etag = cached
 
     # Check if the requesting user is the landlord or admin
-    if user['role'] == 'landlord' and user['id'] == landlord.user_id:
-        return landlord
+    if user['role'] == 'landlord' and user['id'] == landlord["user_id"]:
+        return entity_response(landlord, etag, if_none_match)
     elif user['role'] == 'admin':
-        return landlord
+        return entity_response(landlord, etag, if_none_match)
     else:
         raise HTTPException(status_code=403, detail="You do not have permission to access this resource.")
 
 
 
+# Every profile of one kind across the shards, as JSON-ready dicts ordered by id (shared by coalesced requests)
+def list_all_profiles(db: Session, model) -> list:
+    profiles = [profile for rows in gather(db, lambda session: session.query(model).all()) for profile in rows]
+    return jsonable_encoder(sorted(profiles, key=lambda profile: profile.id))
+
 # Route to get all farmers
 @app.get("/farmers")
-def get_all_farmers(user: dict = Depends(validate_token_from_header),db: Session = Depends(get_db)):
+async def get_all_farmers(user: dict = Depends(validate_token_from_header)):
     if user['role'] in ['admin']:
-
-        farmers = db.query(FarmerDetails).all()
-        return farmers
+        return await coalesced(coalesce_key("farmers", scope="admin"), lambda db: list_all_profiles(db, FarmerDetails))
     else:
         raise HTTPException(status_code=400, detail="You Dont have permission to access.")
 
 # Route to get all landlords
 @app.get("/landlords")
-def get_all_landlords(user: dict = Depends(validate_token_from_header),db: Session = Depends(get_db)):
+async def get_all_landlords(user: dict = Depends(validate_token_from_header)):
     if user['role'] in ['admin']:
-        landlords = db.query(LandlordDetails).all()
-        return landlords
+        return await coalesced(coalesce_key("landlords", scope="admin"), lambda db: list_all_profiles(db, LandlordDetails))
     else:
         raise HTTPException(status_code=400, detail="You Dont have permission to access.")
 
@@ -228,7 +682,7 @@ def register_farmer(
         )
 
     # Check if the user exists and is a farmer
-    user = db.query(User).filter(User.id == farmer_details.user_id).first()
+    user = repository.get_user(db, farmer_details.user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -242,8 +696,7 @@ def register_farmer(
         )
 
     # Check if farmer details already exist for this user
-    existing_farmer = db.query(FarmerDetails).filter(FarmerDetails.user_id == user.id).first()
-    if existing_farmer:
+    if profile_exists_for_user(db, "farmer", user.id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Farmer details already exist for this user."
@@ -262,9 +715,14 @@ def register_farmer(
         land_handling_capacity=farmer_details.land_handling_capacity,
         preferred_locations=farmer_details.preferred_locations,
     )
-    db.add(new_farmer)
-    db.commit()
-    db.refresh(new_farmer)
+    if shard_router.enabled:
+        save_sharded_profile("farmer", new_farmer)
+    else:
+        db.add(new_farmer)
+        db.commit()
+        db.refresh(new_farmer)
+    entity_cache.invalidate(("farmer", new_farmer.id))
+    audit.annotate(user_id=user.id, role=user.role, profile_id=new_farmer.id)
 
     # Return the farmer details
     return {
@@ -301,7 +759,7 @@ def register_landlord(
         )
 
     # Check if the user exists and is a landlord
-    user = db.query(User).filter(User.id == landlord_details.user_id).first()
+    user = repository.get_user(db, landlord_details.user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -315,8 +773,7 @@ def register_landlord(
         )
 
     # Check if landlord details already exist for this user
-    existing_landlord = db.query(LandlordDetails).filter(LandlordDetails.user_id == user.id).first()
-    if existing_landlord:
+    if profile_exists_for_user(db, "landlord", user.id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Landlord details already exist for this user."
@@ -351,9 +808,14 @@ def register_landlord(
         location=landlord_details.location,
         images_list=landlord_details.images,
     )
-    db.add(new_landlord)
-    db.commit()
-    db.refresh(new_landlord)
+    if shard_router.enabled:
+        save_sharded_profile("landlord", new_landlord)
+    else:
+        db.add(new_landlord)
+        db.commit()
+        db.refresh(new_landlord)
+    entity_cache.invalidate(("landlord", new_landlord.id))
+    audit.annotate(user_id=user.id, role=user.role, profile_id=new_landlord.id)
 
     # Return the landlord details
     return {
@@ -374,19 +836,20 @@ def register_landlord(
 
 # Route to get the number of spaces (connections) for a user
 @app.get("/user/{user_id}/collaborations")
-def get_user_collaborations(user_id: int, db: Session = Depends(get_db)):
+def get_user_collaborations(user_id: int, include_archived: bool = False, db: Session = Depends(get_db)):
     """
     Retrieve all collaborations associated with a specific farmer or landlord.
     
     Args:
         user_id (int): The ID of the farmer or landlord.
+        include_archived (bool): Also return finished spaces moved to the archive.
         db (Session): The database session.
     
     Returns:
         dict: Collaborations involving the user.
     """
     # Fetch the user by ID
-    user = db.query(User).filter(User.id == user_id).first()
+    user = repository.get_user(db, user_id)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
@@ -417,6 +880,10 @@ def get_user_collaborations(user_id: int, db: Session = Depends(get_db)):
         }
         for collab in collaborations
     ]
+    if include_archived:
+        collaboration_data += archive.get_archived_collaborations(
+            "farmer_id" if user.role == "farmer" else "landlord_id", user_id
+        )
 
     return {
         "user": {
@@ -425,77 +892,421 @@ def get_user_collaborations(user_id: int, db: Session = Depends(get_db)):
             "role": user.role,
         },
         "collaborations": collaboration_data,
-        "total_collaborations_count": len(collaborations),
+        "total_collaborations_count": len(collaboration_data),
     }
 
 
 @app.post("/admin/create-crop")
-def create_crop(crop_data: dict, db: Session = Depends(get_db)):
+def create_crop(crop_data: dict, user: dict = Depends(validate_token_from_header), db: Session = Depends(get_db)):
     """
-    Create a crop with its cultivation steps.
+    Create a crop from a shared crop template.
     crop_data example:
     {
         "crop_name": "Paddy",
         "duration": "120 days",
+        "space_id": 1,  # optional: attach the crop to a collaboration space
+
         "steps": [
             {"name": "Land Preparation", "description": "Prepare the field."},
             {"name": "Sowing", "description": "Plant the seeds."},
             ...
         ]
     }
+    Instead of crop_name, duration and steps, an existing "template_id" can be given.
+    Steps that match an existing template reuse it; otherwise a new template version is added.
+    Admins can create any crop; the farmer or landlord of a space can add crops to it.
     """
+    space = None
+    if crop_data.get("space_id") is not None:
+        space = db.query(Space).filter(Space.id == crop_data["space_id"]).first()
+        if not space:
+            raise HTTPException(status_code=404, detail="Space not found")
+    require_space_access(db, user, space)
+
+    if crop_data.get("template_id") is not None:
+        template = template_catalog.get(db, crop_data["template_id"])
+        if not template:
+            raise HTTPException(status_code=404, detail="Crop template not found")
+    else:
+        template = template_catalog.resolve(db, crop_data["crop_name"], crop_data["duration"], crop_data["steps"])
+
     crop = Crop(
-        crop_name=crop_data["crop_name"],
-        duration=crop_data["duration"],
-        steps=crop_data["steps"],  # Directly store steps as JSON
+        crop_name=template["crop_name"],
+        duration=template["duration"],
+        template_id=template["id"],
+        step_state=initial_step_state(len(template["steps"])),
+        space_id=space.id if space else None,
     )
     db.add(crop)
     db.commit()
     db.refresh(crop)
-    return {"message": "Crop created successfully", "crop_id": crop.id}
+    entity_cache.invalidate(("crop", crop.id))
+    audit.annotate(crop_id=crop.id, template_id=template["id"], space_id=crop.space_id)
+
+    if space:
+        event_hub.publish(space_channels(space.id, space_member_ids(db, space)), "crop_created", {
+            "space_id": space.id, "crop_id": crop.id, "name": crop.crop_name, "duration": crop.duration,
+        })
+    return {"message": "Crop created successfully", "crop_id": crop.id, "template_id": template["id"], "template_version": template["version"]}
+
+# Route to list the shared crop templates (every version)
+@app.get("/crop-templates")
+def list_crop_templates(crop_name: Optional[str] = None, db: Session = Depends(get_db)):
+    query = db.query(CropTemplate.id, CropTemplate.crop_name, CropTemplate.version, CropTemplate.duration)
+    if crop_name:
+        query = query.filter(CropTemplate.crop_name == crop_name)
+    return [
+        {"id": template_id, "crop_name": name, "version": version, "duration": duration}
+        for template_id, name, version, duration in query.order_by(CropTemplate.crop_name, CropTemplate.version)
+    ]
+
+# Route to get one crop template with its step definitions
+@app.get("/crop-templates/{template_id}")
+def get_crop_template(template_id: int, db: Session = Depends(get_db)):
+    template = template_catalog.get(db, template_id)
+    if not template:
+        raise HTTPException(status_code=404, detail="Crop template not found")
+    return template
+
+# Admin route to publish a crop template (a new version if the steps changed)
+@app.post("/admin/crop-templates")
+def create_crop_template(template_data: dict, user: dict = Depends(validate_token_from_header), db: Session = Depends(get_db)):
+    """
+    template_data example:
+    {"crop_name": "Paddy", "duration": "120 days", "steps": [{"name": "Sowing", "description": "Plant the seeds."}]}
+    """
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can manage crop templates")
+    template = template_catalog.resolve(db, template_data["crop_name"], template_data["duration"], template_data["steps"])
+    db.commit()
+    return template
+
+# Step definitions from the (cached) template, merged with one crop's progress and proofs
+def crop_steps(db: Session, crop: Crop) -> list:
+    template = template_catalog.get(db, crop.template_id) if crop.template_id else None
+    proofs = {}
+    for step_index, file_url in db.query(Proof.step_index, Proof.file_url).filter(Proof.crop_id == crop.id).order_by(Proof.id):
+        proofs.setdefault(step_index, []).append(file_url)
+    return merge_steps(template["steps"] if template else [], crop.step_state, proofs)
 
 @app.get("/crop/{crop_id}/steps")
-def get_crop_steps(crop_id: int, db: Session = Depends(get_db)):
+def get_crop_steps(
+    crop_id: int,
+    include_archived: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
     """
     Get the steps for a specific crop.
+    With include_archived=true, crops moved to the archive are returned too.
+    Responses carry an ETag; a matching If-None-Match gets a 304.
     """
-    crop = db.query(Crop).filter(Crop.id == crop_id).first()
-    if not crop:
+    def load_steps():
+        crop = repository.get_crop(db, crop_id)
+        if not crop:
+            return None
+        return {"crop_name": crop.crop_name, "template_id": crop.template_id, "steps": crop_steps(db, crop)}
+
+    def load_archived_steps():
+        crop = archive.get_archived_crop(crop_id)
+        return {"crop_name": crop.crop_name, "steps": crop.steps, "archived": True} if crop else None
+
+    cached = load_cached_entity(("crop", crop_id), load_steps)
+    if not cached and include_archived:
+        cached = load_cached_entity(("archived_crop", crop_id), load_archived_steps)
+    if not cached:
         raise HTTPException(status_code=404, detail="Crop not found")
 
-    return {"crop_name": crop.crop_name, "steps": crop.steps}
+    return entity_response(*cached, if_none_match)
 
 @app.post("/crop/{crop_id}/step/{step_index}/upload-proof")
 async def upload_proof(
     crop_id: int,
     step_index: int,
     files: List[UploadFile] = File(...),
+    user: dict = Depends(validate_token_from_header),
     db: Session = Depends(get_db)
 ):
     """
     Upload proof (images/videos) for a specific step in a crop.
+    Only admins and the farmer or landlord of the crop's space can upload.
     """
-    crop = db.query(Crop).filter(Crop.id == crop_id).first()
+    crop = repository.get_crop(db, crop_id)
     if not crop:
         raise HTTPException(status_code=404, detail="Crop not found")
+    require_space_access(db, user, crop.space)
 
-    if step_index >= len(crop.steps):
+    if not crop.step_state or not 0 <= step_index < len(crop.step_state):
         raise HTTPException(status_code=400, detail="Invalid step index")
 
-    # Save files to media directory and update the step with proof URLs
+    # Save files to media storage and record one Proof row per file
     proofs = []
     for file in files:
-        unique_filename = f"{uuid.uuid4().hex}_{file.filename}"
-        file_location = MEDIA_DIR / unique_filename
-        with open(file_location, "wb") as f:
-            f.write(await file.read())
+        key = await run_in_threadpool(storage.save, file.filename, file.file)
+        proofs.append(storage.url(key))
+    db.add_all([Proof(file_url=url, crop_id=crop_id, step_index=step_index) for url in proofs])
+
+    # Only the count is kept on the crop (in-place JSON changes must be flagged to be saved)
+    state = crop.step_state[step_index]
+    state["proof_count"] = state.get("proof_count", 0) + len(proofs)
+    flag_modified(crop, "step_state")
+    db.commit()
+    entity_cache.invalidate(("crop", crop_id))
+    audit.annotate(crop_id=crop_id, step_index=step_index, proofs=proofs)
+
+    if crop.space:
+        event_hub.publish(space_channels(crop.space_id, space_member_ids(db, crop.space)), "proof_uploaded", {
+            "space_id": crop.space_id, "crop_id": crop_id, "step_index": step_index, "proofs": proofs,
+        })
+    return {"message": "Proof uploaded successfully", "proofs": proofs}
+
+
+# Allowed values for a crop step's status
+STEP_STATUSES = ("pending", "in_progress", "completed")
+
+@app.post("/crop/{crop_id}/step/{step_index}/status")
+def update_step_status(
+    crop_id: int,
+    step_index: int,
+    status_update: dict,
+    user: dict = Depends(validate_token_from_header),
+    db: Session = Depends(get_db),
+):
+    """
+    Set the status of a crop step and refresh the space's progress summary.
+    Only admins and the farmer or landlord of the crop's space can change it.
+    status_update example: {"status": "completed"}
+    """
+    step_status = status_update.get("status")
+    if step_status not in STEP_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Status must be one of: {', '.join(STEP_STATUSES)}")
+
+    crop = repository.get_crop(db, crop_id)
+    if not crop:
+        raise HTTPException(status_code=404, detail="Crop not found")
+    require_space_access(db, user, crop.space)
 
-        proofs.append(f"/media/{unique_filename}")
+    if not crop.step_state or not 0 <= step_index < len(crop.step_state):
+        raise HTTPException(status_code=400, detail="Invalid step index")
+
+    crop.step_state[step_index]["status"] = step_status
+    flag_modified(crop, "step_state")
+    # Kept in step with the statuses so archival can find finished spaces in SQL
+    if all_steps_completed(crop.step_state):
+        crop.completed_at = crop.completed_at or datetime.utcnow()
+    else:
+        crop.completed_at = None
+
+    progress = None
+    if crop.space:
+        completed = sum(1 for state in crop.step_state if state.get("status") == "completed")
+        progress = {"completed_steps": completed, "total_steps": len(crop.step_state)}
+        crop.space.progress = {**(crop.space.progress or {}), str(crop.id): progress}
 
-    # Append proofs to the step
-    crop.steps[step_index].setdefault("proofs", []).extend(proofs)
     db.commit()
-    return {"message": "Proof uploaded successfully", "proofs": proofs}
+    entity_cache.invalidate(("crop", crop_id))
+
+    if crop.space:
+        event_hub.publish(space_channels(crop.space_id, space_member_ids(db, crop.space)), "progress", {
+            "space_id": crop.space_id, "crop_id": crop_id, "step_index": step_index,
+            "status": step_status, "progress": progress,
+        })
+    return {"message": "Step status updated", "status": step_status, "progress": progress}
+
+
+# User ids of a space's farmer and landlord (resolved through the shard directory when sharded)
+def space_member_ids(db: Session, space: Space) -> List[int]:
+    farmer = profile_user_ids(db, "farmer", [space.farmer_id]).get(space.farmer_id)
+    landlord = profile_user_ids(db, "landlord", [space.landlord_id]).get(space.landlord_id)
+    return [user_id for user_id in (farmer, landlord) if user_id is not None]
+
+# Only admins and the members of `space` may change it or publish to its channel (admins only when there is no space)
+def require_space_access(db: Session, user: dict, space: Optional[Space]) -> None:
+    if user["role"] == "admin":
+        return
+    if space is None or user["id"] not in space_member_ids(db, space):
+        raise HTTPException(status_code=403, detail="You do not have access to this resource.")
+
+def parse_last_event_id(last_event_id: Optional[str]) -> Optional[int]:
+    try:
+        return int(last_event_id) if last_event_id else None
+    except ValueError:
+        return None
+
+# Delta sync: rows the caller may see that changed since their cursor, in a compact columnar form
+@app.get("/sync")
+def sync_changes(
+    since: Optional[str] = None,
+    limit: int = Query(sync.SYNC_PAGE_SIZE, ge=1, le=5000),
+    user: dict = Depends(validate_token_from_header),
+    db: Session = Depends(get_db),
+):
+    """
+    Omit `since` for a full sync, then pass the returned `cursor` to get only later changes.
+    Apply `deleted` before `changes`; call again while `more` is true.
+    """
+    if user["role"] not in sync.SYNC_ROLES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Sync is not available for this role")
+    try:
+        return sync.changes_since(db, user, since, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+# Admin route to move finished spaces (with their crops and proofs) into the archive
+@app.post("/admin/archive")
+def archive_finished(dry_run: bool = False, user: dict = Depends(validate_token_from_header)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can archive spaces")
+    result = archive.archive_finished_spaces(dry_run=dry_run)
+    for crop_id in result.pop("archived_crop_ids"):
+        entity_cache.invalidate(("crop", crop_id))
+    return result
+
+
+# Admin route to allocate unassigned land to farmers with spare capacity (proposal unless commit=true)
+@app.post("/admin/allocate")
+def allocate_land(
+    commit: bool = False,
+    include_pairs: bool = False,
+    user: dict = Depends(validate_token_from_header),
+    db: Session = Depends(get_db),
+):
+    """
+    Run the allocation optimizer over every unassigned landlord and farmer.
+    Reports the utilization gained; with commit=true the proposed spaces are created.
+    """
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can allocate land")
+    result = allocation.run_allocation(db, commit=commit, admin_id=user["id"])
+    pairs = result.pop("pairs")
+    if commit:
+        for pair in pairs:
+            member_ids = [user_id for user_id in (pair["farmer_user_id"], pair["landlord_user_id"]) if user_id]
+            event_hub.publish(space_channels(pair["space_id"], member_ids), "space_created", {
+                "space_id": pair["space_id"], "farmer_id": pair["farmer_id"], "landlord_id": pair["landlord_id"],
+            })
+    if include_pairs:
+        result["pairs"] = [
+            {key: pair[key] for key in ("farmer_id", "landlord_id", "acres", "match", "space_id") if key in pair}
+            for pair in pairs
+        ]
+    return result
+
+# Admin route to page through the audit log, newest first (pass next_before as before for the next page)
+@app.get("/admin/audit")
+def get_audit_log(
+    user_id: Optional[int] = None,
+    path_prefix: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    before: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    user: dict = Depends(validate_token_from_header),
+    db: Session = Depends(get_db),
+):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can read the audit log")
+    page = audit.query_audit_log(db, user_id, path_prefix, since, until, before, limit)
+    page["buffer"] = audit.audit_log.stats()
+    return page
+
+# Admin routes to take an online backup of the databases and list completed backups
+@app.post("/admin/backups")
+def create_backup(user: dict = Depends(validate_token_from_header)):
+    """Snapshot every database while the server keeps running; reports duration and the longest writer stall."""
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can take backups")
+    try:
+        return backup.create_backup()
+    except backup.BackupError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+@app.get("/admin/backups")
+def list_backups(user: dict = Depends(validate_token_from_header)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can list backups")
+    return backup.list_backups()
+
+# Admin routes to check and toggle SQL statement logging at runtime
+class SqlLoggingRequest(BaseModel):
+    enabled: bool
+
+@app.get("/admin/logging/sql")
+def get_sql_logging(user: dict = Depends(validate_token_from_header)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can manage logging")
+    return {"enabled": sql_logging_enabled()}
+
+@app.post("/admin/logging/sql")
+def update_sql_logging(request: SqlLoggingRequest, user: dict = Depends(validate_token_from_header)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can manage logging")
+    set_sql_logging(request.enabled)
+    logger.warning("SQL logging %s by user %s", "enabled" if request.enabled else "disabled", user["id"])
+    return {"enabled": sql_logging_enabled()}
+
+# Admin routes to browse the most recent profiled requests
+@app.get("/admin/profiles")
+def list_profiles(user: dict = Depends(validate_token_from_header)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can view profiles")
+    return profile_store.list()
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: int, user: dict = Depends(validate_token_from_header)):
+    """Return one profile: SQL statements with timings, hottest functions and folded stacks."""
+    if user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can view profiles")
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+# Server-sent events for a collaboration space (crops, proofs and progress)
+@app.get("/spaces/{space_id}/events")
+def space_events(
+    space_id: int,
+    last_event_id: Optional[str] = Header(None),
+    user: dict = Depends(validate_token_for_stream),
+    db: Session = Depends(get_db),
+):
+    """
+    Stream updates for a space as text/event-stream.
+    Only admins and the space's farmer or landlord can subscribe.
+    Reconnecting clients resume from the Last-Event-ID header.
+    """
+    space = db.query(Space).filter(Space.id == space_id).first()
+    if not space:
+        raise HTTPException(status_code=404, detail="Space not found")
+
+    require_space_access(db, user, space)
+
+    return StreamingResponse(
+        event_hub.stream([f"space:{space_id}"], parse_last_event_id(last_event_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Server-sent events for everything touching one user's spaces
+@app.get("/user/{user_id}/events")
+def user_events(
+    user_id: int,
+    last_event_id: Optional[str] = Header(None),
+    user: dict = Depends(validate_token_for_stream),
+):
+    """
+    Stream updates for all spaces of a farmer or landlord as text/event-stream.
+    Only admins or the user themselves can subscribe.
+    """
+    if user["role"] != "admin" and user["id"] != user_id:
+        raise HTTPException(status_code=403, detail="You do not have access to this resource.")
+
+    return StreamingResponse(
+        event_hub.stream([f"user:{user_id}"], parse_last_event_id(last_event_id)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 
@@ -584,7 +1395,33 @@ async def upload_proof(
 #     return {"message": "Landlord details updated", "landlord_id": landlord.id}
 
 
-from fastapi import Request
+class PresignUploadRequest(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+
+# Route to get a presigned direct upload (S3 storage backend only)
+@app.post("/storage/presign-upload")
+def presign_upload(upload: PresignUploadRequest, user: dict = Depends(validate_token_from_header)):
+    """
+    Return a presigned POST so the client can upload a file straight to the bucket.
+    The returned `media_url` is what should be stored (e.g. in a landlord's images list).
+    """
+    if not storage.supports_direct_upload:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Direct uploads are not available; use /upload/images.")
+    try:
+        presigned = storage.presigned_upload(upload.filename, upload.content_type)
+    except StorageError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    presigned["media_url"] = storage.url(presigned["key"])
+    return presigned
+
+# Route to download stored media; redirects to a presigned URL so bytes bypass the API
+@app.get("/storage/{key:path}")
+def download_media(key: str):
+    try:
+        return RedirectResponse(storage.download_url(key), status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+    except StorageError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
 @app.post("/upload/images")
 async def upload_images(request: Request, files: List[UploadFile] = File(...)):
@@ -592,23 +1429,17 @@ async def upload_images(request: Request, files: List[UploadFile] = File(...)):
     Upload multiple images and return their URLs.
     The images are saved in the 'media' directory and accessible via URLs.
     """
-    print(f"Received files: {files}")  # Debugging input
+    logger.info("Uploading %s images", len(files))
     image_urls = []
+    base_url = f"{request.base_url.scheme}://{request.base_url.netloc}"
 
     for file in files:
         try:
-            # Generate a unique UUID for the file
-            unique_filename = f"{uuid.uuid4().hex}_{file.filename}"
-            
-            # Save the uploaded image to the 'media' directory with a unique name
-            file_location = MEDIA_DIR / unique_filename
-            with open(file_location, "wb") as f:
-                f.write(await file.read())
+            # Stream the upload into media storage under a unique sharded key
+            key = await run_in_threadpool(storage.save, file.filename, file.file)
 
             # Construct the URL for accessing the image
-            base_url = f"{request.base_url.scheme}://{request.base_url.netloc}"
-            image_url = f"{base_url}/media/{unique_filename}"
-            image_urls.append(image_url)
+            image_urls.append(f"{base_url}{storage.url(key)}")
         
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to upload {file.filename}: {str(e)}")
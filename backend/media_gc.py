@@ -0,0 +1,169 @@
+"""
+Garbage collector for media files that no row references any more.
+
+Uploads are stored before the registration or proof is committed, so
+abandoned sign-ups and retried uploads leave files behind. This module finds
+them in the configured storage backend and deletes or quarantines the ones
+older than a grace period (the grace period also protects uploads whose
+commit is still in flight).
+
+Usage (from the backend directory):
+    python media_gc.py --dry-run
+    python media_gc.py --grace-hours 48 --quarantine
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from typing import Iterable, List, Optional, Set
+
+from db import SessionLocal, LandlordDetails, Proof
+from storage import storage, key_from_url, QUARANTINE_DIR
+from archive import ArchiveSessionLocal, ArchivedCrop, ArchivedProof, init_archive_db
+from sharding import profile_sessions
+
+logger = logging.getLogger(__name__)
+
+MEDIA_GC_GRACE_HOURS = float(os.getenv("MEDIA_GC_GRACE_HOURS", "24"))  # Younger files are never touched
+MEDIA_GC_INTERVAL_HOURS = float(os.getenv("MEDIA_GC_INTERVAL_HOURS", "0"))  # 0 disables the scheduled task
+MEDIA_GC_QUARANTINE_DAYS = float(os.getenv("MEDIA_GC_QUARANTINE_DAYS", "7"))  # Quarantined files are purged after this
+MEDIA_GC_BATCH_SIZE = 1000  # Rows fetched per round trip while collecting references
+
+
+def _add_urls(referenced: Set[str], urls: Optional[Iterable[str]]) -> None:
+    for url in urls or []:
+        key = key_from_url(url)
+        if key:
+            referenced.add(key)
+
+
+def _add_step_proofs(referenced: Set[str], steps) -> None:
+    for step in steps or []:
+        if isinstance(step, dict):
+            _add_urls(referenced, step.get("proofs"))
+
+
+def _add_landlord_images(referenced: Set[str], sessions, batch_size: int) -> None:
+    for session in sessions:
+        for (images,) in session.query(LandlordDetails.images_list).yield_per(batch_size):
+            _add_urls(referenced, images)
+
+
+def collect_referenced(db, archive_db, batch_size: int = MEDIA_GC_BATCH_SIZE, profile_dbs: Optional[List] = None) -> Set[str]:
+    """
+    Build the set of storage keys referenced by the database (and its profile
+    shards, when enabled) and the archive.
+
+    Only the URL columns are selected and rows are streamed in batches, so
+    memory is bounded by the number of distinct referenced files.
+    `profile_dbs` replaces the live profile sessions (backups pass their snapshots).
+    """
+    referenced: Set[str] = set()
+
+    if profile_dbs is None:
+        with profile_sessions(db) as sessions:
+            _add_landlord_images(referenced, sessions, batch_size)
+    else:
+        _add_landlord_images(referenced, profile_dbs, batch_size)
+
+    for (file_url,) in db.query(Proof.file_url).yield_per(batch_size):
+        _add_urls(referenced, [file_url])
+
+    # Archived crops keep their proofs
+    for (steps,) in archive_db.query(ArchivedCrop.steps).yield_per(batch_size):
+        _add_step_proofs(referenced, steps)
+
+    for (file_url,) in archive_db.query(ArchivedProof.file_url).yield_per(batch_size):
+        _add_urls(referenced, [file_url])
+
+    return referenced
+
+
+def collect_garbage(grace_hours: float = MEDIA_GC_GRACE_HOURS, dry_run: bool = False, quarantine: bool = False) -> dict:
+    """
+    Delete (or quarantine) unreferenced media objects older than the grace period.
+
+    Args:
+        grace_hours (float): Minimum object age before it can be collected.
+        dry_run (bool): Only report what would be collected.
+        quarantine (bool): Quarantine orphans instead of deleting them.
+
+    Returns:
+        dict: Counters describing the run.
+    """
+    started = time.monotonic()
+    init_archive_db()
+    db, archive_db = SessionLocal(), ArchiveSessionLocal()
+    try:
+        referenced = collect_referenced(db, archive_db)
+    finally:
+        db.close()
+        archive_db.close()
+
+    cutoff = time.time() - grace_hours * 3600
+    stats = {"scanned": 0, "referenced": 0, "too_recent": 0, "orphaned": 0, "collected": 0, "bytes": 0, "errors": 0}
+
+    # The listing is streamed; stat is only taken for objects that turn out to be unreferenced
+    for obj in storage.iter_objects():
+        stats["scanned"] += 1
+        if obj.key in referenced:
+            stats["referenced"] += 1
+            continue
+        try:
+            size, modified = obj.stat()
+            if modified > cutoff:
+                stats["too_recent"] += 1
+                continue
+            stats["orphaned"] += 1
+            stats["bytes"] += size
+            if dry_run:
+                continue
+            if quarantine:
+                storage.quarantine(obj.key)
+            else:
+                storage.delete(obj.key)
+            stats["collected"] += 1
+        except Exception:
+            stats["errors"] += 1
+            logger.exception("Failed to collect media object %s", obj.key)
+
+    stats["duration_seconds"] = round(time.monotonic() - started, 3)
+    logger.info("Media GC finished (dry_run=%s): %s", dry_run, stats)
+    return stats
+
+
+def purge_quarantine(max_age_days: float = MEDIA_GC_QUARANTINE_DAYS) -> int:
+    """Permanently delete quarantined objects older than `max_age_days`."""
+    cutoff = time.time() - max_age_days * 86400
+    purged = 0
+    for obj in storage.iter_objects(quarantined=True):
+        try:
+            if obj.stat()[1] < cutoff:
+                storage.delete(obj.key, quarantined=True)
+                purged += 1
+        except Exception:
+            logger.exception("Failed to purge quarantined object %s", obj.key)
+    return purged
+
+
+async def run_periodically(interval_hours: float = MEDIA_GC_INTERVAL_HOURS):
+    """Background task: quarantine orphans every `interval_hours` and purge old quarantined objects."""
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            await asyncio.to_thread(collect_garbage, quarantine=True)
+            await asyncio.to_thread(purge_quarantine)
+        except Exception:
+            logger.exception("Scheduled media GC failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect media files no longer referenced by the database.")
+    parser.add_argument("--grace-hours", type=float, default=MEDIA_GC_GRACE_HOURS)
+    parser.add_argument("--dry-run", action="store_true", help="Report orphans without touching them.")
+    parser.add_argument("--quarantine", action="store_true", help=f"Quarantine orphans ({QUARANTINE_DIR} for local storage) instead of deleting.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(collect_garbage(args.grace_hours, dry_run=args.dry_run, quarantine=args.quarantine))
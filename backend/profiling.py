@@ -0,0 +1,281 @@
+"""
+On-demand profiling of single requests, for admins.
+
+An admin adds the `X-Profile: 1` header (or `?profile=1`) to a request. That
+request's endpoint then runs under a sampling profiler, and every SQL
+statement it executes is recorded with its duration. The result is kept in
+a ring buffer of recent profiles, browsable at `/admin/profiles`, and the
+response carries its id in `X-Profile-Id`.
+
+Nothing is installed globally. The sampler is a short-lived thread that only
+looks at the thread running the profiled endpoint. SQL listeners are attached
+to the profiled request's own connections. Requests without the flag pay one
+context-variable lookup.
+"""
+import asyncio
+import functools
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from security import validate_token_from_header
+
+PROFILE_HISTORY_SIZE = int(os.getenv("PROFILE_HISTORY_SIZE", "50"))  # Profiles kept in the ring buffer
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "2")) / 1000
+PROFILE_MAX_QUERIES = 500  # Statements recorded per request; the rest are only counted
+PROFILE_TOP_FUNCTIONS = 30
+
+_current_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("current_profile", default=None)
+
+
+class _Sampler(threading.Thread):
+    """Samples the stack of one thread at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stopped.set()
+        self.join()
+        return self.stacks
+
+
+class RequestProfile:
+    def __init__(self, profile_id: int, method: str, path: str, user_id: int):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.user_id = user_id
+        self.started_at = datetime.utcnow()
+        self.status_code: Optional[int] = None
+        self.duration_ms: Optional[float] = None
+        self.queries: List[dict] = []
+        self.query_count = 0
+        self.query_ms = 0.0
+        self.stacks: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add_query(self, statement: str, parameters, elapsed: float) -> None:
+        with self._lock:
+            self.query_count += 1
+            self.query_ms += elapsed * 1000
+            if len(self.queries) < PROFILE_MAX_QUERIES:
+                self.queries.append({
+                    "statement": statement,
+                    "parameters": repr(parameters)[:500],
+                    "duration_ms": round(elapsed * 1000, 3),
+                })
+
+    def add_samples(self, stacks: Counter) -> None:
+        with self._lock:
+            self.stacks.update(stacks)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "user_id": self.user_id,
+            "started_at": self.started_at,
+            "status_code": self.status_code,
+            "duration_ms": self.duration_ms,
+            "query_count": self.query_count,
+            "query_ms": round(self.query_ms, 3),
+        }
+
+    def report(self) -> dict:
+        """Summary plus SQL statements, hottest functions and folded stacks (flame graph input)."""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+        samples = sum(self.stacks.values())
+        return {
+            **self.summary(),
+            "queries": self.queries,
+            "profile": {
+                "sample_interval_ms": PROFILE_SAMPLE_INTERVAL * 1000,
+                "samples": samples,
+                "functions": [
+                    {"function": function, "total_samples": count, "own_samples": own[function]}
+                    for function, count in total.most_common(PROFILE_TOP_FUNCTIONS)
+                ],
+                "folded_stacks": [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()],
+            },
+        }
+
+
+class ProfileStore:
+    """Ring buffer of the most recent request profiles."""
+
+    def __init__(self, size: int = PROFILE_HISTORY_SIZE):
+        self._profiles: deque = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, method: str, path: str, user_id: int) -> RequestProfile:
+        return RequestProfile(next(self._ids), method, path, user_id)
+
+    def add(self, profile: RequestProfile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._profiles)]
+
+    def get(self, profile_id: int) -> Optional[dict]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile.id == profile_id:
+                    return profile.report()
+        return None
+
+
+profile_store = ProfileStore()
+
+
+# SQL capture: listeners live on the profiled request's connections only
+
+def _watch_connection(profile: RequestProfile):
+    def after_begin(session, transaction, connection):
+        # Sessions check out a new Connection per transaction, so these listeners go away with it
+        starts = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            starts.append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if starts:
+                profile.add_query(statement, parameters, time.perf_counter() - starts.pop())
+
+        event.listen(connection, "before_cursor_execute", before_cursor_execute)
+        event.listen(connection, "after_cursor_execute", after_cursor_execute)
+    return after_begin
+
+
+def watch_session(db: Session) -> Session:
+    """Record the SQL of `db` if it was opened by a profiled request."""
+    profile = _current_profile.get()
+    if profile is not None:
+        event.listen(db, "after_begin", _watch_connection(profile))
+    return db
+
+
+# Endpoint wrapping: sample the thread that runs a profiled endpoint
+
+def is_profiling() -> bool:
+    """True while running on behalf of a profiled request."""
+    return _current_profile.get() is not None
+
+
+def profiled(call):
+    """Wrap `call` so the thread running it is sampled when it runs for a profiled request."""
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def async_wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return await call(*args, **kwargs)
+            sampler = _Sampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+            sampler.start()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                profile.add_samples(sampler.stop())
+        return async_wrapper
+
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return call(*args, **kwargs)
+        sampler = _Sampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+        sampler.start()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            profile.add_samples(sampler.stop())
+    return wrapper
+
+
+def instrument_routes(app) -> None:
+    """Wrap every endpoint of `app` so it can be profiled (call once all routes are declared, e.g. on startup)."""
+    for route in app.routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is not None and dependant.call is not None and not getattr(dependant.call, "profiled", False):
+            dependant.call = profiled(dependant.call)
+            dependant.call.profiled = True
+
+
+def _requested_profile(scope) -> Optional[Dict[str, str]]:
+    headers = dict(scope["headers"])
+    flag = headers.get(b"x-profile")
+    if flag is None and b"profile=" in scope.get("query_string", b""):
+        query = dict(pair.split(b"=", 1) for pair in scope["query_string"].split(b"&") if b"=" in pair)
+        flag = query.get(b"profile")
+    if flag not in (b"1", b"true"):
+        return None
+    authorization = headers.get(b"authorization")
+    try:
+        payload = validate_token_from_header(authorization.decode("latin-1") if authorization else None)
+    except Exception:
+        return None
+    return payload if payload.get("role") == "admin" else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that starts a profile for flagged admin requests."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (b"profile" not in scope.get("query_string", b"") and not any(name == b"x-profile" for name, _ in scope["headers"])):
+            return await self.app(scope, receive, send)
+        user = _requested_profile(scope)
+        if user is None:
+            return await self.app(scope, receive, send)
+
+        profile = profile_store.start(scope["method"], scope["path"], user["id"])
+        started = time.perf_counter()
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", str(profile.id).encode())]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _current_profile.reset(token)
+            profile.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            profile_store.add(profile)
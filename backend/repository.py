@@ -0,0 +1,43 @@
+"""
+Pre-built statements for the hot single-row lookups.
+
+`db.query(Model).filter(Model.col == value).first()` builds a new Query, a new
+criterion and a new LIMIT on every call. SQLAlchemy then walks that fresh
+statement to compute its cache key before it can reuse the compiled SQL.
+The statements here are 2.0-style `select`s with named bound parameters,
+built once at import. A lookup only supplies the values, and the compiled
+form is found in the engine's statement cache under the same key every time.
+
+`python bench_lookups.py` compares the per-call cost of the two forms.
+"""
+from typing import Optional
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.orm import Session
+
+from db import User, FarmerDetails, LandlordDetails, Crop
+
+_user_by_email = select(User).where(User.email == bindparam("email")).limit(1)
+_user_by_id = select(User).where(User.id == bindparam("id"))
+_profile_by_user_id = {
+    kind: select(model).where(model.user_id == bindparam("user_id")).limit(1)
+    for kind, model in (("farmer", FarmerDetails), ("landlord", LandlordDetails))
+}
+_crop_by_id = select(Crop).where(Crop.id == bindparam("id"))
+
+
+def get_user_by_email(db: Session, email: str) -> Optional[User]:
+    return db.execute(_user_by_email, {"email": email}).scalars().first()
+
+
+def get_user(db: Session, user_id: int) -> Optional[User]:
+    return db.execute(_user_by_id, {"id": user_id}).scalars().first()
+
+
+def get_profile_by_user_id(db: Session, kind: str, user_id: int):
+    """The user's FarmerDetails (`kind="farmer"`) or LandlordDetails (`kind="landlord"`) row, if any."""
+    return db.execute(_profile_by_user_id[kind], {"user_id": user_id}).scalars().first()
+
+
+def get_crop(db: Session, crop_id: int) -> Optional[Crop]:
+    return db.execute(_crop_by_id, {"id": crop_id}).scalars().first()
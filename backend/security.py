@@ -1,15 +1,27 @@
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from typing import Optional
-from db import User
-from fastapi import Header, HTTPException, status
+from typing import Dict, List, Optional, Tuple
+from db import User, RevokedToken
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+import logging
+import threading
+import uuid
+from fastapi import Header, HTTPException, Query, status
+
+logger = logging.getLogger(__name__)
 
 # Secret key to encode and decode JWT
 SECRET_KEY = "your_secret_key_here"  # You can store this in an environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30  # Access token expiration time
 REFRESH_TOKEN_EXPIRE_DAYS = 7  # Refresh token expiration time
+REVOCATION_SYNC_SECONDS = 5  # How often revocations are persisted and other workers' revocations picked up
+
+# Claims copied from a refresh token into the access tokens it issues
+TOKEN_CLAIMS = ("id", "email", "role")
 
 # Password Context for hashing passwords
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -29,7 +41,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "type": "access"})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -40,7 +52,8 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None)
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+    # Each refresh token carries a unique id so it can be rotated and revoked
+    to_encode.update({"exp": expire, "type": "refresh", "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -48,12 +61,20 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None)
 def verify_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        print("PAYLOAD : ",payload)
+        logger.debug("Verified %s token for user %s", payload.get("type", "access"), payload.get("id"))
         return payload
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token or Token Expired")
 
 
+# Read a token's claims without failing on expiry (for attributing past requests, never for access)
+def peek_token(token: str) -> Optional[dict]:
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False})
+    except JWTError:
+        return None
+
+
 # Function to extract the token from the Authorization header
 def validate_token_from_header(authorization: str = Header(None)):
     if authorization is None:
@@ -62,6 +83,114 @@ def validate_token_from_header(authorization: str = Header(None)):
     if not authorization.startswith(token_prefix):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token prefix")
     payload = verify_token(authorization[len(token_prefix):])
+    if payload.get("type") == "refresh":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh tokens cannot be used for API access")
     if "id" not in payload:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token missing user ID")
-    return payload
\ No newline at end of file
+    return payload
+
+
+# Same as validate_token_from_header, but also accepts the token as an `access_token`
+# query parameter because browser EventSource connections cannot set headers
+def validate_token_for_stream(authorization: str = Header(None), access_token: Optional[str] = Query(None)):
+    if authorization is None and access_token is not None:
+        authorization = f"Bearer {access_token}"
+    return validate_token_from_header(authorization)
+
+
+
+class RevocationList:
+    """
+    In-memory set of revoked refresh token ids, persisted to `revoked_tokens`.
+
+    Checks never touch the database. New revocations are written in batches by
+    `sync` (run every REVOCATION_SYNC_SECONDS and on shutdown), which also
+    picks up revocations made by other workers and drops expired entries.
+    """
+
+    def __init__(self):
+        self._revoked: Dict[str, datetime] = {}
+        self._pending: List[Tuple[str, datetime]] = []
+        self._last_seen: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def load(self, db: Session) -> None:
+        """Purge expired rows and load the rest (called on startup)."""
+        now = datetime.utcnow()
+        db.query(RevokedToken).filter(RevokedToken.expires_at < now).delete()
+        db.commit()
+        rows = db.query(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at).all()
+        with self._lock:
+            self._revoked = {jti: expires_at for jti, expires_at, _ in rows}
+            self._last_seen = max((revoked_at for _, _, revoked_at in rows), default=now)
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def revoke(self, jti: str, expires_at: datetime) -> bool:
+        """Revoke a token id; returns False if it was already revoked."""
+        with self._lock:
+            if jti in self._revoked:
+                return False
+            self._revoked[jti] = expires_at
+            self._pending.append((jti, expires_at))
+            return True
+
+    def sync(self, db: Session) -> None:
+        """Persist pending revocations, load ones made elsewhere and forget expired ids."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            last_seen = self._last_seen
+        now = datetime.utcnow()
+        try:
+            if pending:
+                # Another worker may have persisted the same jti already; keep its row
+                insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+                db.execute(insert(RevokedToken.__table__).values([
+                    {"jti": jti, "expires_at": expires_at, "revoked_at": now} for jti, expires_at in pending
+                ]).on_conflict_do_nothing(index_elements=["jti"]))
+            db.query(RevokedToken).filter(RevokedToken.expires_at < now).delete()
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Keep the batch for the next sync rather than losing the revocations
+            with self._lock:
+                self._pending = pending + self._pending
+            raise
+
+        query = db.query(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at)
+        if last_seen is not None:
+            # Overlap the window so rows committed late by other workers are not missed
+            query = query.filter(RevokedToken.revoked_at > last_seen - timedelta(seconds=REVOCATION_SYNC_SECONDS))
+        rows = query.all()
+        with self._lock:
+            for jti, expires_at, revoked_at in rows:
+                self._revoked[jti] = expires_at
+                self._last_seen = max(self._last_seen or revoked_at, revoked_at)
+            for jti in [jti for jti, expires_at in self._revoked.items() if expires_at < now]:
+                del self._revoked[jti]
+
+
+# Process-wide revocation list used by /refresh-token and /logout
+revocation_list = RevocationList()
+
+
+def rotate_refresh_token(refresh_token: str) -> dict:
+    """
+    Validate a refresh token, revoke it and issue a new access/refresh token pair.
+    The new tokens carry the full claim set of the original login.
+    """
+    payload = verify_token(refresh_token)
+    if payload.get("type") != "refresh" or "jti" not in payload or any(claim not in payload for claim in TOKEN_CLAIMS):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+
+    expires_at = datetime.utcfromtimestamp(payload["exp"])
+    if not revocation_list.revoke(payload["jti"], expires_at):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token has been revoked")
+
+    claims = {claim: payload[claim] for claim in TOKEN_CLAIMS}
+    return {
+        "access_token": create_access_token(data=claims),
+        "refresh_token": create_refresh_token(data=claims),
+        "token_type": "bearer",
+    }
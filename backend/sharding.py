@@ -0,0 +1,372 @@
+"""
+Optional region-based sharding of farmer and landlord profiles.
+
+When SHARD_REGIONS is set (e.g. "north,south,east,west"), FarmerDetails and
+LandlordDetails rows live in one SQLite file per region, so profile writes
+from different regions no longer queue behind SQLite's single writer lock.
+Writing a profile only touches its shard: the id comes from the shard's own
+`shard_sequences` row and the analytics rollups of the profile are kept in
+the shard, so app.db's write lock is never taken. Users, spaces, crops and
+proofs stay in `app.db`. Admin aggregates scatter the query to every shard in
+parallel and gather the results.
+
+Profile ids are `local * SHARD_ID_STRIDE + slot`, where `slot` is the
+region's position in SHARD_REGIONS, so they are unique across shards and the
+region can be read back from the id. Keep the order of SHARD_REGIONS and add
+new regions at the end. Profiles moved out of app.db keep their old ids;
+app.db's `shard_directory` records where they went.
+
+A landlord's region comes from `location`; a farmer's from the first of
+their `preferred_locations` that maps to a region. Locations are matched
+against SHARD_REGION_MAP (JSON keyword -> region) or the built-in map of
+Indian states; anything unmatched goes to the first configured region.
+
+Existing profiles are moved into their shards with the command below; the
+server will not start sharded until app.db holds no profiles:
+    python sharding.py migrate
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+import analytics
+import versioning
+from repository import get_profile_by_user_id
+from profiling import watch_session
+from db import (
+    Base, SessionLocal, FarmerDetails, LandlordDetails, ShardDirectory, ShardSequence, SyncClock, SyncTombstone,
+    DailyRollup, MonthlyRollup,
+)
+
+SHARD_REGIONS = [region.strip() for region in os.getenv("SHARD_REGIONS", "").split(",") if region.strip()]
+SHARD_DATABASE_URL_TEMPLATE = os.getenv("SHARD_DATABASE_URL_TEMPLATE", "sqlite:///./app_{region}.db")
+SHARD_ID_STRIDE = int(os.getenv("SHARD_ID_STRIDE", "100"))  # Upper bound on regions; an id's remainder is its region slot
+
+# Built-in location keyword -> region map (Indian states and union territories)
+DEFAULT_REGION_MAP = {
+    "jammu": "north", "kashmir": "north", "ladakh": "north", "himachal": "north", "punjab": "north",
+    "chandigarh": "north", "haryana": "north", "delhi": "north", "uttarakhand": "north", "uttar pradesh": "north",
+    "rajasthan": "west", "gujarat": "west", "maharashtra": "west", "goa": "west",
+    "madhya pradesh": "central", "chhattisgarh": "central",
+    "bihar": "east", "jharkhand": "east", "odisha": "east", "west bengal": "east",
+    "assam": "northeast", "meghalaya": "northeast", "tripura": "northeast", "mizoram": "northeast",
+    "manipur": "northeast", "nagaland": "northeast", "arunachal": "northeast", "sikkim": "northeast",
+    "andhra": "south", "telangana": "south", "karnataka": "south", "tamil nadu": "south",
+    "kerala": "south", "puducherry": "south",
+}
+REGION_MAP = json.loads(os.getenv("SHARD_REGION_MAP", "null")) or DEFAULT_REGION_MAP
+
+PROFILE_MODELS = {"farmer": FarmerDetails, "landlord": LandlordDetails}
+
+
+class ShardRouter:
+    def __init__(self, regions: List[str], url_template: str = SHARD_DATABASE_URL_TEMPLATE, region_map: Dict[str, str] = REGION_MAP):
+        if len(regions) > SHARD_ID_STRIDE:
+            raise ValueError(f"At most {SHARD_ID_STRIDE} regions are supported (SHARD_ID_STRIDE)")
+        self.regions = regions
+        self.enabled = bool(regions)
+        self.region_map = {keyword.lower(): region for keyword, region in region_map.items()}
+        self._sessionmakers = {}
+        for region in regions:
+            engine = create_engine(url_template.format(region=region), connect_args={"check_same_thread": False})
+            self._sessionmakers[region] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+            versioning.watch(self._sessionmakers[region])
+            analytics.watch(self._sessionmakers[region])
+
+    def init_shards(self) -> None:
+        """
+        Create the profile, sequence, sync and rollup tables in every shard, and
+        start each shard's sequences above the ids still stored in (or moved out of) app.db.
+        """
+        floors = self._legacy_id_floors()
+        for maker in self._sessionmakers.values():
+            Base.metadata.create_all(bind=maker.kw["bind"], tables=[
+                FarmerDetails.__table__, LandlordDetails.__table__, ShardSequence.__table__,
+                SyncClock.__table__, SyncTombstone.__table__, DailyRollup.__table__, MonthlyRollup.__table__,
+            ])
+            versioning.add_row_version_columns(maker.kw["bind"], PROFILE_MODELS.values())
+            shard = maker()
+            try:
+                for kind, highest in floors.items():
+                    first_local = highest // SHARD_ID_STRIDE + 1
+                    sequence = shard.get(ShardSequence, kind)
+                    if sequence is None:
+                        shard.add(ShardSequence(kind=kind, next_id=first_local))
+                    elif sequence.next_id < first_local:
+                        sequence.next_id = first_local
+                shard.commit()
+            finally:
+                shard.close()
+
+    @staticmethod
+    def _legacy_id_floors() -> Dict[str, int]:
+        """Highest profile id per kind in app.db or its directory; shard ids start above it."""
+        db = SessionLocal()
+        try:
+            floors = {}
+            for kind, model in PROFILE_MODELS.items():
+                stored = db.query(func.max(model.id)).scalar() or 0
+                moved = db.query(func.max(ShardDirectory.profile_id)).filter(ShardDirectory.kind == kind).scalar() or 0
+                floors[kind] = max(stored, moved)
+            return floors
+        finally:
+            db.close()
+
+    # Region resolution
+
+    def region_for_location(self, location: Optional[str]) -> Optional[str]:
+        text = (location or "").lower()
+        for keyword, region in self.region_map.items():
+            if keyword in text and region in self._sessionmakers:
+                return region
+        return None
+
+    def region_for_landlord(self, location: Optional[str]) -> str:
+        return self.region_for_location(location) or self.regions[0]
+
+    def region_for_farmer(self, preferred_locations: Optional[Iterable[str]]) -> str:
+        for location in preferred_locations or []:
+            region = self.region_for_location(location)
+            if region:
+                return region
+        return self.regions[0]
+
+    # Sessions
+
+    def session(self, region: str) -> Session:
+        return watch_session(self._sessionmakers[region]())
+
+    def engines(self) -> Dict[str, Engine]:
+        return {region: maker.kw["bind"] for region, maker in self._sessionmakers.items()}
+
+    def allocate_id(self, shard: Session, kind: str, region: str) -> int:
+        """
+        Reserve a profile id in `region` inside the shard's own transaction.
+        The sequence UPDATE takes the shard's write lock, so concurrent
+        allocations in one region are serialized and other regions are not involved.
+        """
+        updated = shard.query(ShardSequence).filter(ShardSequence.kind == kind).update(
+            {ShardSequence.next_id: ShardSequence.next_id + 1}, synchronize_session=False
+        )
+        if not updated:
+            shard.add(ShardSequence(kind=kind, next_id=2))
+            shard.flush()
+            local_id = 1
+        else:
+            local_id = shard.query(ShardSequence.next_id).filter(ShardSequence.kind == kind).scalar() - 1
+        return local_id * SHARD_ID_STRIDE + self.regions.index(region)
+
+    def region_for_id(self, profile_id: int) -> Optional[str]:
+        """Region encoded in an id handed out by `allocate_id`."""
+        slot = profile_id % SHARD_ID_STRIDE
+        return self.regions[slot] if slot < len(self.regions) else None
+
+    def locate(self, db: Session, kind: str, ids: Iterable[int]) -> Dict[int, str]:
+        """Map profile ids to regions: the directory for profiles moved out of app.db, the id itself otherwise."""
+        ids = list(ids)
+        if not ids:
+            return {}
+        moved = dict(db.query(ShardDirectory.profile_id, ShardDirectory.region).filter(
+            ShardDirectory.kind == kind, ShardDirectory.profile_id.in_(ids)
+        ).all())
+        located = {}
+        for profile_id in ids:
+            region = moved.get(profile_id) or self.region_for_id(profile_id)
+            if region is not None:
+                located[profile_id] = region
+        return located
+
+    def scatter(self, fn: Callable[[Session], object], regions: Optional[Iterable[str]] = None) -> List[object]:
+        """Run `fn(session)` on every (or the given) shard in parallel and return the results."""
+        regions = list(regions if regions is not None else self.regions)
+        # Sessions are opened here so they see the caller's context (e.g. an active request profile)
+        sessions = [self.session(region) for region in regions]
+
+        def run(db):
+            try:
+                return fn(db)
+            finally:
+                db.close()
+
+        if len(sessions) == 1:
+            return [run(sessions[0])]
+        with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+            return list(pool.map(run, sessions))
+
+
+shard_router = ShardRouter(SHARD_REGIONS)
+
+
+@contextmanager
+def profile_sessions(db: Session) -> Iterator[List[Session]]:
+    """
+    Sessions holding profile rows: `db` itself when sharding is off, otherwise
+    one session per shard (closed on exit).
+    """
+    if not shard_router.enabled:
+        yield [db]
+        return
+    sessions = [shard_router.session(region) for region in shard_router.regions]
+    try:
+        yield sessions
+    finally:
+        for session in sessions:
+            session.close()
+
+
+@contextmanager
+def profile_session_for(db: Session, kind: str, profile_id: int) -> Iterator[Optional[Session]]:
+    """Session holding one profile row (None if the directory does not know the id)."""
+    if not shard_router.enabled:
+        yield db
+        return
+    region = shard_router.locate(db, kind, [profile_id]).get(profile_id)
+    if region is None:
+        yield None
+        return
+    session = shard_router.session(region)
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def gather(db: Session, fn: Callable[[Session], object]) -> List[object]:
+    """Run `fn` against every session holding profiles: `[fn(db)]`, or scatter-gather over the shards."""
+    if not shard_router.enabled:
+        return [fn(db)]
+    return shard_router.scatter(fn)
+
+
+def profile_id_for_user(db: Session, kind: str, user_id: int) -> Optional[int]:
+    """Id of the user's profile of `kind` (asking every shard when sharded), or None."""
+    if shard_router.enabled:
+        model = PROFILE_MODELS[kind]
+        found = shard_router.scatter(lambda session: session.query(model.id).filter(model.user_id == user_id).scalar())
+        return next((profile_id for profile_id in found if profile_id is not None), None)
+    profile = get_profile_by_user_id(db, kind, user_id)
+    return profile.id if profile else None
+
+
+def profile_exists_for_user(db: Session, kind: str, user_id: int) -> bool:
+    return profile_id_for_user(db, kind, user_id) is not None
+
+
+def save_sharded_profile(kind: str, profile) -> None:
+    """
+    Insert a new profile into its regional shard.
+
+    The id, the profile row and its rollups are written in one shard
+    transaction; that commit is the only write, so app.db is not touched.
+    """
+    if kind == "farmer":
+        region = shard_router.region_for_farmer(profile.preferred_locations)
+    else:
+        region = shard_router.region_for_landlord(profile.location)
+
+    shard = shard_router.session(region)
+    try:
+        profile.id = shard_router.allocate_id(shard, kind, region)
+        shard.add(profile)
+        shard.commit()
+        shard.refresh(profile)
+        shard.expunge(profile)
+    except Exception:
+        shard.rollback()
+        raise
+    finally:
+        shard.close()
+
+
+def delete_sharded_profile(kind: str, profile_id: int) -> None:
+    """Remove a profile written by `save_sharded_profile` whose app.db side failed to commit."""
+    region = shard_router.region_for_id(profile_id)
+    if region is None:
+        return
+    shard = shard_router.session(region)
+    try:
+        profile = shard.get(PROFILE_MODELS[kind], profile_id)
+        if profile is not None:
+            shard.delete(profile)
+            shard.commit()
+    finally:
+        shard.close()
+
+
+def profile_user_ids(db: Session, kind: str, ids: Iterable[int]) -> Dict[int, int]:
+    """Map profile ids to their user ids (reading the shards that hold them when sharded)."""
+    ids = [profile_id for profile_id in ids if profile_id is not None]
+    if not ids:
+        return {}
+    model = PROFILE_MODELS[kind]
+    if not shard_router.enabled:
+        return dict(db.query(model.id, model.user_id).filter(model.id.in_(ids)).all())
+    regions = set(shard_router.locate(db, kind, ids).values())
+    rows = shard_router.scatter(lambda session: session.query(model.id, model.user_id).filter(model.id.in_(ids)).all(), regions)
+    return {profile_id: user_id for found in rows for profile_id, user_id in found}
+
+
+def ensure_profiles_migrated() -> None:
+    """
+    Refuse to serve sharded while app.db still holds profiles.
+
+    Reads only go to the shards once SHARD_REGIONS is set, so profiles left in
+    app.db would silently disappear from listings, sync and lookups.
+    """
+    db = SessionLocal()
+    try:
+        remaining = {kind: db.query(model.id).count() for kind, model in PROFILE_MODELS.items()}
+    finally:
+        db.close()
+    if any(remaining.values()):
+        raise RuntimeError(
+            f"app.db still holds profiles ({remaining}); run `python sharding.py migrate` before starting with SHARD_REGIONS"
+        )
+
+
+def migrate_existing_profiles() -> Dict[str, int]:
+    """Move profiles still stored in app.db into their regional shards, keeping their ids."""
+    shard_router.init_shards()
+    moved = {region: 0 for region in shard_router.regions}
+    db = SessionLocal()
+    db.info[versioning.SKIP_TOMBSTONES] = True  # Moved rows are not deleted for sync clients
+    try:
+        for kind, model in PROFILE_MODELS.items():
+            for row in db.query(model).order_by(model.id).all():
+                if kind == "farmer":
+                    region = shard_router.region_for_farmer(row.preferred_locations)
+                else:
+                    region = shard_router.region_for_landlord(row.location)
+                values = {attr.key: getattr(row, attr.key) for attr in model.__mapper__.column_attrs}
+                shard = shard_router.session(region)
+                shard.info[analytics.SKIP_ROLLUPS] = True  # Already counted in app.db's rollups
+                try:
+                    shard.merge(model(**values))
+                    shard.commit()
+                finally:
+                    shard.close()
+                if db.get(ShardDirectory, (kind, row.id)) is None:
+                    db.add(ShardDirectory(kind=kind, profile_id=row.id, region=region, user_id=row.user_id))
+                db.delete(row)
+                db.commit()
+                moved[region] += 1
+    finally:
+        db.close()
+    return moved
+
+
+if __name__ == "__main__":
+    import sys
+
+    if not shard_router.enabled:
+        sys.exit("Set SHARD_REGIONS to enable sharding first.")
+    if sys.argv[1:] == ["migrate"]:
+        print(migrate_existing_profiles())
+    else:
+        sys.exit("Usage: python sharding.py migrate")
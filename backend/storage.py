@@ -0,0 +1,200 @@
+"""
+Media storage backends.
+
+`LocalStorage` keeps files under MEDIA_DIR in a two-level hash-prefix tree
+(`ab/cd/<uuid>_<name>`) so no directory grows without bound; files are served
+by the `/media` static mount. `S3Storage` keeps them in an S3-compatible
+bucket (AWS, MinIO, or a local stand-in such as `moto_server`) and hands out
+presigned URLs so uploads and downloads can bypass the API workers.
+
+The backend is chosen with the STORAGE_BACKEND environment variable.
+"""
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+MEDIA_DIR = Path(__file__).parent / "media"
+QUARANTINE_DIR = Path(__file__).parent / "media_quarantine"  # Kept outside MEDIA_DIR so it is not served
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # "local" or "s3"
+S3_BUCKET = os.getenv("S3_BUCKET", "krishi-media")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # e.g. http://localhost:9000 for MinIO / moto_server
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+PRESIGN_EXPIRE_SECONDS = 900  # Lifetime of presigned upload/download URLs
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024  # Upper bound enforced on presigned uploads
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class StorageError(Exception):
+    """Raised when a storage operation is not supported or fails."""
+
+
+def new_media_key(filename: str) -> str:
+    """Build a sharded object key; the random uuid prefix spreads keys evenly across shards."""
+    name = Path(filename or "upload").name.replace("/", "_") or "upload"
+    unique = uuid.uuid4().hex
+    return f"{unique[:2]}/{unique[2:4]}/{unique}_{name}"
+
+
+def key_from_url(url: str) -> Optional[str]:
+    """Return the storage key a stored media URL points to, or None for foreign URLs."""
+    if not isinstance(url, str):
+        return None
+    for marker in ("/media/", "/storage/"):
+        index = url.find(marker)
+        if index != -1:
+            key = url[index + len(marker):].split("?", 1)[0].split("#", 1)[0]
+            return key or None
+    return None
+
+
+class StoredObject:
+    """A stored file as seen while listing a backend; `stat` may be lazy."""
+
+    def __init__(self, key: str, stat_fn):
+        self.key = key
+        self._stat_fn = stat_fn
+
+    def stat(self) -> Tuple[int, float]:
+        """Return `(size_in_bytes, modified_unix_time)`."""
+        return self._stat_fn()
+
+
+class LocalStorage:
+    supports_direct_upload = False
+
+    def __init__(self, root: Path = MEDIA_DIR, quarantine_root: Path = QUARANTINE_DIR):
+        self.root = root
+        self.quarantine_root = quarantine_root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str, quarantined: bool = False) -> Path:
+        base = self.quarantine_root if quarantined else self.root
+        path = (base / key).resolve()
+        if base.resolve() not in path.parents:
+            raise StorageError(f"Invalid media key: {key}")
+        return path
+
+    def save(self, filename: str, fileobj: BinaryIO) -> str:
+        """Stream `fileobj` to a new sharded path and return its key."""
+        key = new_media_key(filename)
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(fileobj, f, COPY_CHUNK_SIZE)
+        return key
+
+    def url(self, key: str) -> str:
+        return f"/media/{key}"
+
+    def download_url(self, key: str) -> str:
+        return self.url(key)
+
+    def presigned_upload(self, filename: str, content_type: Optional[str] = None) -> dict:
+        raise StorageError("Direct uploads require the S3 storage backend; use /upload/images instead.")
+
+    def delete(self, key: str, quarantined: bool = False) -> None:
+        self._path(key, quarantined).unlink(missing_ok=True)
+
+    def quarantine(self, key: str) -> None:
+        target = self._path(key, quarantined=True)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self._path(key), target)
+
+    def iter_objects(self, quarantined: bool = False) -> Iterator[StoredObject]:
+        """Walk the (sharded or legacy flat) tree with os.scandir, skipping dot entries."""
+        base = self.quarantine_root if quarantined else self.root
+        if not base.is_dir():
+            return
+        pending = [(str(base), "")]
+        while pending:
+            path, prefix = pending.pop()
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append((entry.path, f"{prefix}{entry.name}/"))
+                    elif entry.is_file(follow_symlinks=False):
+                        yield StoredObject(f"{prefix}{entry.name}", lambda e=entry: _entry_stat(e))
+
+
+def _entry_stat(entry: os.DirEntry) -> Tuple[int, float]:
+    info = entry.stat(follow_symlinks=False)
+    return info.st_size, info.st_mtime
+
+
+class S3Storage:
+    supports_direct_upload = True
+    QUARANTINE_PREFIX = "quarantine/"
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: Optional[str] = S3_ENDPOINT_URL, region: str = S3_REGION):
+        try:
+            import boto3
+        except ImportError as e:
+            raise StorageError("The S3 storage backend requires boto3 (pip install boto3).") from e
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    def save(self, filename: str, fileobj: BinaryIO) -> str:
+        key = new_media_key(filename)
+        self.client.upload_fileobj(fileobj, self.bucket, key)
+        return key
+
+    def url(self, key: str) -> str:
+        # Stable URL stored in the DB; /storage/{key} redirects to a fresh presigned download
+        return f"/storage/{key}"
+
+    def download_url(self, key: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=PRESIGN_EXPIRE_SECONDS
+        )
+
+    def presigned_upload(self, filename: str, content_type: Optional[str] = None) -> dict:
+        """Return a presigned POST the client can send the file to directly."""
+        key = new_media_key(filename)
+        fields, conditions = {}, [["content-length-range", 1, MAX_UPLOAD_BYTES]]
+        if content_type:
+            fields["Content-Type"] = content_type
+            conditions.append({"Content-Type": content_type})
+        post = self.client.generate_presigned_post(
+            self.bucket, key, Fields=fields, Conditions=conditions, ExpiresIn=PRESIGN_EXPIRE_SECONDS
+        )
+        return {"key": key, "upload_url": post["url"], "fields": post["fields"]}
+
+    def delete(self, key: str, quarantined: bool = False) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.QUARANTINE_PREFIX + key if quarantined else key)
+
+    def quarantine(self, key: str) -> None:
+        self.client.copy_object(
+            Bucket=self.bucket, Key=self.QUARANTINE_PREFIX + key, CopySource={"Bucket": self.bucket, "Key": key}
+        )
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def iter_objects(self, quarantined: bool = False) -> Iterator[StoredObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        prefix = self.QUARANTINE_PREFIX if quarantined else ""
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                key = item["Key"]
+                if quarantined:
+                    key = key[len(prefix):]
+                elif key.startswith(self.QUARANTINE_PREFIX):
+                    continue
+                stat = (item["Size"], item["LastModified"].timestamp())
+                yield StoredObject(key, lambda s=stat: s)
+
+
+def create_storage():
+    if STORAGE_BACKEND == "s3":
+        return S3Storage()
+    if STORAGE_BACKEND == "local":
+        return LocalStorage()
+    raise StorageError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+
+
+# Backend shared by the upload endpoints and the media GC
+storage = create_storage()
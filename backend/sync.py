@@ -0,0 +1,171 @@
+"""
+Delta sync for clients on slow or metered connections.
+
+A client calls `/sync` once without a cursor to get every row it may see.
+After that it passes the returned `cursor` as `since`, and only rows that
+changed after that point come back, along with the ids of rows deleted since.
+The server reads changed rows through the `row_version` indexes that
+versioning.py maintains, so both the work and the payload scale with the
+amount of change, not with the size of the data.
+
+Rows are encoded column-wise, with one header and then plain value lists:
+    {"cursor": "57", "more": false,
+     "changes": {"crops": {"columns": ["id", "crop_name", ...], "rows": [[3, "Paddy", ...]]}},
+     "deleted": {"proofs": [12, 13]}}
+Clients apply `deleted` before `changes`. While `more` is true they call
+again with the new cursor. Each database (app.db and every profile shard)
+has its own clock, so the cursor holds one version per database, joined by
+dots.
+
+What a user receives:
+- Admins receive every row.
+- Farmers and landlords receive their own profile, their spaces, those
+  spaces' crops and proofs, and all crop templates.
+"""
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import versioning
+from db import FarmerDetails, LandlordDetails, Space, Crop, Proof, CropTemplate, SyncTombstone
+from sharding import shard_router, profile_id_for_user
+
+SYNC_PAGE_SIZE = 500  # Rows per table in one response; the rest follows with `more`
+SYNC_ROLES = ("admin", "farmer", "landlord")
+APP_TABLES = (FarmerDetails, LandlordDetails, Space, Crop, Proof, CropTemplate)
+PROFILE_TABLES = (FarmerDetails, LandlordDetails)
+DELETED = "deleted"
+
+
+def parse_cursor(cursor: Optional[str], sources: int) -> Optional[List[int]]:
+    """Versions per database from a cursor string; None means a full sync."""
+    if not cursor:
+        return None
+    try:
+        versions = [int(part) for part in cursor.split(".")]
+    except ValueError:
+        raise ValueError("Invalid sync cursor")
+    if any(version < 0 for version in versions) or len(versions) > sources:
+        raise ValueError("Invalid sync cursor")
+    # Databases added since the cursor was issued start from scratch
+    return versions + [-1] * (sources - len(versions))
+
+
+def _scope_filter(model, role: str, profile_id: Optional[int]):
+    """WHERE clause limiting `model` to the caller's rows; None for no limit, False for no rows."""
+    if role == "admin" or model is CropTemplate:
+        return None
+    if profile_id is None:
+        return False
+    owner = Space.farmer_id if role == "farmer" else Space.landlord_id
+    if model is FarmerDetails:
+        return FarmerDetails.id == profile_id if role == "farmer" else False
+    if model is LandlordDetails:
+        return LandlordDetails.id == profile_id if role == "landlord" else False
+    if model is Space:
+        return owner == profile_id
+    spaces = select(Space.id).where(owner == profile_id)
+    if model is Crop:
+        return Crop.space_id.in_(spaces)
+    return Proof.crop_id.in_(select(Crop.id).where(Crop.space_id.in_(spaces)))
+
+
+def _statements(models, role: str, profile_id: Optional[int], full: bool) -> Dict[str, Tuple[object, object, list]]:
+    """Per table: a select of its columns (row_version last), its version column and the column names returned."""
+    statements = {}
+    for model in models:
+        scope = _scope_filter(model, role, profile_id)
+        if scope is False:
+            continue
+        columns = [column for column in model.__table__.columns if column.key != "row_version"]
+        statement = select(*columns, model.row_version)
+        if scope is not None:
+            statement = statement.where(scope)
+        statements[model.__tablename__] = (statement, model.row_version, [column.key for column in columns])
+    # A full sync starts from the current rows, so past deletes are irrelevant to it
+    if not full:
+        tombstones = select(SyncTombstone.table_name, SyncTombstone.row_id, SyncTombstone.row_version)
+        if role != "admin":
+            owner = SyncTombstone.farmer_id if role == "farmer" else SyncTombstone.landlord_id
+            tombstones = tombstones.where(owner == profile_id) if profile_id is not None else None
+        if tombstones is not None:
+            statements[DELETED] = (tombstones, SyncTombstone.row_version, None)
+    return statements
+
+
+def _read_database(session: Session, statements: dict, since: int, limit: int) -> Tuple[dict, dict, int, bool]:
+    """
+    Changes in one database after `since`, at most about `limit` rows per table.
+
+    A page always ends on a whole version, so a client never sees half of a flush.
+    """
+    upper = versioning.current_version(session.connection())
+    bound = upper
+    fetched = {}
+    for name, (statement, version, _) in statements.items():
+        window = statement.where(version <= upper)
+        if since >= 0:
+            window = window.where(version > since)
+        rows = session.execute(window.order_by(version).limit(limit + 1)).all()
+        if len(rows) > limit:
+            first_left_out = rows[limit][-1]
+            # Stop before the version that overflowed, unless that version alone is the whole page
+            bound = min(bound, first_left_out - 1 if first_left_out - 1 > since else first_left_out)
+        fetched[name] = (window, version, rows)
+
+    changes, deleted = {}, {}
+    for name, (window, version, rows) in fetched.items():
+        if len(rows) > limit and rows[-1][-1] <= bound:
+            rows = session.execute(window.where(version <= bound).order_by(version)).all()
+        rows = [row for row in rows if row[-1] <= bound]
+        if not rows:
+            continue
+        if name == DELETED:
+            for table_name, row_id, _ in rows:
+                deleted.setdefault(table_name, []).append(row_id)
+        else:
+            changes[name] = {"columns": statements[name][2], "rows": [list(row[:-1]) for row in rows]}
+    return changes, deleted, bound, bound < upper
+
+
+def changes_since(db: Session, user: dict, cursor: Optional[str] = None, limit: int = SYNC_PAGE_SIZE) -> dict:
+    """
+    Rows visible to `user` that changed after `cursor`, in columnar form.
+
+    Args:
+        db (Session): Session on app.db.
+        user (dict): Token payload of the caller (one of SYNC_ROLES).
+        cursor (str, optional): Cursor from the previous response; omit for a full sync.
+        limit (int): Rows per table before the response is cut short (`more`).
+
+    Returns:
+        dict: `cursor`, `more`, `changes` by table and `deleted` ids by table.
+    """
+    regions = shard_router.regions if shard_router.enabled else []
+    since = parse_cursor(cursor, 1 + len(regions))
+    role = user["role"]
+    profile_id = profile_id_for_user(db, role, user["id"]) if role != "admin" else None
+
+    sources = [(db, APP_TABLES)] + [(None, PROFILE_TABLES)] * len(regions)
+    response = {"cursor": None, "more": False, "changes": {}, "deleted": {}}
+    versions = []
+    for index, (session, models) in enumerate(sources):
+        own_session = session is None
+        if own_session:
+            session = shard_router.session(regions[index - 1])
+        try:
+            statements = _statements(models, role, profile_id, since is None)
+            changes, deleted, version, more = _read_database(session, statements, -1 if since is None else since[index], limit)
+        finally:
+            if own_session:
+                session.close()
+        for name, table in changes.items():
+            merged = response["changes"].setdefault(name, {"columns": table["columns"], "rows": []})
+            merged["rows"].extend(table["rows"])
+        for name, ids in deleted.items():
+            response["deleted"].setdefault(name, []).extend(ids)
+        response["more"] = response["more"] or more
+        versions.append(version)
+    response["cursor"] = ".".join(str(version) for version in versions)
+    return response
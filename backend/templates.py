@@ -0,0 +1,144 @@
+"""
+Shared catalog of versioned crop templates.
+
+A template holds the cultivation plan of a crop (its duration and the name
+and description of every step). Crops reference a template and keep only
+their own progress in `Crop.step_state` (status and proof count per step),
+so thousands of crops of the same kind share one copy of the plan. Template
+versions are immutable: a changed plan becomes a new version and existing
+crops keep the version they were created with. That makes templates safe to
+cache in memory for the life of the process.
+"""
+import hashlib
+import json
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from db import CropTemplate
+
+# Step keys that describe a crop's progress rather than the plan
+STATE_KEYS = ("status", "proofs", "proof_count")
+RESOLVE_ATTEMPTS = 5  # Lookups before giving up when concurrent requests keep adding versions of one crop
+
+
+def step_definitions(steps: List[dict]) -> List[dict]:
+    """Strip per-crop progress from a list of steps, leaving the plan."""
+    return [{key: value for key, value in step.items() if key not in STATE_KEYS} for step in steps]
+
+
+def steps_checksum(definitions: List[dict]) -> str:
+    return hashlib.sha256(json.dumps(definitions, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def initial_step_state(step_count: int) -> List[dict]:
+    return [{"status": "pending", "proof_count": 0} for _ in range(step_count)]
+
+
+def all_steps_completed(step_state: Optional[List[dict]]) -> bool:
+    """A crop is finished once it has steps and all of them are completed."""
+    return bool(step_state) and all(state.get("status") == "completed" for state in step_state)
+
+
+def merge_steps(definitions: List[dict], step_state: Optional[List[dict]], proofs: Optional[Dict[int, List[str]]] = None) -> List[dict]:
+    """
+    Combine a template's step definitions with a crop's progress.
+
+    Args:
+        definitions (List[dict]): Template steps (never modified).
+        step_state (List[dict]): The crop's per-step status and proof count.
+        proofs (Dict[int, List[str]], optional): Proof URLs by step index.
+
+    Returns:
+        List[dict]: One dict per step, in the shape crops used to store.
+    """
+    step_state = step_state or []
+    merged = []
+    for index, definition in enumerate(definitions):
+        state = step_state[index] if index < len(step_state) else {}
+        step = {**definition, "status": state.get("status", "pending"), "proof_count": state.get("proof_count", 0)}
+        if proofs is not None:
+            step["proofs"] = proofs.get(index, [])
+        merged.append(step)
+    return merged
+
+
+def template_to_dict(template: CropTemplate) -> dict:
+    return {
+        "id": template.id,
+        "crop_name": template.crop_name,
+        "version": template.version,
+        "duration": template.duration,
+        "steps": template.steps,
+    }
+
+
+class TemplateCatalog:
+    """In-memory cache of crop templates by id, filled on first use."""
+
+    def __init__(self):
+        self._templates: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, template: CropTemplate) -> dict:
+        payload = template_to_dict(template)
+        with self._lock:
+            self._templates[template.id] = payload
+        return payload
+
+    def get(self, db: Session, template_id: int) -> Optional[dict]:
+        """Return a template as a dict (shared; callers must not modify it), or None."""
+        with self._lock:
+            cached = self._templates.get(template_id)
+        if cached is not None:
+            return cached
+        template = db.query(CropTemplate).filter(CropTemplate.id == template_id).first()
+        return self._remember(template) if template else None
+
+    def resolve(self, db: Session, crop_name: str, duration: str, steps: List[dict]) -> dict:
+        """
+        Find the template with exactly this plan, or add it as the next version
+        of `crop_name`. The new row is flushed, not committed.
+
+        Concurrent requests can pick the same next version; the loser's insert
+        fails on the (crop_name, version) constraint, is rolled back to its
+        savepoint, and the lookup runs again (finding the winner's row if it
+        holds the same plan).
+        """
+        definitions = step_definitions(steps)
+        checksum = steps_checksum(definitions)
+        for _ in range(RESOLVE_ATTEMPTS):
+            existing = (
+                db.query(CropTemplate)
+                .filter(CropTemplate.crop_name == crop_name, CropTemplate.checksum == checksum, CropTemplate.duration == duration)
+                .order_by(CropTemplate.version.desc())
+                .first()
+            )
+            if existing:
+                return self._remember(existing)
+
+            latest = db.query(CropTemplate.version).filter(CropTemplate.crop_name == crop_name).order_by(CropTemplate.version.desc()).first()
+            template = CropTemplate(
+                crop_name=crop_name,
+                version=latest[0] + 1 if latest else 1,
+                duration=duration,
+                steps=definitions,
+                checksum=checksum,
+            )
+            try:
+                with db.begin_nested():
+                    db.add(template)
+            except IntegrityError:
+                continue
+            return template_to_dict(template)  # Cached on first read, once committed
+        raise RuntimeError(f"Could not add a template version for {crop_name!r}; too many concurrent changes")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+
+# Shared catalog for the whole process
+template_catalog = TemplateCatalog()
@@ -0,0 +1,94 @@
+"""
+Shared test setup.
+
+The backend uses flat imports (`from db import ...`) and relative SQLite URLs
+(`sqlite:///./app.db`), so the backend directory is put on sys.path and the
+working directory is switched to a fresh temporary directory before any
+backend module is imported. Every test session therefore starts from empty
+databases.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+WORK_DIR = Path(tempfile.mkdtemp(prefix="krishi-tests-"))
+
+sys.path.insert(0, str(BACKEND_DIR))
+os.chdir(WORK_DIR)
+os.environ.setdefault("BACKUP_DIR", str(WORK_DIR / "backups"))
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def app_db():
+    """Create the schema of app.db (as the server does on startup)."""
+    from db import init_db
+
+    init_db()
+
+
+@pytest.fixture
+def db(app_db):
+    from db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(scope="session")
+def client(app_db):
+    """The API with its startup tasks run once for the whole session."""
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def auth_headers(user_id: int, role: str, email: str = "user@example.com") -> dict:
+    from security import create_access_token
+
+    return {"Authorization": f"Bearer {create_access_token({'id': user_id, 'email': email, 'role': role})}"}
+
+
+@pytest.fixture
+def admin_headers():
+    return auth_headers(1, "admin", "admin@example.com")
+
+
+def unique_email(prefix: str) -> str:
+    import uuid
+
+    return f"{prefix}-{uuid.uuid4().hex[:10]}@example.com"
+
+
+def register(client, role: str, **fields) -> dict:
+    """Register a user with their role details through /register/complete and return the response body."""
+    data = {"email": unique_email(role), "password": "secret", "role": role}
+    if role == "farmer":
+        data.update(land_handling_capacity=10, preferred_locations="Punjab")
+    elif role == "landlord":
+        data.update(soil_type="Loamy", acres=10, location="Punjab")
+    data.update({name: str(value) for name, value in fields.items()})
+    response = client.post("/register/complete", data=data)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def media(tmp_path, monkeypatch):
+    """A LocalStorage in a temporary directory, used by the upload endpoints and the media GC."""
+    import main
+    import media_gc
+    from storage import LocalStorage
+
+    store = LocalStorage(tmp_path / "media", tmp_path / "quarantine")
+    monkeypatch.setattr(main, "storage", store)
+    monkeypatch.setattr(media_gc, "storage", store)
+    return store
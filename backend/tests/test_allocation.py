@@ -0,0 +1,63 @@
+"""Land allocation optimizer: farmer capacity limits, match quality and committed spaces."""
+import uuid
+
+from allocation import EXACT_LOCATION, SAME_REGION, AllocationPool, allocate
+from conftest import auth_headers, register
+from db import Space
+
+
+def test_assignments_never_exceed_farmer_capacity():
+    pool = AllocationPool()
+    pool.add_farmer(1, None, 10, ["Ludhiana"])
+    pool.add_farmer(2, None, 4, ["Ludhiana"])
+    for landlord_id, acres in enumerate([6, 5, 4, 3], start=1):
+        pool.add_landlord(landlord_id, None, acres, "Ludhiana")
+    spare = list(pool.remaining)
+
+    assignment = allocate(pool)
+
+    used = {}
+    for landlord, (farmer, match) in assignment.items():
+        used[farmer] = used.get(farmer, 0) + pool.acres[landlord]
+        assert match == EXACT_LOCATION
+    assert all(used[farmer] <= spare[farmer] for farmer in used)
+    # 18 acres of land against 14 acres of capacity: 6 + 4 and 3 fit, the 5-acre plot does not
+    assert sum(used.values()) == 13 and 1 not in assignment
+    assert [pool.remaining[farmer] for farmer in range(2)] == [spare[farmer] - used.get(farmer, 0) for farmer in range(2)]
+
+
+def test_region_fallback_and_unmatched_locations():
+    pool = AllocationPool()
+    pool.add_farmer(1, None, 20, ["Ludhiana Punjab"])
+    pool.add_farmer(2, None, 20, ["Kochi Kerala"])
+    pool.add_landlord(1, None, 5, "Amritsar, Punjab")
+    pool.add_landlord(2, None, 5, "Nowhere")
+
+    assignment = allocate(pool)
+
+    # Same region (Punjab -> north) but a different place; the unknown location gets no one
+    assert assignment == {0: (0, SAME_REGION)}
+
+
+def test_committed_allocation_respects_capacity(client, db, admin_headers):
+    place = f"Testville {uuid.uuid4().hex[:8]}"
+    farmer = register(client, "farmer", land_handling_capacity=8, preferred_locations=place)
+    small = register(client, "landlord", acres=3, location=place)
+    large = register(client, "landlord", acres=7, location=place)
+
+    response = client.post("/admin/allocate", params={"commit": "true", "include_pairs": "true"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    ours = [pair for pair in response.json()["pairs"] if pair["farmer_id"] == farmer["farmer"]["id"]]
+
+    # Best fit takes the 7-acre plot; the 3-acre plot would exceed the 8-acre capacity
+    assert [pair["landlord_id"] for pair in ours] == [large["landlord"]["id"]]
+    space = db.get(Space, ours[0]["space_id"])
+    assert (space.farmer_id, space.landlord_id, space.admin_id) == (farmer["farmer"]["id"], large["landlord"]["id"], 1)
+
+    # A second run has nothing left for this farmer
+    again = client.post("/admin/allocate", params={"commit": "true", "include_pairs": "true"}, headers=admin_headers).json()
+    assert not [pair for pair in again["pairs"] if pair["landlord_id"] == small["landlord"]["id"] and pair["farmer_id"] == farmer["farmer"]["id"]]
+
+
+def test_only_admins_can_allocate(client):
+    assert client.post("/admin/allocate", headers=auth_headers(5, "farmer")).status_code == 403
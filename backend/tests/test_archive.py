@@ -0,0 +1,56 @@
+"""Archival of finished spaces: candidate selection in SQL and the move into archive.db."""
+from datetime import datetime
+
+import archive
+from db import Space, Crop, Proof
+from templates import template_catalog
+
+
+def add_space(db, statuses_per_crop):
+    space = Space(farmer_id=1, landlord_id=1, admin_id=1, progress={})
+    db.add(space)
+    db.flush()
+    for statuses in statuses_per_crop:
+        template = template_catalog.resolve(db, "Paddy", "120 days", [{"name": f"Step {index}"} for index in range(len(statuses))])
+        completed = bool(statuses) and all(status == "completed" for status in statuses)
+        crop = Crop(
+            crop_name="Paddy", duration="120 days", space_id=space.id, template_id=template["id"],
+            step_state=[{"status": status, "proof_count": 0} for status in statuses],
+            completed_at=datetime.utcnow() if completed else None,
+        )
+        db.add(crop)
+        db.flush()
+        db.add(Proof(file_url=f"/media/{crop.id}.jpg", crop_id=crop.id, step_index=0))
+    db.commit()
+    return space.id
+
+
+def test_only_finished_spaces_are_selected(db):
+    finished = add_space(db, [["completed", "completed"], ["completed"]])
+    partly = add_space(db, [["completed", "completed"], ["completed", "in_progress"]])
+    empty = add_space(db, [])
+
+    candidates = archive.finished_space_ids(db, after_id=finished - 1, limit=100)
+
+    assert finished in candidates
+    assert partly not in candidates and empty not in candidates
+
+
+def test_archive_moves_finished_space_with_crops_and_proofs(db):
+    finished = add_space(db, [["completed"]])
+    active = add_space(db, [["pending"]])
+    crop_id = db.query(Crop.id).filter(Crop.space_id == finished).scalar()
+
+    dry = archive.archive_finished_spaces(dry_run=True)
+    assert crop_id in dry["archived_crop_ids"]
+    assert db.get(Space, finished) is not None
+
+    result = archive.archive_finished_spaces()
+    db.expire_all()
+
+    assert crop_id in result["archived_crop_ids"]
+    assert db.get(Space, finished) is None and db.get(Crop, crop_id) is None
+    assert db.get(Space, active) is not None
+    archived = archive.get_archived_crop(crop_id)
+    assert archived.space_id == finished
+    assert archived.steps[0]["status"] == "completed" and archived.steps[0]["proofs"] == [f"/media/{crop_id}.jpg"]
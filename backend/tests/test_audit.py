@@ -0,0 +1,86 @@
+"""Buffered audit log: write requests are recorded off the request path, reads are not."""
+import threading
+import time
+from datetime import datetime
+
+import audit
+from audit import AuditLogger
+from conftest import auth_headers, register
+from db import AuditLog
+
+
+def entry(path: str) -> dict:
+    return {
+        "occurred_at": datetime.utcnow(), "method": "POST", "path": path, "status_code": 201,
+        "client_ip": None, "token": None, "duration_ms": 1, "details": {"user_id": 99},
+    }
+
+
+def audit_entries(client, admin_headers, **params) -> list:
+    """Entries matching `params`, waiting up to a few flush intervals for the writer thread."""
+    deadline = time.monotonic() + 5
+    while True:
+        entries = client.get("/admin/audit", params=params, headers=admin_headers).json()["entries"]
+        if entries or time.monotonic() > deadline:
+            return entries
+        time.sleep(0.1)
+
+
+def test_write_requests_are_audited_with_annotations(client, admin_headers):
+    farmer = register(client, "farmer")
+
+    entries = audit_entries(client, admin_headers, user_id=farmer["id"], path_prefix="/register/complete")
+    assert len(entries) == 1
+    entry = entries[0]
+    assert (entry["method"], entry["status_code"], entry["role"]) == ("POST", 200, "farmer")
+    assert entry["details"]["profile_id"] == farmer["farmer"]["id"] and entry["details"]["request_id"]
+
+    # Reads are not audited
+    client.get("/dashboard", headers=admin_headers)
+    assert client.get("/admin/audit", params={"path_prefix": "/dashboard"}, headers=admin_headers).json()["entries"] == []
+
+
+def test_only_admins_read_the_audit_log(client):
+    assert client.get("/admin/audit", headers=auth_headers(2, "farmer")).status_code == 403
+
+
+def test_full_buffer_drops_instead_of_blocking_and_stop_flushes(db):
+    logger = AuditLogger(buffer_size=2)
+    for path in ("/buffered/1", "/buffered/2", "/buffered/3"):
+        logger.record(entry(path))
+    assert logger.stats() == {"buffered": 2, "dropped": 1, "written": 0, "failed": 0}
+
+    logger.start()
+    logger.stop()
+    assert logger.stats()["written"] == 2
+    paths = {path for (path,) in db.query(AuditLog.path).filter(AuditLog.path.startswith("/buffered/"))}
+    assert paths == {"/buffered/1", "/buffered/2"}
+
+
+def test_stop_with_a_full_buffer_still_flushes(db, monkeypatch):
+    monkeypatch.setattr(audit, "AUDIT_FLUSH_SECONDS", 0)  # Write each entry as soon as it is read
+    logger = AuditLogger(buffer_size=2)
+    writing, release = threading.Event(), threading.Event()
+    write = logger._write
+
+    def slow_write(batch):
+        writing.set()
+        release.wait()
+        write(batch)
+
+    logger._write = slow_write
+    logger.start()
+    logger.record(entry("/saturated/1"))
+    assert writing.wait(5)  # The writer holds the first entry and is stuck writing it
+    for index in (2, 3, 4):
+        logger.record(entry(f"/saturated/{index}"))
+    assert logger.stats()["buffered"] == 2 and logger.dropped == 1
+
+    writer = logger._thread
+    threading.Timer(0.2, release.set).start()
+    logger.stop(timeout=0.05)  # Must not raise although no sentinel fits in the buffer
+    writer.join(5)
+
+    assert not writer.is_alive() and logger.stats()["written"] == 3
+    paths = {path for (path,) in db.query(AuditLog.path).filter(AuditLog.path.startswith("/saturated/"))}
+    assert paths == {"/saturated/1", "/saturated/2", "/saturated/3"}
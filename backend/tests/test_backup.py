@@ -0,0 +1,60 @@
+"""Online backups: restore after checksum verification, corrupted snapshots rejected."""
+import pytest
+
+import backup
+from conftest import auth_headers, unique_email
+from db import User
+
+
+@pytest.fixture
+def backups(media, monkeypatch):
+    monkeypatch.setattr(backup, "storage", media)
+    return backup
+
+
+def add_user(db, email: str) -> None:
+    db.add(User(email=email, password="secret", role="farmer"))
+    db.commit()
+
+
+def test_restore_brings_back_the_snapshot(db, backups):
+    kept, later = unique_email("kept"), unique_email("later")
+    add_user(db, kept)
+
+    summary = backups.create_backup()
+    assert "app.db" in summary["databases"] and summary["bytes"] > 0
+    assert summary["id"] in [entry["id"] for entry in backups.list_backups()]
+
+    add_user(db, later)
+    db.close()
+
+    report = backups.restore_backup(summary["id"], ["app.db"])
+    assert report["restored"] == ["app.db"] and report["media_missing"] == []
+    emails = {email for (email,) in db.query(User.email).filter(User.email.in_([kept, later]))}
+    assert emails == {kept}
+
+
+def test_corrupted_snapshot_is_rejected_before_anything_is_overwritten(db, backups):
+    summary = backups.create_backup()
+    email = unique_email("after")
+    add_user(db, email)
+    db.close()
+
+    snapshot = backups.BACKUP_DIR / summary["id"] / "app.db"
+    data = bytearray(snapshot.read_bytes())
+    data[-1] ^= 0xFF
+    snapshot.write_bytes(bytes(data))
+
+    with pytest.raises(backups.BackupError, match="checksum"):
+        backups.restore_backup(summary["id"])
+    # The live database was left alone
+    assert db.query(User).filter(User.email == email).count() == 1
+
+
+def test_unknown_backups_are_rejected(backups):
+    with pytest.raises(backups.BackupError, match="Unknown backup"):
+        backups.restore_backup("../outside")
+
+
+def test_backup_endpoint_is_admin_only(client):
+    assert client.post("/admin/backups", headers=auth_headers(3, "farmer")).status_code == 403
@@ -0,0 +1,28 @@
+"""Batch profile lookups with sparse fieldsets."""
+from conftest import auth_headers, register
+
+
+def test_batch_keeps_request_order_and_reports_missing(client, admin_headers):
+    first, second = (register(client, "farmer")["farmer"]["id"] for _ in range(2))
+    unknown = second + 10_000
+
+    response = client.get(
+        "/farmers/batch", params={"ids": [second, unknown, first], "fields": "id,land_handling_capacity"}, headers=admin_headers
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [farmer["id"] for farmer in body["farmers"]] == [second, first]
+    assert body["missing"] == [unknown]
+    assert all(set(farmer) == {"id", "land_handling_capacity"} for farmer in body["farmers"])
+
+
+def test_batch_rejects_unknown_fields_and_other_users_rows(client, admin_headers):
+    landlord = register(client, "landlord")
+    other = register(client, "landlord")
+    ids = [landlord["landlord"]["id"], other["landlord"]["id"]]
+
+    assert client.get("/landlords/batch", params={"ids": ids, "fields": "password"}, headers=admin_headers).status_code == 400
+    assert client.get("/landlords/batch", params={"ids": ids}, headers=auth_headers(landlord["id"], "landlord")).status_code == 403
+    own = client.get("/landlords/batch", params={"ids": ids[:1], "fields": "acres,location"}, headers=auth_headers(landlord["id"], "landlord"))
+    assert own.status_code == 200 and own.json()["landlords"][0]["acres"] == 10
@@ -0,0 +1,53 @@
+"""Entity read cache: ETags, conditional GETs (304) and invalidation on writes."""
+from cache import EntityCache, etag_matches
+from conftest import auth_headers, register
+
+STEPS = [{"name": "Sowing", "description": "Plant the seeds."}, {"name": "Harvest", "description": "Cut the crop."}]
+
+
+def test_conditional_get_returns_304_until_the_crop_changes(client, admin_headers):
+    crop_id = client.post(
+        "/admin/create-crop", json={"crop_name": "Wheat", "duration": "120 days", "steps": STEPS}, headers=admin_headers
+    ).json()["crop_id"]
+
+    first = client.get(f"/crop/{crop_id}/steps")
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.json()["steps"][0]["status"] == "pending"
+
+    unchanged = client.get(f"/crop/{crop_id}/steps", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304 and unchanged.headers["etag"] == etag and unchanged.content == b""
+
+    # The write invalidates the cached entry, so the old ETag no longer matches
+    client.post(f"/crop/{crop_id}/step/0/status", json={"status": "completed"}, headers=admin_headers)
+    changed = client.get(f"/crop/{crop_id}/steps", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert changed.json()["steps"][0]["status"] == "completed"
+
+
+def test_cached_profile_keeps_authorization(client):
+    farmer = register(client, "farmer")
+    farmer_id = farmer["farmer"]["id"]
+    own = auth_headers(farmer["id"], "farmer")
+
+    response = client.get(f"/farmers/{farmer_id}", headers=own)
+    assert response.status_code == 200 and response.json()["id"] == farmer_id
+    assert client.get(f"/farmers/{farmer_id}", headers={**own, "If-None-Match": response.headers["etag"]}).status_code == 304
+
+    # Served from the cache now, but still only to the farmer themselves (or admins)
+    assert client.get(f"/farmers/{farmer_id}", headers=auth_headers(farmer["id"] + 1000, "farmer")).status_code == 403
+
+
+def test_entity_cache_bounds_and_etag_matching():
+    cache = EntityCache(max_entries=2, ttl=60)
+    etag = cache.set("a", {"x": 1})
+    cache.set("b", {"x": 2})
+    cache.get("a")  # "a" is now the most recently used
+    cache.set("c", {"x": 3})
+
+    assert cache.get("b") is None and cache.get("a") == ({"x": 1}, etag)
+    assert etag_matches(f'"other", {etag}', etag) and etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+
+    expired = EntityCache(ttl=-1)
+    expired.set("a", {})
+    assert expired.get("a") is None
@@ -0,0 +1,81 @@
+"""Single-flight coalescing: identical concurrent requests share one computation per scope."""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+from coalesce import SingleFlight, coalesce_key
+from conftest import auth_headers
+
+
+def test_concurrent_dashboard_requests_compute_once_per_role(client, monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def slow_stats(db):
+        with lock:
+            calls.append(len(calls))
+            call = calls[-1]
+        time.sleep(0.3)
+        return {"computation": call}
+
+    monkeypatch.setattr(main, "compute_dashboard_stats", slow_stats)
+    headers = [auth_headers(1, "admin")] * 4 + [auth_headers(2, "farmer")] * 4
+
+    with ThreadPoolExecutor(max_workers=len(headers)) as pool:
+        responses = list(pool.map(lambda request_headers: client.get("/dashboard", headers=request_headers), headers))
+
+    results = [response.json()["computation"] for response in responses]
+    # One computation for the admins and one for the farmers, never shared across roles
+    assert len(calls) == 2
+    assert len(set(results[:4])) == 1 and len(set(results[4:])) == 1 and results[0] != results[4]
+
+
+def test_scope_keeps_authorization_per_role(client, admin_headers):
+    assert client.get("/farmers", headers=admin_headers).status_code == 200
+    assert client.get("/farmers", headers=auth_headers(2, "farmer")).status_code == 400
+
+
+def test_keys_ignore_parameter_order_and_none():
+    assert coalesce_key("farmers", {"b": 1, "a": [1, 2], "c": None}) == coalesce_key("farmers", {"a": [1, 2], "b": 1})
+    assert coalesce_key("dashboard", scope="admin") != coalesce_key("dashboard", scope="farmer")
+
+
+def test_errors_are_shared_but_not_cached():
+    flight = SingleFlight(window=60)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def succeeding():
+        calls.append(1)
+        return "ok"
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.run("key", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results) and len(calls) == 1
+        # The failure is forgotten; a finished success is reused within the window
+        assert await flight.run("key", succeeding) == "ok"
+        assert await flight.run("key", succeeding) == "ok"
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_window_zero_shares_only_in_flight_work():
+    flight = SingleFlight(window=0)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        assert await flight.run("key", compute) == 1
+        assert await flight.run("key", compute) == 2
+
+    asyncio.run(scenario())
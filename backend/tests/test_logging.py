@@ -0,0 +1,64 @@
+"""Structured logging: request ids, JSON records, sampling and the SQL logging toggle."""
+import asyncio
+import json
+import logging
+
+from conftest import auth_headers
+from logging_config import JsonFormatter, RequestIdMiddleware, _ContextFilter, current_request_id, parse_sample_rates
+
+
+def test_request_id_is_echoed_or_generated(client):
+    echoed = client.get("/dashboard", headers={**auth_headers(1, "admin"), "X-Request-ID": "trace-123"})
+    assert echoed.headers["x-request-id"] == "trace-123"
+
+    generated = client.get("/dashboard", headers={**auth_headers(1, "admin"), "X-Request-ID": "x" * 65})
+    assert len(generated.headers["x-request-id"]) == 32 and generated.headers["x-request-id"] != "x" * 65
+
+
+def test_request_id_is_visible_to_code_running_in_the_request():
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(current_request_id())
+        await send({"type": "http.response.start", "status": 204, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": [(b"x-request-id", b"abc")]}
+    asyncio.run(RequestIdMiddleware(app)(scope, None, send))
+
+    assert seen == ["abc"] and current_request_id() is None
+    assert (b"x-request-id", b"abc") in sent[0]["headers"]
+
+
+def test_sampling_drops_only_records_below_warning():
+    context = _ContextFilter(parse_sample_rates("access=0, sqlalchemy=0.5"))
+
+    def record(name, level):
+        return logging.LogRecord(name, level, __file__, 1, "message", None, None)
+
+    assert not context.filter(record("access", logging.INFO))
+    assert context.filter(record("access", logging.WARNING))
+    assert context._rate("sqlalchemy.engine.Engine") == 0.5 and context._rate("main") == 1.0
+
+
+def test_records_are_formatted_as_json_with_extras():
+    record = logging.LogRecord("access", logging.INFO, __file__, 1, "GET %s", ("/farmers",), None)
+    record.request_id = "abc"
+    record.status_code = 200
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "GET /farmers" and entry["request_id"] == "abc" and entry["status_code"] == 200
+    assert entry["level"] == "INFO" and entry["logger"] == "access"
+
+
+def test_sql_logging_toggle_is_admin_only(client, admin_headers):
+    assert client.post("/admin/logging/sql", json={"enabled": True}, headers=auth_headers(7, "farmer")).status_code == 403
+
+    assert client.post("/admin/logging/sql", json={"enabled": True}, headers=admin_headers).json() == {"enabled": True}
+    assert client.get("/admin/logging/sql", headers=admin_headers).json() == {"enabled": True}
+    assert client.post("/admin/logging/sql", json={"enabled": False}, headers=admin_headers).json() == {"enabled": False}
@@ -0,0 +1,41 @@
+"""Orphaned media collection: referenced, recent and old unreferenced files."""
+import io
+import os
+import time
+
+import media_gc
+from db import Proof
+
+
+def save(media, name: str, age_hours: float = 0) -> str:
+    key = media.save(name, io.BytesIO(b"data"))
+    if age_hours:
+        then = time.time() - age_hours * 3600
+        os.utime(media.root / key, (then, then))
+    return key
+
+
+def test_only_old_unreferenced_files_are_collected(db, media):
+    referenced = save(media, "proof.jpg", age_hours=48)
+    db.add(Proof(file_url=f"http://testserver{media.url(referenced)}", crop_id=1, step_index=0))
+    db.commit()
+    recent = save(media, "upload-in-flight.jpg")
+    orphan = save(media, "abandoned.jpg", age_hours=48)
+
+    dry = media_gc.collect_garbage(grace_hours=24, dry_run=True)
+    assert (dry["scanned"], dry["referenced"], dry["too_recent"], dry["orphaned"], dry["collected"]) == (3, 1, 1, 1, 0)
+    assert (media.root / orphan).exists()
+
+    result = media_gc.collect_garbage(grace_hours=24, quarantine=True)
+    assert result["collected"] == 1
+    assert [stored.key for stored in media.iter_objects(quarantined=True)] == [orphan]
+    assert sorted(stored.key for stored in media.iter_objects()) == sorted([referenced, recent])
+
+
+def test_purge_quarantine_removes_only_expired_files(media):
+    key = save(media, "old.jpg", age_hours=48)
+    media.quarantine(key)
+
+    assert media_gc.purge_quarantine(max_age_days=7) == 0
+    assert media_gc.purge_quarantine(max_age_days=1) == 1
+    assert list(media.iter_objects(quarantined=True)) == []
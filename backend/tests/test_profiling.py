@@ -0,0 +1,28 @@
+"""Admin request profiling: flagged requests record their SQL and stack samples."""
+from conftest import auth_headers
+
+
+def test_flagged_admin_request_is_profiled(client, admin_headers):
+    response = client.get("/dashboard", headers={**admin_headers, "X-Profile": "1"})
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+
+    report = client.get(f"/admin/profiles/{profile_id}", headers=admin_headers)
+    assert report.status_code == 200
+    body = report.json()
+    assert body["path"] == "/dashboard" and body["status_code"] == 200
+    # The dashboard computes through the coalescing helper; its queries still land in this profile
+    assert body["query_count"] > 0 and len(body["queries"]) == body["query_count"]
+    assert "folded_stacks" in body["profile"]
+    assert any(entry["id"] == int(profile_id) for entry in client.get("/admin/profiles", headers=admin_headers).json())
+
+
+def test_only_admins_are_profiled_or_see_profiles(client):
+    farmer = auth_headers(42, "farmer")
+    response = client.get("/dashboard", headers={**farmer, "X-Profile": "1"})
+    assert "x-profile-id" not in response.headers
+    assert client.get("/admin/profiles", headers=farmer).status_code == 403
+
+
+def test_unflagged_requests_are_not_profiled(client, admin_headers):
+    assert "x-profile-id" not in client.get("/dashboard", headers=admin_headers).headers
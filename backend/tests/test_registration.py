@@ -0,0 +1,82 @@
+"""One-shot registration: user and role details commit together, failures leave nothing behind."""
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import main
+from conftest import register, unique_email
+from db import LandlordDetails, User
+
+
+def stored_files(media) -> list:
+    return [path for path in media.root.rglob("*") if path.is_file()]
+
+
+def test_landlord_registration_stores_user_details_and_images(client, db, media):
+    email = unique_email("landlord")
+    response = client.post(
+        "/register/complete",
+        data={"email": email, "password": "secret", "role": "landlord", "soil_type": "Loamy", "acres": "12", "location": "Punjab"},
+        files=[("files", ("field.jpg", b"jpeg-bytes", "image/jpeg"))],
+    )
+    assert response.status_code == 200, response.text
+    body = response.json()
+
+    user = db.query(User).filter(User.email == email).one()
+    details = db.query(LandlordDetails).filter(LandlordDetails.user_id == user.id).one()
+    assert body["id"] == user.id and body["landlord"]["id"] == details.id
+    assert details.acres == 12 and len(details.images_list) == 1
+    assert len(stored_files(media)) == 1
+
+
+def test_duplicate_email_is_rejected_without_orphans(client, db, media):
+    existing = register(client, "farmer")
+    users_before = db.query(User).count()
+    landlords_before = db.query(LandlordDetails).count()
+
+    response = client.post(
+        "/register/complete",
+        data={"email": existing["email"], "password": "secret", "role": "landlord", "soil_type": "Loamy", "acres": "5", "location": "Punjab"},
+        files=[("files", ("field.jpg", b"jpeg-bytes", "image/jpeg"))],
+    )
+    assert response.status_code == 400 and response.json()["detail"] == "Email already registered"
+
+    db.expire_all()
+    assert db.query(User).count() == users_before
+    assert db.query(LandlordDetails).count() == landlords_before
+    assert stored_files(media) == []
+
+
+def test_invalid_details_are_rejected_before_anything_is_written(client, db):
+    email = unique_email("farmer")
+    response = client.post(
+        "/register/complete",
+        data={"email": email, "password": "secret", "role": "farmer", "land_handling_capacity": "-3", "preferred_locations": "Punjab"},
+    )
+    assert response.status_code in (400, 422)
+    assert db.query(User).filter(User.email == email).count() == 0
+
+
+def test_other_constraint_failures_are_not_reported_as_duplicate_emails(client, db, monkeypatch):
+    def broken_response(user, profile=None):
+        raise IntegrityError("INSERT", {}, Exception("NOT NULL constraint failed: farmer_details.user_id"))
+
+    monkeypatch.setattr(main, "registration_response", broken_response)
+    email = unique_email("farmer")
+    with pytest.raises(IntegrityError):
+        client.post(
+            "/register/complete",
+            data={"email": email, "password": "secret", "role": "farmer", "land_handling_capacity": "5", "preferred_locations": "Punjab"},
+        )
+    assert db.query(User).filter(User.email == email).count() == 0
+
+
+def test_files_are_only_accepted_from_landlords(client, db, media):
+    email = unique_email("farmer")
+    response = client.post(
+        "/register/complete",
+        data={"email": email, "password": "secret", "role": "farmer", "land_handling_capacity": "5", "preferred_locations": "Punjab"},
+        files=[("files", ("field.jpg", b"jpeg-bytes", "image/jpeg"))],
+    )
+    assert response.status_code == 400
+    assert db.query(User).filter(User.email == email).count() == 0
+    assert stored_files(media) == []
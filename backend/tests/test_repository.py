@@ -0,0 +1,30 @@
+"""Pre-built lookups return the same rows as the equivalent ORM queries."""
+import repository
+from conftest import register
+from db import Crop, FarmerDetails, User
+
+STEPS = [{"name": "Sowing", "description": "Plant the seeds."}]
+
+
+def test_lookups_match_orm_queries(client, db, admin_headers):
+    farmer = register(client, "farmer")
+    landlord = register(client, "landlord")
+    crop_id = client.post(
+        "/admin/create-crop", json={"crop_name": "Rice", "duration": "90 days", "steps": STEPS}, headers=admin_headers
+    ).json()["crop_id"]
+
+    assert repository.get_user_by_email(db, farmer["email"]) is db.query(User).filter(User.email == farmer["email"]).first()
+    assert repository.get_user(db, landlord["id"]) is db.query(User).filter(User.id == landlord["id"]).first()
+    assert repository.get_profile_by_user_id(db, "farmer", farmer["id"]) is (
+        db.query(FarmerDetails).filter(FarmerDetails.user_id == farmer["id"]).first()
+    )
+    assert repository.get_profile_by_user_id(db, "landlord", landlord["id"]).id == landlord["landlord"]["id"]
+    assert repository.get_crop(db, crop_id) is db.query(Crop).filter(Crop.id == crop_id).first()
+
+
+def test_missing_rows_return_none(db, app_db):
+    assert repository.get_user_by_email(db, "nobody@example.com") is None
+    assert repository.get_user(db, 10**9) is None
+    assert repository.get_profile_by_user_id(db, "landlord", 10**9) is None
+    assert repository.get_crop(db, 10**9) is None
+
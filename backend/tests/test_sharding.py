@@ -0,0 +1,89 @@
+"""Regional profile shards: id allocation, routing and shard-only profile writes."""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func
+
+import main
+import sharding
+from conftest import auth_headers, register, unique_email
+from db import DailyRollup, FarmerDetails, LandlordDetails, ShardDirectory, User
+from sharding import SHARD_ID_STRIDE, ShardRouter
+
+REGIONS = ["north", "south"]
+
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch, app_db):
+    """Two SQLite shards in a temporary directory, used by the API for the duration of a test."""
+    router = ShardRouter(REGIONS, url_template=f"sqlite:///{tmp_path}/shard_{{region}}.db")
+    router.init_shards()
+    monkeypatch.setattr(sharding, "shard_router", router)
+    monkeypatch.setattr(main, "shard_router", router)
+    return router
+
+
+def test_ids_encode_their_region_and_sequences_are_per_shard(shards):
+    north, south = shards.session("north"), shards.session("south")
+    try:
+        first = shards.allocate_id(north, "farmer", "north")
+        second = shards.allocate_id(north, "farmer", "north")
+        other = shards.allocate_id(south, "farmer", "south")
+        north.commit()
+        south.commit()
+    finally:
+        north.close()
+        south.close()
+
+    assert second == first + SHARD_ID_STRIDE
+    assert [shards.region_for_id(profile_id) for profile_id in (first, second, other)] == ["north", "north", "south"]
+    assert shards.region_for_id(len(REGIONS)) is None
+
+
+def test_registration_writes_the_profile_to_its_regional_shard_only(client, db, shards):
+    directory_before = db.query(ShardDirectory).count()
+
+    farmer = register(client, "farmer", preferred_locations="Kerala")
+    landlord = register(client, "landlord", location="Punjab")
+    farmer_id, landlord_id = farmer["farmer"]["id"], landlord["landlord"]["id"]
+    assert shards.region_for_id(farmer_id) == "south" and shards.region_for_id(landlord_id) == "north"
+
+    # Nothing but the user row lands in app.db: no profile, no directory entry
+    assert db.get(FarmerDetails, farmer_id) is None and db.get(LandlordDetails, landlord_id) is None
+    assert db.query(ShardDirectory).count() == directory_before
+
+    south = shards.session("south")
+    try:
+        assert south.get(FarmerDetails, farmer_id).user_id == farmer["id"]
+        # The capacity rollup is kept next to the profile in the same shard
+        capacity = south.query(func.sum(DailyRollup.value)).filter(DailyRollup.metric == "farmer_capacity").scalar()
+        assert capacity == 10
+    finally:
+        south.close()
+
+    response = client.get(f"/farmers/{farmer_id}", headers=auth_headers(farmer["id"], "farmer"))
+    assert response.status_code == 200 and response.json()["id"] == farmer_id
+
+
+def test_legacy_app_db_profiles_must_be_migrated_before_serving_sharded(client, db, shards):
+    legacy = User(email=unique_email("legacy"), password="secret", role="farmer")
+    db.add(legacy)
+    db.flush()
+    profile = FarmerDetails(user_id=legacy.id, land_handling_capacity=7, preferred_locations=["Kerala"])
+    db.add(profile)
+    db.commit()
+    profile_id = profile.id
+
+    # Reads only go to the shards, so starting would hide the profile still in app.db
+    with pytest.raises(RuntimeError, match="sharding.py migrate"):
+        with TestClient(main.app):
+            pass
+
+    moved = sharding.migrate_existing_profiles()
+    assert sum(moved.values()) >= 1
+    sharding.ensure_profiles_migrated()
+
+    # Once moved, the profile keeps its id and is served from its shard
+    headers = auth_headers(legacy.id, "farmer")
+    assert sharding.profile_id_for_user(db, "farmer", legacy.id) == profile_id
+    response = client.get(f"/farmers/{profile_id}", headers=headers)
+    assert response.status_code == 200 and response.json()["land_handling_capacity"] == 7
@@ -0,0 +1,69 @@
+"""Space updates: who may change a space, and the server-sent events its members receive."""
+import asyncio
+
+import pytest
+
+from conftest import auth_headers, register
+from db import Space
+from events import event_hub
+
+STEPS = [{"name": "Sowing"}, {"name": "Harvest"}]
+
+
+@pytest.fixture
+def space(client, db, admin_headers):
+    farmer = register(client, "farmer")
+    landlord = register(client, "landlord")
+    space = Space(farmer_id=farmer["farmer"]["id"], landlord_id=landlord["landlord"]["id"], admin_id=1, progress={})
+    db.add(space)
+    db.commit()
+    crop_id = client.post(
+        "/admin/create-crop",
+        json={"crop_name": "Mustard", "duration": "100 days", "steps": STEPS, "space_id": space.id},
+        headers=admin_headers,
+    ).json()["crop_id"]
+    return {
+        "id": space.id, "crop_id": crop_id,
+        "farmer_user_id": farmer["id"], "landlord": auth_headers(landlord["id"], "landlord"),
+    }
+
+
+def replay(channel: str, after_id: int) -> list:
+    """Events on `channel` published after `after_id`, read through the SSE stream's resume path."""
+    async def read():
+        stream = event_hub.stream([channel], last_event_id=after_id)
+        chunks = []
+        async for chunk in stream:
+            if chunk.startswith("retry:"):
+                break
+            chunks.append(chunk)
+        await stream.aclose()
+        return chunks
+    return asyncio.run(read())
+
+
+def test_outsiders_cannot_change_a_space_or_subscribe(client, space):
+    outsider = register(client, "farmer")
+    headers = auth_headers(outsider["id"], "farmer")
+    crop_id = space["crop_id"]
+
+    assert client.post(f"/crop/{crop_id}/step/0/status", json={"status": "completed"}, headers=headers).status_code == 403
+    upload = client.post(f"/crop/{crop_id}/step/0/upload-proof", files=[("files", ("a.jpg", b"x"))], headers=headers)
+    assert upload.status_code == 403
+    created = client.post("/admin/create-crop", json={"crop_name": "Gram", "duration": "1", "steps": STEPS, "space_id": space["id"]}, headers=headers)
+    assert created.status_code == 403
+    assert client.get(f"/spaces/{space['id']}/events", headers=headers).status_code == 403
+    assert client.post(f"/crop/{crop_id}/step/0/status", json={"status": "completed"}).status_code in (401, 403)
+
+
+def test_member_update_reaches_space_and_member_channels(client, space):
+    marker = event_hub.publish(["test:marker"], "marker", {})
+
+    response = client.post(f"/crop/{space['crop_id']}/step/0/status", json={"status": "completed"}, headers=space["landlord"])
+
+    assert response.status_code == 200
+    assert response.json()["progress"] == {"completed_steps": 1, "total_steps": 2}
+    events = replay(f"space:{space['id']}", marker)
+    assert len(events) == 1 and "event: progress" in events[0] and '"status": "completed"' in events[0]
+    # The farmer's user channel gets the same event
+    assert replay(f"user:{space['farmer_user_id']}", marker) == events
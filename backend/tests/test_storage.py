@@ -0,0 +1,88 @@
+"""Media storage backends: the sharded local layout, and S3 direct uploads against a local moto server."""
+import io
+import re
+
+import httpx
+import pytest
+
+from storage import LocalStorage, S3Storage, StorageError, key_from_url
+
+SHARDED_KEY = re.compile(r"^([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{28})_(.+)$")
+
+
+@pytest.fixture
+def local(tmp_path):
+    return LocalStorage(tmp_path / "media", tmp_path / "quarantine")
+
+
+def test_local_save_uses_hash_prefix_layout(local, tmp_path):
+    key = local.save("../../etc/field photo.jpg", io.BytesIO(b"paddy"))
+
+    match = SHARDED_KEY.match(key)
+    assert match and match.group(4) == "field photo.jpg"
+    assert (tmp_path / "media" / key).read_bytes() == b"paddy"
+    assert key_from_url(f"http://testserver{local.url(key)}") == key
+    assert [stored.key for stored in local.iter_objects()] == [key]
+
+
+def test_local_quarantine_and_delete(local, tmp_path):
+    key = local.save("proof.png", io.BytesIO(b"x"))
+
+    local.quarantine(key)
+    assert not (tmp_path / "media" / key).exists()
+    assert [stored.key for stored in local.iter_objects(quarantined=True)] == [key]
+
+    local.delete(key, quarantined=True)
+    assert list(local.iter_objects(quarantined=True)) == []
+
+
+def test_local_rejects_keys_outside_root_and_direct_uploads(local):
+    with pytest.raises(StorageError):
+        local.delete("../outside.txt")
+    with pytest.raises(StorageError):
+        local.presigned_upload("photo.jpg")
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    server_module = pytest.importorskip("moto.server")
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing", "AWS_SESSION_TOKEN": "testing",
+    }.items():
+        monkeypatch.setenv(name, value)
+    server = server_module.ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    try:
+        store = S3Storage(bucket="krishi-test-media", endpoint_url=f"http://{host}:{port}", region="us-east-1")
+        store.client.create_bucket(Bucket=store.bucket)
+        yield store
+    finally:
+        server.stop()
+
+
+def test_s3_presigned_upload_download_and_delete(s3):
+    presigned = s3.presigned_upload("crop.jpg", "image/jpeg")
+    assert SHARDED_KEY.match(presigned["key"])
+
+    # The client posts the file straight to the bucket, without going through the API
+    uploaded = httpx.post(
+        presigned["upload_url"], data=presigned["fields"], files={"file": ("crop.jpg", b"jpeg-bytes", "image/jpeg")}
+    )
+    assert uploaded.status_code in (200, 201, 204)
+
+    download = httpx.get(s3.download_url(presigned["key"]))
+    assert download.status_code == 200 and download.content == b"jpeg-bytes"
+    assert s3.url(presigned["key"]) == f"/storage/{presigned['key']}"
+    assert [stored.key for stored in s3.iter_objects()] == [presigned["key"]]
+
+    s3.delete(presigned["key"])
+    assert httpx.get(s3.download_url(presigned["key"])).status_code == 404
+
+
+def test_s3_save_and_quarantine(s3):
+    key = s3.save("proof.mp4", io.BytesIO(b"video"))
+
+    s3.quarantine(key)
+    assert list(s3.iter_objects()) == []
+    assert [stored.key for stored in s3.iter_objects(quarantined=True)] == [key]
@@ -0,0 +1,73 @@
+"""Delta sync: full sync, cursors, paging with `more`, tombstones and scoping."""
+from conftest import auth_headers, register
+from db import Crop, Space
+
+
+def sync(client, headers, since=None, limit=None) -> dict:
+    params = {key: value for key, value in (("since", since), ("limit", limit)) if value is not None}
+    response = client.get("/sync", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def rows(body: dict, table: str) -> list:
+    """Rows of `table` as dicts."""
+    table_changes = body["changes"].get(table)
+    if not table_changes:
+        return []
+    return [dict(zip(table_changes["columns"], row)) for row in table_changes["rows"]]
+
+
+def test_delta_sync_pages_changes_and_reports_deletes(client, db):
+    farmer = register(client, "farmer")
+    landlord = register(client, "landlord")
+    headers = auth_headers(farmer["id"], "farmer")
+    space = Space(farmer_id=farmer["farmer"]["id"], landlord_id=landlord["landlord"]["id"], admin_id=1, progress={})
+    db.add(space)
+    db.commit()
+
+    full = sync(client, headers)
+    assert [row["id"] for row in rows(full, "farmer_details")] == [farmer["farmer"]["id"]]
+    assert [row["id"] for row in rows(full, "spaces")] == [space.id]
+    assert "landlord_details" not in full["changes"] and full["more"] is False
+
+    # Nothing changed: an empty delta with the same cursor
+    unchanged = sync(client, headers, since=full["cursor"])
+    assert unchanged["changes"] == {} and unchanged["deleted"] == {} and unchanged["cursor"] == full["cursor"]
+
+    # Three crops in three commits, read one version per page
+    crop_ids = []
+    for name in ("Wheat", "Rice", "Maize"):
+        crop = Crop(crop_name=name, duration="90 days", space_id=space.id)
+        db.add(crop)
+        db.commit()
+        crop_ids.append(crop.id)
+
+    cursor, seen, pages = full["cursor"], [], 0
+    while True:
+        page = sync(client, headers, since=cursor, limit=1)
+        seen += [row["id"] for row in rows(page, "crops")]
+        cursor, pages = page["cursor"], pages + 1
+        if not page["more"]:
+            break
+    assert seen == crop_ids and pages == 3
+
+    # A deleted crop comes back as a tombstone, not as a change
+    db.delete(db.get(Crop, crop_ids[0]))
+    db.commit()
+    delta = sync(client, headers, since=cursor)
+    assert delta["deleted"] == {"crops": [crop_ids[0]]} and "crops" not in delta["changes"]
+
+    # Another farmer sees neither the crops nor the delete
+    other = register(client, "farmer")
+    other_delta = sync(client, auth_headers(other["id"], "farmer"), since=cursor)
+    assert other_delta["deleted"] == {} and "crops" not in other_delta["changes"]
+
+
+def test_bad_cursors_and_roles_are_rejected(client):
+    farmer = register(client, "farmer")
+    headers = auth_headers(farmer["id"], "farmer")
+    assert client.get("/sync", params={"since": "abc"}, headers=headers).status_code == 400
+    assert client.get("/sync", params={"since": "-1"}, headers=headers).status_code == 400
+    assert client.get("/sync", params={"since": "1.2.3"}, headers=headers).status_code == 400
+    assert client.get("/sync", headers=auth_headers(farmer["id"], "guest")).status_code == 403
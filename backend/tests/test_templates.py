@@ -0,0 +1,75 @@
+"""Crop template catalog: deduplication by plan and concurrent version allocation."""
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from db import SessionLocal, CropTemplate, engine
+from templates import template_catalog
+
+STEPS = [{"name": "Sowing", "description": "Plant the seeds."}, {"name": "Harvest", "description": "Cut the crop."}]
+
+
+def unique_crop_name() -> str:
+    return f"Crop-{uuid.uuid4().hex[:8]}"
+
+
+@contextmanager
+def version_added_concurrently(crop_name: str, steps):
+    """
+    Commit a template from another session right before the savepoint of the
+    next insert, i.e. after the request under test has read the latest version.
+    """
+    raced = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if raced or not statement.startswith("SAVEPOINT"):
+            return
+        raced.append(True)
+        other = SessionLocal()
+        try:
+            template_catalog.resolve(other, crop_name, "90 days", steps)
+            other.commit()
+        finally:
+            other.close()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    assert raced
+
+
+def test_same_plan_reuses_template_and_changed_plan_adds_version(db):
+    crop_name = unique_crop_name()
+    first = template_catalog.resolve(db, crop_name, "90 days", STEPS)
+    db.commit()
+
+    progress_only = [{**step, "status": "completed", "proof_count": 2} for step in STEPS]
+    assert template_catalog.resolve(db, crop_name, "90 days", progress_only)["id"] == first["id"]
+
+    changed = template_catalog.resolve(db, crop_name, "90 days", STEPS + [{"name": "Drying"}])
+    db.commit()
+    assert (first["version"], changed["version"]) == (1, 2)
+
+
+def test_concurrent_different_plan_gets_next_version(db):
+    crop_name = unique_crop_name()
+    with version_added_concurrently(crop_name, [{"name": "Other plan"}]):
+        template = template_catalog.resolve(db, crop_name, "90 days", STEPS)
+    db.commit()
+
+    versions = db.query(CropTemplate.version).filter(CropTemplate.crop_name == crop_name).order_by(CropTemplate.version).all()
+    assert template["version"] == 2
+    assert [version for version, in versions] == [1, 2]
+
+
+def test_concurrent_same_plan_is_reused(db):
+    crop_name = unique_crop_name()
+    with version_added_concurrently(crop_name, STEPS):
+        template = template_catalog.resolve(db, crop_name, "90 days", STEPS)
+    db.commit()
+
+    assert template["version"] == 1
+    assert db.query(CropTemplate).filter(CropTemplate.crop_name == crop_name).count() == 1
@@ -0,0 +1,85 @@
+"""Refresh token rotation: replayed and logged-out refresh tokens are rejected."""
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from conftest import register
+from db import RevokedToken
+from security import RevocationList, revocation_list, verify_token
+
+
+def login(client, email: str) -> dict:
+    response = client.post("/login", json={"email": email, "password": "secret"})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_rotation_rejects_a_replayed_refresh_token(client):
+    user = register(client, "farmer")
+    old = login(client, user["email"])["refresh_token"]
+
+    rotated = client.post("/refresh-token", params={"refresh_token": old})
+    assert rotated.status_code == 200
+    new = rotated.json()["refresh_token"]
+    assert new != old
+
+    replay = client.post("/refresh-token", params={"refresh_token": old})
+    assert replay.status_code == 401 and replay.json()["detail"] == "Refresh token has been revoked"
+
+    # The new refresh token carries the same claims and is itself usable once
+    assert verify_token(new)["id"] == user["id"]
+    assert client.post("/refresh-token", params={"refresh_token": new}).status_code == 200
+
+
+def test_logout_revokes_and_revocations_survive_a_reload(client, db):
+    user = register(client, "landlord")
+    token = login(client, user["email"])["refresh_token"]
+
+    assert client.post("/logout", params={"refresh_token": token}).status_code == 200
+    assert client.post("/refresh-token", params={"refresh_token": token}).status_code == 401
+
+    # Another worker (a fresh list) sees the revocation once it is synced to the database
+    revocation_list.sync(db)
+    other = RevocationList()
+    other.load(db)
+    assert other.is_revoked(verify_token(token)["jti"])
+
+
+def test_access_tokens_are_not_accepted_as_refresh_tokens(client):
+    user = register(client, "farmer")
+    access = login(client, user["email"])["access_token"]
+    assert client.post("/refresh-token", params={"refresh_token": access}).status_code == 401
+
+
+def test_sync_is_idempotent_across_workers(db):
+    expires_at = datetime.utcnow() + timedelta(days=1)
+    jti = uuid.uuid4().hex
+    first, second = RevocationList(), RevocationList()
+    first.revoke(jti, expires_at)
+    second.revoke(jti, expires_at)
+
+    first.sync(db)
+    # The same jti revoked by another worker is already stored; the second sync must not fail
+    second.sync(db)
+    assert second._pending == []
+    assert db.query(RevokedToken).filter(RevokedToken.jti == jti).count() == 1
+
+
+def test_failed_sync_keeps_pending_revocations(db, monkeypatch):
+    revocations = RevocationList()
+    jti = uuid.uuid4().hex
+    revocations.revoke(jti, datetime.utcnow() + timedelta(days=1))
+
+    def fail(*args, **kwargs):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(db, "execute", fail)
+    with pytest.raises(OperationalError):
+        revocations.sync(db)
+    assert [pending_jti for pending_jti, _ in revocations._pending] == [jti]
+
+    monkeypatch.undo()
+    revocations.sync(db)
+    assert revocations._pending == [] and db.get(RevokedToken, jti) is not None
@@ -1,15 +1,16 @@
 from db import User, FarmerDetails, LandlordDetails
+from repository import get_user_by_email
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional, List
 
 def validate_user_registration(db: Session, email: str) -> bool:
     """Check if the email is already registered."""
-    return db.query(User).filter(User.email == email).first() is not None
+    return get_user_by_email(db, email) is not None
 
 def validate_user_login(db: Session, email: str, password: str) -> bool:
     """Check if the user exists and password matches."""
-    user = db.query(User).filter(User.email == email).first()
+    user = get_user_by_email(db, email)
     return user and user.password == password
 
 
@@ -56,7 +57,7 @@ def validate_landlord_details(soil_type: str, acres: int, location: str, images:
 
 def is_admin(db: Session, email: str) -> bool:
     """Check if the user is an admin."""
-    user = db.query(User).filter(User.email == email).first()
+    user = get_user_by_email(db, email)
     return user and user.role == "admin"
 
 class LoginRequest(BaseModel):
@@ -0,0 +1,99 @@
+"""
+Row versions for delta sync.
+
+Every database that holds synced rows has a one-row `sync_clock`. A
+`before_flush` hook bumps the clock once per flush that inserts, updates or
+deletes synced rows. Every changed row in that flush is stamped with the new
+value in its `row_version` column. Each deleted row leaves a `SyncTombstone`
+that carries the same value and the profile ids of the row's owners.
+
+The clock is updated in the writing transaction, which holds SQLite's write
+lock, so versions become visible in commit order. A reader that has seen
+version N has seen every change up to N. Flushes that touch no synced rows
+(audit entries, rollups, revocations) do not bump the clock.
+
+sync.py serves the changes; this module only records them. Sessions opt out
+of tombstones with `session.info[SKIP_TOMBSTONES] = True` when rows only move
+between databases (the shard migration).
+"""
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import Session
+
+from db import SessionLocal, FarmerDetails, LandlordDetails, Space, Crop, CropTemplate, Proof, SyncClock, SyncTombstone
+
+VERSIONED_MODELS = (FarmerDetails, LandlordDetails, Space, Crop, Proof, CropTemplate)
+SKIP_TOMBSTONES = "sync_skip_tombstones"
+
+
+def next_version(connection) -> int:
+    """Bump and return the clock of the database behind `connection` (call inside the writing transaction)."""
+    clock = SyncClock.__table__
+    if connection.execute(clock.update().where(clock.c.id == 1).values(version=clock.c.version + 1)).rowcount == 0:
+        connection.execute(clock.insert().values(id=1, version=1))
+        return 1
+    return connection.execute(select(clock.c.version).where(clock.c.id == 1)).scalar_one()
+
+
+def current_version(connection) -> int:
+    return connection.execute(select(SyncClock.__table__.c.version).where(SyncClock.__table__.c.id == 1)).scalar() or 0
+
+
+def _owners(obj):
+    """`(farmer_id, landlord_id)` profile ids whose clients hold `obj`."""
+    if isinstance(obj, FarmerDetails):
+        return obj.id, None
+    if isinstance(obj, LandlordDetails):
+        return None, obj.id
+    if isinstance(obj, Proof):
+        obj = obj.crop
+    if isinstance(obj, Crop):
+        obj = obj.space if obj is not None else None
+    if isinstance(obj, Space):
+        return obj.farmer_id, obj.landlord_id
+    return None, None
+
+
+def _stamp_versions(session: Session, flush_context, instances) -> None:
+    changed = [obj for obj in session.new if isinstance(obj, VERSIONED_MODELS)]
+    changed += [
+        obj for obj in session.dirty
+        if isinstance(obj, VERSIONED_MODELS) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, VERSIONED_MODELS)]
+    if not changed and not deleted:
+        return
+
+    version = next_version(session.connection())
+    for obj in changed:
+        obj.row_version = version
+    if session.info.get(SKIP_TOMBSTONES):
+        return
+    for obj in deleted:
+        farmer_id, landlord_id = _owners(obj)
+        session.add(SyncTombstone(
+            table_name=obj.__tablename__, row_id=obj.id, row_version=version,
+            farmer_id=farmer_id, landlord_id=landlord_id,
+        ))
+
+
+def watch(session_factory) -> None:
+    """Stamp row versions on every session made by `session_factory`."""
+    event.listen(session_factory, "before_flush", _stamp_versions)
+
+
+def add_row_version_columns(bind, models) -> None:
+    """
+    Add `row_version` to tables created before delta sync (shards are not
+    migrated by alembic). Existing rows get version 0, which only a full sync returns.
+    """
+    existing = inspect(bind)
+    with bind.begin() as connection:
+        for model in models:
+            table = model.__tablename__
+            if "row_version" in {column["name"] for column in existing.get_columns(table)}:
+                continue
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN row_version INTEGER DEFAULT 0"))
+            connection.execute(text(f"CREATE INDEX ix_{table}_row_version ON {table} (row_version)"))
+
+
+watch(SessionLocal)
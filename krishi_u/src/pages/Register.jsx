@@ -62,90 +62,45 @@ const Register = () => {
         setSelectedFiles(Array.from(e.target.files));
     };
 
-    const handleUploadImages = async (token) => {
-        try {
-            const formData = new FormData();
-            selectedFiles.forEach(file => {
-                formData.append('files', file);
-            });
-
-            console.log('Files being uploaded:', selectedFiles);
-
-            const response = await axiosInstance.post('/upload/images', formData, {
-                headers: {
-                    'Authorization': `Bearer ${token}`,
-                    'Content-Type': 'multipart/form-data'
-                }
-            });
-
-            console.log('Upload response:', response.data);
-            console.log('Image URLs received:', response.data.image_urls);
-
-            return response.data.image_urls;
-        } catch (err) {
-            console.error('Image upload failed:', err);
-            setError('Failed to upload images. Please try again.');
-            return [];
-        }
-    };
-
     const handleRegister = async () => {
         setLoading(true);
         setError('');
         try {
-            const userResponse = await axiosInstance.post('/register', {
-                email: formData.email,
-                password: formData.password,
-                role: formData.role
-            });
-
-            console.log('User registration response:', userResponse.data);
-
-            if (!userResponse.data.id) {
-                throw new Error('User ID not received from registration');
-            }
+            // User, role details and images are registered together in one request
+            const registrationData = new FormData();
+            registrationData.append('email', formData.email);
+            registrationData.append('password', formData.password);
+            registrationData.append('role', formData.role);
 
             if (formData.role === 'farmer') {
-                const farmerData = {
-                    user_id: userResponse.data.id,
-                    phone_number: formData.phone_number,
-                    land_handling_capacity: Number(formData.land_handling_capacity),
-                    preferred_locations: formData.preferred_locations.split(',').map(loc => loc.trim())
-                };
-                
-                await axiosInstance.post('/farmer/register', farmerData, {
-                    headers: { Authorization: `Bearer ${userResponse.data.token}` }
-                });
+                registrationData.append('phone_number', formData.phone_number);
+                registrationData.append('land_handling_capacity', Number(formData.land_handling_capacity));
+                registrationData.append('preferred_locations', formData.preferred_locations);
             } else if (formData.role === 'landlord') {
-                let imageUrls = [];
-                if (selectedFiles.length > 0) {
-                    imageUrls = await handleUploadImages(userResponse.data.token);
-                }
-                
-                const landlordData = {
-                    user_id: userResponse.data.id,
-                    phone_number: formData.phone_number,
-                    soil_type: formData.soil_type,
-                    acres: Number(formData.acres),
-                    location: formData.location,
-                    images: imageUrls
-                };
-                
-                await axiosInstance.post('/landlord/register', landlordData, {
-                    headers: { 
-                        Authorization: `Bearer ${userResponse.data.token}`,
-                        'Content-Type': 'application/json'
-                    },
+                registrationData.append('phone_number', formData.phone_number);
+                registrationData.append('soil_type', formData.soil_type);
+                registrationData.append('acres', Number(formData.acres));
+                registrationData.append('location', formData.location);
+                selectedFiles.forEach(file => {
+                    registrationData.append('files', file);
                 });
             }
 
+            const response = await axiosInstance.post('/register/complete', registrationData, {
+                headers: { 'Content-Type': 'multipart/form-data' }
+            });
+
+            console.log('Registration response:', response.data);
+
             setSuccess('Registration successful!');
             navigate('/login');
             
         } catch (err) {
             console.error('Registration error:', err);
             setLoading(false);
-            setError(err.message || 'Registration failed. Please try again.');
+            setError(err.response?.data?.detail && typeof err.response.data.detail === 'string'
+                ? err.response.data.detail
+                : err.message || 'Registration failed. Please try again.');
         }
     };
 